@@ -0,0 +1,401 @@
+"""
+Run the real dispatcher end to end against local fakes.
+
+Usage:
+    python -m benchmarks.bench_e2e [--text 200] [--search 100] [--photo 30]
+    python -m benchmarks.bench_e2e --max-p99 5000 --min-rate 20 --max-lag 200
+
+Handlers from ``handlers.setup_handlers()`` run with the services the bot
+creates, but every external call stays on this machine: a fake Bot API
+delivers updates through long polling, a fake Groq server answers chat
+completions (streamed or whole) after ``--groq-latency`` from its own
+thread, and searches go to a stub DDGS session that blocks its worker
+thread for ``--search-latency``. A shuffled burst of text, search (text
+ending with "?") and photo updates is pushed at once after a short warm-up.
+
+The benchmark reports updates per second, p50/p95/p99 handler latency per
+kind and event loop lag. With thresholds given it exits with status 1 when
+any of them is missed or any update got an error reply, so it can gate
+changes in CI without network access.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.types import Update
+
+from benchmarks.bench_image_pool import make_photos
+from benchmarks.fakes import BackgroundLoop, FakeBotAPI, FakeGroqServer, StubDDGS
+from keyboards.main_keyboard import get_main_keyboard
+from bot_main import close_services, create_bot, create_dispatcher, create_send_queue, create_services, run_polling
+from config import Config
+
+
+KINDS = ("text", "search", "photo", "command")
+
+BUTTONS = {button.text for row in get_main_keyboard().keyboard for button in row}
+
+# Replies the handlers send instead of an answer
+ERROR_PREFIXES = ("Произошла ошибка", "Ошибка:", "Не удалось получить результаты поиска")
+
+
+def classify(update: Update) -> str:
+    """Get the handler kind an update is routed to."""
+    message = update.message
+    if message is not None and message.photo:
+        return "photo"
+    text = message.text if message is not None else None
+    if text and (text.startswith("/") or text in BUTTONS):
+        return "command"
+    if text and text.strip().endswith("?"):
+        return "search"
+    return "text"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Get a percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def loop_lag(interval: float, stop: asyncio.Event, lags: List[float]) -> None:
+    """Record how late the event loop wakes up a sleeping coroutine."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+class HandlerTimer:
+    """Outer update middleware timing every update by handler kind."""
+
+    def __init__(self):
+        """Initialize timer."""
+        self.latencies: Dict[str, List[float]] = {kind: [] for kind in KINDS}
+        self.done = 0
+        self.expected = 0
+        self.finished = asyncio.Event()
+
+    def expect(self, count: int) -> None:
+        """Start waiting for ``count`` more updates."""
+        self.expected = self.done + count
+        self.finished.clear()
+        if self.done >= self.expected:
+            self.finished.set()
+
+    def reset(self) -> None:
+        """Forget recorded latencies."""
+        for values in self.latencies.values():
+            values.clear()
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Time an update from dispatch to the end of its handler."""
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.latencies[classify(event)].append(time.perf_counter() - started)
+            self.done += 1
+            if self.done >= self.expected:
+                self.finished.set()
+
+
+class Harness:
+    """
+    The bot as ``bot_main`` builds it, wired to local fakes.
+
+    Updates pushed through ``fake`` are received by long polling and timed
+    by handler kind from ``measure`` on.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        Initialize harness.
+
+        Args:
+            args: Options added by ``add_fake_arguments``
+        """
+        self.args = args
+        self.fake = FakeBotAPI(latency=args.api_latency)
+        self.groq = FakeGroqServer(
+            latency=args.groq_latency,
+            token_delay=args.token_delay,
+            tokens=args.tokens
+        )
+        self.timer = HandlerTimer()
+        self._groq_loop: Optional[BackgroundLoop] = None
+        self._upload_dir: Optional[tempfile.TemporaryDirectory] = None
+        self._services: Dict[str, Any] = {}
+        self._lags: List[float] = []
+        self._stop_ticker = asyncio.Event()
+        self._ticker: Optional[asyncio.Task] = None
+        self._sent_before = 0
+        self._started = 0.0
+
+    async def start(self) -> None:
+        """Start the fakes and the bot, then warm it up."""
+        args = self.args
+        await self.fake.start()
+        # Streaming answers costs the fake server real CPU, keep it off the bot's loop
+        self._groq_loop = BackgroundLoop()
+        await self._groq_loop.run(self.groq.start())
+
+        self._upload_dir = tempfile.TemporaryDirectory()
+        config = Config(
+            telegram_token="123456:fake",
+            groq_api_key="fake",
+            upload_directory=Path(self._upload_dir.name),
+            telegram_api_url=self.fake.url,
+            groq_base_url=self.groq.url,
+            groq_requests_per_minute=self.groq.requests_per_minute,
+            groq_tokens_per_minute=self.groq.tokens_per_minute,
+            stream_responses=not args.no_stream,
+            send_queue_enabled=not args.no_send_queue,
+            search_workers=args.search_workers,
+            search_queue_size=10_000,
+        )
+        self.send_queue = create_send_queue(config)
+        self.bot = create_bot(config, self.send_queue)
+        self._services = await create_services(config)
+        self._services["search_pool"].session_factory = functools.partial(
+            StubDDGS, latency=args.search_latency
+        )
+        self.dp = create_dispatcher(self._services, config)
+        self.dp.update.outer_middleware(self.timer)
+
+        self._polling = asyncio.create_task(run_polling(self.dp, self.bot))
+        await self.fake.wait_for("getUpdates", 1, timeout=10)
+
+        # Warm up connections, worker threads and processes
+        self.timer.expect(args.warmup)
+        # One chat each, so per-chat flood limits do not stretch the warm-up
+        for n in range(args.warmup):
+            self.fake.push(self.fake.message_update(1 + n, f"Разогрев {n}"))
+        await asyncio.wait_for(self.timer.finished.wait(), args.timeout)
+
+    def measure(self) -> None:
+        """Start measuring: forget the warm-up and start the loop lag ticker."""
+        self.timer.reset()
+        self._sent_before = len(self.fake.sent)
+        self._ticker = asyncio.create_task(loop_lag(0.01, self._stop_ticker, self._lags))
+        self._started = time.perf_counter()
+
+    async def drain(self, count: int) -> Dict[str, Any]:
+        """
+        Wait until ``count`` updates pushed since ``measure`` are handled.
+
+        Returns:
+            Measured results
+        """
+        self.timer.expect(count - sum(map(len, self.timer.latencies.values())))
+        await asyncio.wait_for(self.timer.finished.wait(), self.args.timeout)
+        elapsed = time.perf_counter() - self._started
+
+        self._stop_ticker.set()
+        await self._ticker
+        lags = sorted(self._lags)
+
+        errors = sum(
+            message["text"].startswith(ERROR_PREFIXES)
+            for message in self.fake.sent[self._sent_before:]
+        )
+        results: Dict[str, Any] = {
+            "updates": count,
+            "elapsed": elapsed,
+            "rate": count / elapsed,
+            "errors": errors,
+            "api_calls": sum(self.fake.calls.values()),
+            "groq_requests": sum(self.groq.requests.values()),
+            "loop_lag_p99_ms": percentile(lags, 0.99) * 1000,
+            "loop_lag_max_ms": (lags[-1] if lags else 0.0) * 1000,
+            "handlers": {},
+        }
+        if self.send_queue is not None:
+            results["send_coalesced"] = self.send_queue.stats["coalesced"]
+            results["send_flood_waits"] = self.send_queue.stats["flood_waits"]
+        for kind, values in self.timer.latencies.items():
+            values.sort()
+            if not values:
+                continue
+            results["handlers"][kind] = {
+                "count": len(values),
+                "p50_ms": statistics.median(values) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+        return results
+
+    async def close(self) -> None:
+        """Stop the bot and the fakes."""
+        await self.dp.stop_polling()
+        try:
+            await self._polling
+        except asyncio.CancelledError:
+            pass
+        await close_services(self._services)
+        if self.send_queue is not None:
+            self.send_queue.close()
+        await self.bot.session.close()
+        if self._groq_loop is not None:
+            await self._groq_loop.run(self.groq.close())
+            self._groq_loop.close()
+        await self.fake.close()
+        if self._upload_dir is not None:
+            self._upload_dir.cleanup()
+
+
+def make_updates(fake: FakeBotAPI, args: argparse.Namespace, photos: List[bytes]) -> List[Dict[str, Any]]:
+    """Build a shuffled burst of updates from ``args.users`` senders."""
+    rng = random.Random(args.seed)
+    kinds = ["text"] * args.text + ["search"] * args.search + ["photo"] * args.photo
+    rng.shuffle(kinds)
+
+    updates = []
+    for n, kind in enumerate(kinds):
+        user_id = 1000 + rng.randrange(args.users)
+        if kind == "photo":
+            photo = photos[n % len(photos)]
+            updates.append(fake.photo_update(user_id, photo, (args.photo_width, args.photo_height)))
+        elif kind == "search":
+            updates.append(fake.message_update(user_id, f"Что нового о теме {n}?"))
+        else:
+            updates.append(fake.message_update(user_id, f"Объясни тему {n} кратко"))
+    return updates
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Push a burst of updates through the bot.
+
+    Returns:
+        Measured results
+    """
+    harness = Harness(args)
+    await harness.start()
+    try:
+        photos = make_photos(min(args.photo, 4) or 1, (args.photo_width, args.photo_height))
+        updates = make_updates(harness.fake, args, photos)
+
+        harness.measure()
+        for update in updates:
+            harness.fake.push(update)
+        return await harness.drain(len(updates))
+    finally:
+        await harness.close()
+
+
+def report(results: Dict[str, Any]) -> None:
+    """Print measured results."""
+    print(
+        f"{results['updates']} updates in {results['elapsed']:.2f}s: "
+        f"{results['rate']:.1f} updates/s, {results['errors']} error replies, "
+        f"{results['api_calls']} Bot API calls, {results['groq_requests']} Groq requests"
+    )
+    for kind, stats in results["handlers"].items():
+        print(
+            f"{kind:>8}: {stats['count']:5d} updates, p50 {stats['p50_ms']:7.0f} ms "
+            f"p95 {stats['p95_ms']:7.0f} ms p99 {stats['p99_ms']:7.0f} ms"
+        )
+    print(
+        f"loop lag: p99 {results['loop_lag_p99_ms']:.1f} ms, "
+        f"max {results['loop_lag_max_ms']:.1f} ms"
+    )
+    if "send_coalesced" in results:
+        print(
+            f"send queue: {results['send_coalesced']} edits coalesced, "
+            f"{results['send_flood_waits']} flood waits"
+        )
+
+
+def check(results: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """
+    Compare results with the thresholds given on the command line.
+
+    Returns:
+        Descriptions of missed thresholds
+    """
+    failures = []
+    if results["errors"]:
+        failures.append(f"{results['errors']} updates got an error reply")
+    if args.min_rate is not None and results["rate"] < args.min_rate:
+        failures.append(f"{results['rate']:.1f} updates/s is below {args.min_rate}")
+    if args.max_p99 is not None:
+        for kind, stats in results["handlers"].items():
+            if stats["p99_ms"] > args.max_p99:
+                failures.append(f"{kind} p99 {stats['p99_ms']:.0f} ms is above {args.max_p99} ms")
+    if args.max_lag is not None and results["loop_lag_max_ms"] > args.max_lag:
+        failures.append(f"loop lag {results['loop_lag_max_ms']:.0f} ms is above {args.max_lag} ms")
+    return failures
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add options of the fakes, the bot and the regression thresholds."""
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--groq-latency", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--search-workers", type=int, default=3)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--no-stream", action="store_true", help="Send whole responses")
+    parser.add_argument(
+        "--no-send-queue", action="store_true", help="Send Bot API calls without the send queue"
+    )
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", type=Path, help="Write results to this file")
+    parser.add_argument("--min-rate", type=float, help="Fail below this many updates/s")
+    parser.add_argument("--max-p99", type=float, help="Fail if any handler p99 exceeds this (ms)")
+    parser.add_argument("--max-lag", type=float, help="Fail if loop lag exceeds this (ms)")
+
+
+def finish(results: Dict[str, Any], args: argparse.Namespace) -> None:
+    """Report results, save them if asked and exit with the gate status."""
+    report(results)
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    failures = check(results, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--text", type=int, default=200)
+    parser.add_argument("--search", type=int, default=100)
+    parser.add_argument("--photo", type=int, default=30)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--photo-width", type=int, default=1600)
+    parser.add_argument("--photo-height", type=int, default=1200)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    print(
+        f"{args.text} text, {args.search} search and {args.photo} photo updates from "
+        f"{args.users} users, Groq {args.groq_latency * 1000:.0f} ms + "
+        f"{args.tokens} x {args.token_delay * 1000:.0f} ms, "
+        f"search {args.search_latency * 1000:.0f} ms"
+    )
+    finish(asyncio.run(run(args)), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare inline and pooled image compression throughput.
+
+Usage:
+    python -m benchmarks.bench_image_pool [--photos 32] [--workers 4]
+
+Each run compresses the same synthetic photos concurrently while a ticker
+coroutine measures how long the event loop is blocked.
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+from typing import List, Tuple
+
+from PIL import Image
+
+from utils.worker_pool import WorkerPool
+from utils.image_processor import compress_image
+
+
+MAX_BYTES = 750_000
+MAX_RESOLUTION = (1024, 1024)
+
+
+def make_photos(count: int, size: Tuple[int, int]) -> List[bytes]:
+    """
+    Generate noisy JPEG photos that exceed the compression threshold.
+    
+    Args:
+        count: Number of photos
+        size: Resolution of each photo
+        
+    Returns:
+        Encoded photos
+    """
+    photos = []
+    for _ in range(count):
+        # Low-entropy noise upscaled so the JPEG looks like a real photo
+        small = (size[0] // 8, size[1] // 8)
+        noise = Image.frombytes("RGB", small, os.urandom(small[0] * small[1] * 3))
+        img = noise.resize(size, Image.BICUBIC)
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=95)
+        photos.append(output.getvalue())
+    return photos
+
+
+async def _ticker(interval: float, stop: asyncio.Event, lags: List[float]) -> None:
+    """Record how late the event loop wakes up a sleeping coroutine."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run(kind: str, photos: List[bytes], workers: int) -> None:
+    """
+    Compress all photos concurrently with one pool kind and print results.
+    
+    Args:
+        kind: Pool kind (process, thread or inline)
+        photos: Encoded photos
+        workers: Number of pool workers
+    """
+    pool = WorkerPool(kind=kind, max_workers=workers, max_queue=len(photos), name="image")
+    
+    # Warm up workers so process start-up is not measured
+    await asyncio.gather(*[
+        pool.run(compress_image, photos[0], MAX_BYTES, MAX_RESOLUTION)
+        for _ in range(workers)
+    ])
+    
+    stop = asyncio.Event()
+    lags: List[float] = []
+    ticker = asyncio.create_task(_ticker(0.01, stop, lags))
+    
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        pool.run(compress_image, photo, MAX_BYTES, MAX_RESOLUTION)
+        for photo in photos
+    ])
+    elapsed = time.perf_counter() - started
+    
+    stop.set()
+    await ticker
+    pool.close()
+    
+    print(
+        f"{kind:>8}: {len(photos) / elapsed:7.2f} photos/s, "
+        f"max loop lag {max(lags, default=0) * 1000:8.1f} ms"
+    )
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--photos", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+    
+    photos = make_photos(args.photos, (args.width, args.height))
+    print(
+        f"{args.photos} photos of {args.width}x{args.height}, "
+        f"avg {sum(map(len, photos)) // len(photos)} bytes, {args.workers} workers"
+    )
+    
+    for kind in WorkerPool.KINDS[::-1]:
+        asyncio.run(run(kind, photos, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Measure how much logging stalls the event loop.
+
+Usage:
+    python -m benchmarks.bench_logging [--records 20000] [--disk-latency 0.0005]
+
+Concurrent coroutines log INFO lines while a ticker measures how late the
+event loop wakes it up. The direct setup writes from the calling thread
+like the old ``logging.basicConfig`` configuration; the queue setups only
+enqueue records and leave formatting and writing to the listener thread.
+``--disk-latency`` adds a sleep to every file flush to simulate a slow or
+busy disk.
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from utils.logging_setup import TEXT_FORMAT, setup_logging
+from utils.tracing import CorrelationFilter
+
+
+def setup_direct(log_file: Path) -> None:
+    """Configure handlers that write on the calling thread."""
+    handlers = [logging.StreamHandler(sys.stdout), logging.FileHandler(log_file)]
+    for handler in handlers:
+        handler.addFilter(CorrelationFilter())
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def reset_logging() -> None:
+    """Close and remove all root handlers."""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+async def workload(records: int, writers: int) -> dict:
+    """
+    Log from concurrent coroutines while measuring loop lag.
+
+    Args:
+        records: Total number of records
+        writers: Number of logging coroutines
+
+    Returns:
+        Time in logging calls and loop lag samples in seconds
+    """
+    loop = asyncio.get_running_loop()
+    log = logging.getLogger("bench.handler")
+    lags = []
+    in_logging = 0.0
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        while not done.is_set():
+            due = loop.time() + 0.001
+            await asyncio.sleep(0.001)
+            lags.append(max(0.0, loop.time() - due))
+
+    async def writer(index: int) -> None:
+        nonlocal in_logging
+        for n in range(records // writers):
+            started = time.perf_counter()
+            log.info("Message from user %s: %s", index, f"update {n} " + "x" * 80)
+            in_logging += time.perf_counter() - started
+            await asyncio.sleep(0)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.gather(*(writer(i) for i in range(writers)))
+    done.set()
+    await tick
+    return {"in_logging": in_logging, "lags": lags}
+
+
+def report(name: str, records: int, elapsed: float, result: dict, drain: float) -> str:
+    """Format results of one setup."""
+    lags = sorted(result["lags"]) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    return (
+        f"{name:>14}: {records / elapsed:8.0f} records/s, "
+        f"{result['in_logging'] / records * 1e6:6.1f} us/record in log calls, "
+        f"loop lag p50 {statistics.median(lags) * 1000:6.2f} ms "
+        f"p99 {p99 * 1000:6.2f} ms max {lags[-1] * 1000:7.2f} ms, "
+        f"drain {drain * 1000:6.0f} ms"
+    )
+
+
+def run(name: str, records: int, writers: int, directory: Path) -> str:
+    """
+    Run the workload with one logging setup.
+
+    Args:
+        name: direct, queue, queue+json or queue+sampled
+        records: Total number of records
+        writers: Number of logging coroutines
+        directory: Directory for log files
+
+    Returns:
+        Result line
+    """
+    log_file = directory / f"{name}.log"
+    listener = None
+    if name == "direct":
+        setup_direct(log_file)
+    else:
+        listener = setup_logging(
+            log_file=log_file,
+            json_format=name == "queue+json",
+            sampling={"bench.handler": 0.1} if name == "queue+sampled" else None,
+        )
+
+    started = time.perf_counter()
+    result = asyncio.run(workload(records, writers))
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if listener is not None:
+        listener.stop()
+    drain = time.perf_counter() - started
+    reset_logging()
+    return report(name, records, elapsed, result, drain)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--disk-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.disk_latency:
+        flush = logging.StreamHandler.flush
+
+        def slow_flush(handler: logging.StreamHandler) -> None:
+            flush(handler)
+            if isinstance(handler, logging.FileHandler):
+                time.sleep(args.disk_latency)
+
+        logging.StreamHandler.flush = slow_flush
+
+    print(
+        f"{args.records} records from {args.writers} coroutines, "
+        f"{args.disk_latency * 1000:.1f} ms per file flush"
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        # Console output goes nowhere so only the file handler is measured
+        with contextlib.redirect_stdout(devnull):
+            for name in ("direct", "queue", "queue+json", "queue+sampled"):
+                results.append(run(name, args.records, args.writers, Path(directory)))
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Measure search result enrichment with page text against a local web server.
+
+Usage:
+    python -m benchmarks.bench_page_fetch [--queries 50] [--pages 3] [--deadline 1.0]
+
+A local web server holds article-like HTML pages (navigation, scripts and
+footers around the text) answering after 50-400 ms, a few slow ones that
+miss the deadline and a few multi-megabyte ones that hit the byte cap.
+Every query enriches its top results; all queries run at once and share
+pages, as popular questions do. The benchmark then repeats the queries
+with a warm cache and once more after the cache has expired, when pages
+are revalidated with ETags. For each round it reports latency per query,
+pages used and dropped, and what the web server had to send.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeWebServer
+from services.page_fetcher import PageFetcher
+from utils.worker_pool import WorkerPool
+
+
+PARAGRAPH = (
+    "Аналитики отмечают, что изменения затронули несколько ключевых показателей, "
+    "а итоговые данные будут опубликованы позже. Эксперты советуют следить за "
+    "официальными источниками и сравнивать оценки разных организаций. "
+)
+
+
+def make_page(rng: random.Random, paragraphs: int, padding: int = 0) -> bytes:
+    """Build an article page surrounded by page furniture."""
+    nav = "".join(f'<li><a href="/s{i}">Раздел {i}</a></li>' for i in range(30))
+    text = "".join(f"<p>{PARAGRAPH * rng.randint(1, 3)}</p>" for _ in range(paragraphs))
+    script = "<script>var data = " + "[1,2,3]," * 200 + "0;</script>"
+    filler = f"<!-- {'x' * padding} -->" if padding else ""
+    return (
+        "<html><head><meta charset='utf-8'><title>Статья</title>"
+        f"<style>body{{margin:0}}</style>{script}</head><body>"
+        f"<header><nav><ul>{nav}</ul></nav></header>"
+        f"<article><h1>Заголовок статьи</h1>{text}</article>"
+        f"<aside>Реклама и ссылки</aside><footer>© Сайт, все права защищены</footer>"
+        f"{filler}</body></html>"
+    ).encode("utf-8")
+
+
+async def run_round(
+    fetcher: PageFetcher,
+    queries: List[List[Dict[str, Any]]]
+) -> Dict[str, float]:
+    """Enrich all queries at once and measure them."""
+    latencies = []
+    enriched_pages = 0
+
+    async def one(results: List[Dict[str, Any]]) -> None:
+        nonlocal enriched_pages
+        started = time.perf_counter()
+        enriched = await fetcher.enrich(results)
+        latencies.append(time.perf_counter() - started)
+        enriched_pages += sum(len(e["body"]) > len(r["body"]) for e, r in zip(enriched, results))
+
+    late_before = fetcher.stats["late"]
+    await asyncio.gather(*(one(results) for results in queries))
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "max": latencies[-1],
+        "enriched": enriched_pages,
+        "late": fetcher.stats["late"] - late_before,
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Run all rounds and print results."""
+    rng = random.Random(args.seed)
+    server = FakeWebServer(max_age=3600)
+    await server.start()
+
+    links = []
+    for n in range(args.sites):
+        # Every tenth site is slow and every tenth is huge
+        if n % 10 == 3:
+            links.append(server.add_page(f"slow{n}", make_page(rng, 8), delay=args.deadline * 3))
+        elif n % 10 == 7:
+            links.append(server.add_page(f"big{n}", make_page(rng, 8, padding=4 * 1024 * 1024), delay=0.05))
+        else:
+            links.append(server.add_page(f"page{n}", make_page(rng, rng.randint(3, 12)), delay=rng.uniform(0.05, 0.4)))
+
+    queries = []
+    for _ in range(args.queries):
+        picked = rng.sample(links, args.pages + 2)
+        queries.append([
+            {"number": i + 1, "title": f"Результат {i}", "link": link, "body": "Короткий сниппет."}
+            for i, link in enumerate(picked)
+        ])
+
+    pool = WorkerPool(kind=args.pool, max_workers=args.workers, max_queue=1000, name="page")
+    fetcher = PageFetcher(
+        pool,
+        max_pages=args.pages,
+        deadline=args.deadline,
+        max_bytes=args.max_bytes,
+        cache_ttl=args.ttl,
+    )
+
+    print(
+        f"{args.queries} queries over {args.sites} sites, top {args.pages} pages each, "
+        f"deadline {args.deadline:.1f}s, byte cap {args.max_bytes // 1024} KiB, {args.pool} pool"
+    )
+    for name in ("cold", "warm", "revalidate"):
+        if name == "revalidate":
+            # Let every cached page expire
+            await asyncio.sleep(args.ttl + 0.1)
+        requests_before = sum(server.requests.values())
+        not_modified_before = server.not_modified
+        bytes_before = server.bytes_sent
+        result = await run_round(fetcher, queries)
+        # Late pages keep loading in the background; let them land before the next round
+        await asyncio.sleep(args.deadline * 3)
+        print(
+            f"{name:>10}: p50 {result['p50'] * 1000:6.0f} ms max {result['max'] * 1000:6.0f} ms, "
+            f"{result['enriched']:4d} pages used, {result['late']:3d} dropped late, "
+            f"{sum(server.requests.values()) - requests_before:4d} requests "
+            f"({server.not_modified - not_modified_before} not modified), "
+            f"{(server.bytes_sent - bytes_before) / 1024 / 1024:6.1f} MiB sent"
+        )
+
+    print(
+        f"fetched {fetcher.stats['fetched']}, truncated {fetcher.stats['truncated']}, "
+        f"failed {fetcher.stats['failed']}, coalesced {fetcher.flights.coalesced}"
+    )
+    await fetcher.close()
+    pool.close()
+    await server.close()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--sites", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--max-bytes", type=int, default=512 * 1024)
+    parser.add_argument("--ttl", type=float, default=10.0)
+    parser.add_argument("--pool", default="process", choices=WorkerPool.KINDS)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Measure search context compaction on synthetic search results.
+
+Usage:
+    python -m benchmarks.bench_search_context [--results 10] [--budget 1200] [--runs 200]
+
+Each query gets results like DDGS returns them: relevant snippets that
+mention the query terms in different word forms, off-topic snippets, and
+near-duplicates of relevant ones (syndicated copies with a few words
+changed, sometimes on the same link). The benchmark reports the prompt
+tokens of the search context before and after compaction, how many
+duplicates survive, how many relevant results are kept, and the time per
+compaction.
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from utils.search_context import SearchContextCompactor, format_result
+from utils.tokens import estimate_tokens
+
+
+TOPICS = [
+    ("курс биткоина", ["биткоин", "биткоина", "курс", "курсе", "криптовалюты", "биржах"]),
+    ("погода в москве", ["погода", "погоды", "москве", "москва", "осадки", "температура"]),
+    ("python asyncio", ["python", "asyncio", "корутины", "event", "loop", "задачи"]),
+    ("выборы в сша", ["выборы", "выборов", "сша", "кандидаты", "голосование", "штатах"]),
+]
+
+FILLER = (
+    "сегодня эксперты отметили что ситуация остается сложной и требует внимания "
+    "аналитики ожидают изменений в ближайшее время по данным источников рынок "
+    "отреагировал сдержанно подробности в материале редакции"
+).split()
+
+
+def sentence(rng: random.Random, words: List[str], length: int) -> str:
+    """Build a sentence mixing topic words into filler."""
+    picked = [rng.choice(words) if rng.random() < 0.3 else rng.choice(FILLER) for _ in range(length)]
+    return " ".join(picked).capitalize() + "."
+
+
+def make_results(rng: random.Random, count: int) -> Tuple[str, List[Dict[str, Any]], set]:
+    """
+    Generate results for a random topic.
+
+    Returns:
+        Query, results and links of the relevant results
+    """
+    query, words = rng.choice(TOPICS)
+    other_words = rng.choice([t for t in TOPICS if t[0] != query])[1]
+
+    results: List[Dict[str, Any]] = []
+    relevant = set()
+    while len(results) < count:
+        n = len(results)
+        kind = rng.random()
+        if kind < 0.25 and relevant:
+            # Syndicated copy of a relevant result with a few words changed
+            source = rng.choice([r for r in results if r["link"] in relevant])
+            body = source["body"].split()
+            for _ in range(max(1, len(body) // 20)):
+                body[rng.randrange(len(body))] = rng.choice(FILLER)
+            link = source["link"] if rng.random() < 0.3 else f"https://mirror{n}.example.com/a"
+            results.append({"title": source["title"], "link": link, "body": " ".join(body)})
+        elif kind < 0.45:
+            body = " ".join(sentence(rng, other_words, 14) for _ in range(4))
+            results.append({"title": sentence(rng, other_words, 6), "link": f"https://other{n}.example.com", "body": body})
+        else:
+            body = " ".join(sentence(rng, words, 14) for _ in range(rng.randint(3, 6)))
+            link = f"https://site{n}.example.com/news"
+            results.append({"title": sentence(rng, words, 6), "link": link, "body": body})
+            relevant.add(link)
+
+    for number, result in enumerate(results, 1):
+        result["number"] = number
+    return query, results, relevant
+
+
+def context_tokens(results: List[Dict[str, Any]]) -> int:
+    """Estimate prompt tokens of formatted results."""
+    return estimate_tokens("\n\n".join(format_result(r) for r in results))
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--results", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=1200)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    compactor = SearchContextCompactor(max_tokens=args.budget, dedup_threshold=args.threshold)
+
+    before, after, durations = [], [], []
+    duplicates_before = duplicates_after = 0
+    relevant_total = relevant_kept = kept_total = 0
+    for _ in range(args.runs):
+        query, results, relevant = make_results(rng, args.results)
+        started = time.perf_counter()
+        compacted = compactor.compact(query, results)
+        durations.append(time.perf_counter() - started)
+
+        before.append(context_tokens(results))
+        after.append(context_tokens(compacted))
+        titles = [r["title"] for r in results]
+        duplicates_before += len(titles) - len(set(titles))
+        kept_titles = [r["title"] for r in compacted]
+        duplicates_after += len(kept_titles) - len(set(kept_titles))
+
+        unique_relevant = {r["title"] for r in results if r["link"] in relevant}
+        relevant_total += len(unique_relevant)
+        relevant_kept += len(unique_relevant & set(kept_titles))
+        kept_total += len(set(kept_titles))
+
+    print(
+        f"{args.runs} queries, {args.results} results each, budget {args.budget} tokens, "
+        f"dedup threshold {args.threshold}"
+    )
+    print(
+        f"context tokens: {statistics.mean(before):7.0f} -> {statistics.mean(after):7.0f} on average, "
+        f"max {max(after)}"
+    )
+    print(f"duplicate results: {duplicates_before} -> {duplicates_after}")
+    print(
+        f"relevant results kept: {relevant_kept} of {relevant_total}, "
+        f"{relevant_kept / max(1, kept_total):.0%} of kept results are relevant"
+    )
+    print(f"compaction time: {statistics.mean(durations) * 1000:.2f} ms average, {max(durations) * 1000:.2f} ms max")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare reply delivery with and without the outbound send queue.
+
+Usage:
+    python -m benchmarks.bench_send_queue [--users 60] [--chunks 3] [--edits 8]
+
+A fake Bot API enforces Telegram-like flood limits (``--global-rate``
+calls per second in total, ``--chat-rate`` per chat) and answers excess
+calls with 429. Every user gets what a streamed reply produces: a status
+message, a burst of edits (issued without waiting for each other), the
+final chunks and a status delete. Without the queue, flood errors reach
+the caller the way they reached the handlers; with it they should be
+absorbed by pacing and retries.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.fakes import FakeBotAPI
+from middlewares.send_queue_middleware import SendQueueMiddleware
+from services.send_queue import SendQueue
+
+
+async def reply(bot: Bot, chat_id: int, chunks: int, edits: int, latencies: List[float]) -> int:
+    """
+    Deliver one streamed reply.
+
+    Returns:
+        Number of calls that failed with a flood error
+    """
+    failures = 0
+
+    async def call(coro) -> None:
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            await coro
+        except TelegramRetryAfter:
+            failures += 1
+        latencies.append(time.perf_counter() - started)
+
+    status = await bot.send_message(chat_id, "Запрос получен, анализирую...")
+    # Edits come from a producer that does not wait for earlier edits
+    pending = []
+    for n in range(edits):
+        edit = bot.edit_message_text(f"partial {n}", chat_id=chat_id, message_id=status.message_id)
+        pending.append(asyncio.create_task(call(edit)))
+        await asyncio.sleep(0.05)
+    await asyncio.gather(*pending)
+    for n in range(chunks):
+        await call(bot.send_message(chat_id, f"chunk {n}"))
+    await call(bot.delete_message(chat_id, status.message_id))
+    return failures
+
+
+async def run(queued: bool, args: argparse.Namespace) -> None:
+    """Deliver replies to all users in one mode and print results."""
+    fake = FakeBotAPI(global_rate=args.global_rate, chat_rate=args.chat_rate)
+    await fake.start()
+    bot = fake.make_bot()
+    send_queue = None
+    if queued:
+        send_queue = SendQueue(global_rate=args.global_rate, chat_rate=args.chat_rate)
+        bot.session.middleware(SendQueueMiddleware(send_queue))
+
+    latencies: List[float] = []
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(reply(bot, 1000 + user, args.chunks, args.edits, latencies) for user in range(args.users)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+
+    # The status message itself may fail without the queue
+    failures = sum(r if isinstance(r, int) else 1 for r in results)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    line = (
+        f"{'queue' if queued else 'direct':>6}: {elapsed:6.2f}s, "
+        f"{failures:4d} calls failed, {fake.flood_errors:4d} 429 responses, "
+        f"{sum(fake.calls.values())} API calls, "
+        f"latency p50 {statistics.median(latencies) * 1000:6.0f} ms p99 {p99 * 1000:6.0f} ms"
+    )
+    if send_queue is not None:
+        line += f", {send_queue.stats['coalesced']} edits coalesced"
+        send_queue.close()
+    print(line)
+
+    await bot.session.close()
+    await fake.close()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--chunks", type=int, default=3)
+    parser.add_argument("--edits", type=int, default=8)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(
+        f"{args.users} users, {args.edits} edits and {args.chunks} chunks each, "
+        f"limits {args.global_rate:.0f}/s total and {args.chat_rate:.1f}/s per chat"
+    )
+    for queued in (False, True):
+        asyncio.run(run(queued, args))
+
+
+if __name__ == "__main__":
+    main()
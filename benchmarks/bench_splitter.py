@@ -0,0 +1,147 @@
+"""
+Compare the old and the entity-aware message splitter on long model outputs.
+
+Usage:
+    python -m benchmarks.bench_splitter [--size 100000] [--runs 20]
+
+Synthetic Markdown answers mix paragraphs, lists, bold spans, inline code,
+links and fenced code blocks, like long model outputs. For each splitter
+the benchmark reports the time per split and how many chunks would fail
+to parse on their own because an entity was cut.
+"""
+import argparse
+import random
+import re
+import time
+from typing import Callable, List
+
+from utils.message_splitter import MessageSplitter
+
+
+WORDS = (
+    "the model returns a long answer with several sections and examples "
+    "that explain each step of the solution in detail"
+).split()
+
+
+def make_answer(size: int, seed: int = 0) -> str:
+    """
+    Generate a Markdown answer of about ``size`` characters.
+
+    Args:
+        size: Target length
+        seed: Random seed
+
+    Returns:
+        Answer text
+    """
+    rng = random.Random(seed)
+    parts: List[str] = []
+    length = 0
+
+    def sentence() -> str:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+        if rng.random() < 0.3:
+            start = rng.randrange(len(words) - 3)
+            words[start] = "*" + words[start]
+            words[start + 2] += "*"
+        if rng.random() < 0.2:
+            words.append(f"`value_{rng.randint(0, 99)}`")
+        if rng.random() < 0.1:
+            words.append(f"[docs](https://example.com/docs/{rng.randint(0, 999)})")
+        return " ".join(words).capitalize() + "."
+
+    while length < size:
+        kind = rng.random()
+        if kind < 0.15:
+            lines = [
+                f"    result_{i} = compute(data[{i}], factor={rng.random():.3f})"
+                for i in range(rng.randint(10, 120))
+            ]
+            part = "```python\n" + "\n".join(lines) + "\n```"
+        elif kind < 0.3:
+            part = "\n".join(f"- {sentence()}" for _ in range(rng.randint(3, 8)))
+        else:
+            part = " ".join(sentence() for _ in range(rng.randint(2, 30)))
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def legacy_split(text: str, max_length: int = MessageSplitter.MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split the way the bot did before entity tracking (paragraphs, sentences, words)."""
+    if len(text) <= max_length:
+        return [text]
+
+    chunks = []
+    current_chunk = ""
+    for paragraph in text.split('\n\n'):
+        if len(paragraph) > max_length:
+            for sentence in paragraph.split('. '):
+                if len(sentence) > max_length:
+                    for word in sentence.split(' '):
+                        if len(current_chunk) + len(word) + 1 <= max_length:
+                            current_chunk += word + ' '
+                        else:
+                            if current_chunk:
+                                chunks.append(current_chunk.strip())
+                            current_chunk = word + ' '
+                elif len(current_chunk) + len(sentence) + 2 <= max_length:
+                    current_chunk += sentence + '. '
+                else:
+                    if current_chunk:
+                        chunks.append(current_chunk.strip())
+                    current_chunk = sentence + '. '
+        elif len(current_chunk) + len(paragraph) + 2 <= max_length:
+            current_chunk += paragraph + '\n\n'
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = paragraph + '\n\n'
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def is_balanced(chunk: str) -> bool:
+    """Check that a Markdown chunk has no entity left open."""
+    if chunk.count("```") % 2:
+        return False
+    rest = re.sub(r"```.*?```", "", chunk, flags=re.S)
+    if rest.count("`") % 2:
+        return False
+    rest = re.sub(r"`[^`]*`", "", rest)
+    rest = re.sub(r"\[[^\]]*\]\([^)]*\)", "", rest)
+    return "[" not in rest and rest.count("*") % 2 == 0
+
+
+def measure(name: str, split: Callable[[str], List[str]], text: str, runs: int) -> None:
+    """Time a splitter and check its chunks."""
+    started = time.perf_counter()
+    for _ in range(runs):
+        chunks = split(text)
+    elapsed = (time.perf_counter() - started) / runs
+
+    broken = sum(not is_balanced(chunk) for chunk in chunks)
+    longest = max(len(chunk) for chunk in chunks)
+    print(
+        f"{name:>8}: {elapsed * 1000:7.2f} ms per split, {len(chunks):3d} chunks, "
+        f"longest {longest}, {broken} with broken entities"
+    )
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    text = make_answer(args.size)
+    print(f"{len(text)} characters, {args.runs} runs")
+    measure("legacy", legacy_split, text, args.runs)
+    measure("current", MessageSplitter.split_message, text, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare update throughput of long polling and webhook mode.
+
+Usage:
+    python -m benchmarks.bench_webhook [--updates 2000] [--work 0.05]
+
+A local fake Bot API feeds the same burst of text updates to the bot in
+each mode. The handler simulates ``--work`` seconds of processing and
+replies once, so throughput is measured from the first update to the last
+reply. In webhook mode the time Telegram waits for the HTTP response is
+reported as well.
+
+The fake server shares the bot's event loop. In webhook mode that loop
+therefore also pays for POSTing every update separately, which is
+Telegram's work in production, while polling fetches up to 100 updates
+per request. With real handler work, webhook mode measures slower here
+even though the bot itself does no more work per update.
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import Dispatcher, Router
+from aiogram.types import Message
+
+from benchmarks.fakes import FakeBotAPI
+from bot_main import run_polling, run_webhook
+from config import Config
+
+
+def echo_router(work: float) -> Router:
+    """Create a router that replies to every text message after ``work`` seconds."""
+    router = Router()
+
+    @router.message()
+    async def echo(message: Message) -> None:
+        await asyncio.sleep(work)
+        await message.answer(message.text)
+
+    return router
+
+
+def free_port() -> int:
+    """Get a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(mode: str, updates: int, users: int, work: float, latency: float) -> None:
+    """
+    Push a burst of updates through one mode and print results.
+
+    Args:
+        mode: polling or webhook
+        updates: Number of updates
+        users: Number of distinct senders
+        work: Simulated handler time in seconds
+        latency: Fake Bot API latency in seconds
+    """
+    fake = FakeBotAPI(latency=latency)
+    await fake.start()
+    bot = fake.make_bot()
+    dp = Dispatcher()
+    dp.include_router(echo_router(work))
+
+    if mode == "webhook":
+        port = free_port()
+        config = Config(
+            telegram_token=bot.token,
+            groq_api_key="",
+            upload_directory=Path(tempfile.gettempdir()),
+            bot_mode="webhook",
+            webhook_url=f"http://127.0.0.1:{port}",
+            webhook_host="127.0.0.1",
+            webhook_port=port,
+        )
+        server = asyncio.create_task(run_webhook(dp, bot, config))
+        await fake.wait_for("setWebhook", 1, timeout=10)
+    else:
+        server = asyncio.create_task(run_polling(dp, bot))
+        await fake.wait_for("getUpdates", 1, timeout=10)
+
+    started = time.perf_counter()
+    for i in range(updates):
+        fake.push(fake.message_update(1000 + i % users, f"message {i}"))
+    await fake.wait_for("sendMessage", updates, timeout=600)
+    elapsed = time.perf_counter() - started
+
+    if mode == "webhook":
+        server.cancel()
+    else:
+        await dp.stop_polling()
+    try:
+        await server
+    except asyncio.CancelledError:
+        pass
+    await bot.session.close()
+    await fake.close()
+
+    line = f"{mode:>8}: {updates / elapsed:8.1f} updates/s"
+    if fake.webhook_latencies:
+        latencies = sorted(fake.webhook_latencies)
+        line += (
+            f", webhook response p50 {statistics.median(latencies) * 1000:.1f} ms"
+            f" p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms"
+        )
+    print(line)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--work", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(
+        f"{args.updates} updates from {args.users} users, "
+        f"{args.work * 1000:.0f} ms handler work, {args.latency * 1000:.0f} ms API latency"
+    )
+    for mode in ("polling", "webhook"):
+        asyncio.run(run(mode, args.updates, args.users, args.work, args.latency))
+
+
+if __name__ == "__main__":
+    main()
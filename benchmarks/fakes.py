@@ -0,0 +1,807 @@
+"""Local fakes of external services used by benchmarks."""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Awaitable, Deque, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+
+from services.groq_scheduler import TokenBucket
+
+
+# Calls a chat may make at once before its rate applies
+CHAT_BURST = 3
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+class FakeBotAPI:
+    """
+    Minimal Telegram Bot API server.
+
+    Serves the methods the bot uses and counts every call. Updates are
+    delivered through ``getUpdates`` long polling or, once ``setWebhook``
+    is called, POSTed to the webhook with the secret token header the way
+    Telegram does it (at most ``max_connections`` at a time). With flood
+    limits set, calls made in chats faster than allowed are answered with
+    429 and ``retry_after`` like Telegram does.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        max_connections: int = 40,
+        global_rate: float = 0.0,
+        chat_rate: float = 0.0
+    ):
+        """
+        Initialize fake server.
+
+        Args:
+            latency: Delay added to every API call in seconds
+            max_connections: Concurrent webhook deliveries
+            global_rate: Chat calls allowed per second in total (0 is unlimited)
+            chat_rate: Calls allowed per second in one chat (0 is unlimited)
+        """
+        self.latency = latency
+        self.max_connections = max_connections
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.url = ""
+        self.flood_errors = 0
+
+        self.calls: Counter = Counter()
+        self.sent: List[Dict[str, Any]] = []
+        self.files: Dict[str, bytes] = {}
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_statuses: Counter = Counter()
+        self.webhook_latencies: List[float] = []
+
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._has_updates = asyncio.Event()
+        self._waiters: List[Tuple[str, int, asyncio.Future]] = []
+        self._deliveries: Set[asyncio.Task] = set()
+        self._delivery_slots = asyncio.Semaphore(max_connections)
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._global_bucket = TokenBucket(max(1.0, global_rate), global_rate)
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+
+    @property
+    def server(self) -> TelegramAPIServer:
+        """API server description for aiogram sessions."""
+        return TelegramAPIServer.from_base(self.url)
+
+    def make_bot(self, token: str = "123456:fake") -> Bot:
+        """
+        Create a bot talking to this server.
+
+        Args:
+            token: Bot token
+
+        Returns:
+            Bot instance
+        """
+        return Bot(
+            token=token,
+            session=AiohttpSession(api=self.server),
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+
+        Returns:
+            Base URL of the server
+        """
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections)
+        )
+        return self.url
+
+    async def close(self) -> None:
+        """Stop deliveries and the server."""
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def message_update(self, user_id: int, text: str) -> Dict[str, Any]:
+        """
+        Build an update with a private text message.
+
+        Args:
+            user_id: Sender ID (also the chat ID)
+            text: Message text
+
+        Returns:
+            Update payload
+        """
+        update = self._update(user_id)
+        update["message"]["text"] = text
+        return update
+
+    def photo_update(
+        self,
+        user_id: int,
+        data: bytes,
+        size: Tuple[int, int],
+        caption: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Build an update with a private photo message.
+
+        The photo is registered so ``getFile`` and the file download route
+        serve it.
+
+        Args:
+            user_id: Sender ID (also the chat ID)
+            data: Encoded photo
+            size: Photo resolution
+            caption: Optional caption
+
+        Returns:
+            Update payload
+        """
+        file_id = f"photo{len(self.files)}"
+        self.files[file_id] = data
+
+        update = self._update(user_id)
+        update["message"]["photo"] = [{
+            "file_id": file_id,
+            "file_unique_id": f"u{file_id}",
+            "width": size[0],
+            "height": size[1],
+            "file_size": len(data),
+        }]
+        if caption:
+            update["message"]["caption"] = caption
+        return update
+
+    def push(self, update: Dict[str, Any]) -> None:
+        """
+        Deliver an update to the bot.
+
+        Args:
+            update: Update payload
+        """
+        if self.webhook_url is None:
+            self._pending.append(update)
+            self._has_updates.set()
+            return
+
+        task = asyncio.get_running_loop().create_task(self._deliver(update))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def wait_for(self, method: str, count: int, timeout: Optional[float] = None) -> None:
+        """
+        Wait until a method has been called ``count`` times.
+
+        Args:
+            method: API method name (case insensitive)
+            count: Number of calls to wait for
+            timeout: Maximum wait in seconds
+        """
+        method = method.lower()
+        if self.calls[method] >= count:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((method, count, future))
+        await asyncio.wait_for(future, timeout)
+
+    def _update(self, user_id: int) -> Dict[str, Any]:
+        """Build an update skeleton with an empty private message."""
+        update = {
+            "update_id": self._next_update_id,
+            "message": {
+                "message_id": self._next_message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            },
+        }
+        self._next_update_id += 1
+        self._next_message_id += 1
+        return update
+
+    def _message(self, chat_id: int, text: Optional[str]) -> Dict[str, Any]:
+        """Build a message sent by the bot."""
+        message = {
+            "message_id": self._next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text or "",
+        }
+        self._next_message_id += 1
+        return message
+
+    def _count(self, method: str) -> None:
+        """Count a call and wake up satisfied waiters."""
+        self.calls[method] += 1
+        for waiter in list(self._waiters):
+            name, count, future = waiter
+            if name == method and self.calls[method] >= count:
+                self._waiters.remove(waiter)
+                if not future.done():
+                    future.set_result(None)
+
+    def _flood_wait(self, chat_id: str) -> int:
+        """
+        Check flood limits for a call made in a chat.
+
+        Returns:
+            Seconds to wait, or 0 if the call is allowed
+        """
+        buckets = []
+        if self.chat_rate:
+            if chat_id not in self._chat_buckets:
+                self._chat_buckets[chat_id] = TokenBucket(CHAT_BURST, self.chat_rate)
+            buckets.append(self._chat_buckets[chat_id])
+        if self.global_rate:
+            buckets.append(self._global_bucket)
+
+        if any(bucket.wait_time(1) > 0 for bucket in buckets):
+            return 1
+        for bucket in buckets:
+            bucket.consume(1)
+        return 0
+
+    async def _deliver(self, update: Dict[str, Any]) -> None:
+        """POST an update to the webhook."""
+        headers = {}
+        if self.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook_secret
+
+        async with self._delivery_slots:
+            started = time.perf_counter()
+            async with self._session.post(self.webhook_url, json=update, headers=headers) as resp:
+                await resp.read()
+            self.webhook_latencies.append(time.perf_counter() - started)
+            self.webhook_statuses[resp.status] += 1
+
+    async def _get_updates(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Long-poll for pending updates."""
+        if not self._pending:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(
+                    self._has_updates.wait(),
+                    float(params.get("timeout", 0)) or 0.01
+                )
+            except asyncio.TimeoutError:
+                return []
+
+        limit = int(params.get("limit", 100))
+        updates = []
+        while self._pending and len(updates) < limit:
+            updates.append(self._pending.popleft())
+        return updates
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        """Serve a Bot API method."""
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+
+        if self.latency and method != "getupdates":
+            await asyncio.sleep(self.latency)
+        self._count(method)
+
+        if "chat_id" in params and (self.global_rate or self.chat_rate):
+            retry_after = self._flood_wait(params["chat_id"])
+            if retry_after:
+                self.flood_errors += 1
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {retry_after}",
+                        "parameters": {"retry_after": retry_after},
+                    },
+                    status=429
+                )
+
+        if method == "getme":
+            result: Any = BOT_USER
+        elif method == "getupdates":
+            result = await self._get_updates(params)
+        elif method == "sendmessage":
+            result = self._message(int(params["chat_id"]), params.get("text"))
+            self.sent.append(result)
+        elif method == "editmessagetext":
+            result = self._message(int(params["chat_id"]), params.get("text"))
+            result["message_id"] = int(params["message_id"])
+        elif method == "setwebhook":
+            self.webhook_url = params["url"]
+            self.webhook_secret = params.get("secret_token")
+            result = True
+        elif method == "deletewebhook":
+            self.webhook_url = None
+            self.webhook_secret = None
+            result = True
+        elif method == "getfile":
+            file_id = params["file_id"]
+            if file_id not in self.files:
+                return web.json_response(
+                    {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"},
+                    status=400
+                )
+            result = {
+                "file_id": file_id,
+                "file_unique_id": f"u{file_id}",
+                "file_size": len(self.files[file_id]),
+                "file_path": f"photos/{file_id}.jpg",
+            }
+        else:
+            # deleteMessage, sendChatAction and the like
+            result = True
+
+        return web.Response(
+            text=json.dumps({"ok": True, "result": result}),
+            content_type="application/json"
+        )
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        """Serve a file registered with ``photo_update``."""
+        name = request.match_info["path"].rsplit("/", 1)[-1]
+        data = self.files.get(name.rsplit(".", 1)[0])
+        if data is None:
+            raise web.HTTPNotFound()
+        self._count("file")
+        return web.Response(body=data, content_type="image/jpeg")
+
+
+class BackgroundLoop:
+    """
+    Event loop running in its own thread.
+
+    Fakes served from here do not take event loop time from the code
+    being measured.
+    """
+
+    def __init__(self):
+        """Start the loop thread."""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="fakes", daemon=True)
+        self._thread.start()
+
+    async def run(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a coroutine on the background loop and wait for its result.
+
+        Args:
+            coro: Coroutine to run
+
+        Returns:
+            Coroutine result
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        """Stop the loop and its thread."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class FakeGroqServer:
+    """
+    Local server speaking the Groq chat-completions API.
+
+    Every request waits ``latency`` seconds (time to first token) and then
+    produces an answer of ``tokens`` words, streamed as server-sent events
+    one word every ``token_delay`` seconds when ``stream`` is set. Responses
+    carry usage and rate limit headers with the configured limits, which
+    are reported but not enforced.
+    """
+
+    PATH = "/openai/v1/chat/completions"
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        token_delay: float = 0.01,
+        tokens: int = 60,
+        requests_per_minute: int = 100_000,
+        tokens_per_minute: int = 100_000_000
+    ):
+        """
+        Initialize fake server.
+
+        Args:
+            latency: Delay before the first token in seconds
+            token_delay: Delay between streamed tokens in seconds
+            tokens: Words in every answer
+            requests_per_minute: Reported request limit
+            tokens_per_minute: Reported token limit
+        """
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.url = ""
+
+        self.requests: Counter = Counter()
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+
+        Returns:
+            Base URL of the server (the Groq client ``base_url``)
+        """
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post(self.PATH, self._handle_completion)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self) -> None:
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def answer(self) -> List[str]:
+        """Build the answer as a list of content deltas."""
+        words = [f"слово{n}" for n in range(self.tokens)]
+        if words:
+            words[0] = f"**{words[0]}**"
+        return [("" if n == 0 else " ") + word for n, word in enumerate(words)]
+
+    def _headers(self) -> Dict[str, str]:
+        """Build rate limit headers with the configured limits."""
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(self.requests_per_minute),
+            "x-ratelimit-reset-requests": "0s",
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-reset-tokens": "0s",
+        }
+
+    async def _handle_completion(self, request: web.Request) -> web.StreamResponse:
+        """Serve a chat completion, streamed or whole."""
+        body = await request.json()
+        model = body.get("model", "")
+        self.requests[model] += 1
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        deltas = self.answer()
+        usage = {
+            "prompt_tokens": len(json.dumps(body.get("messages", []))) // 4,
+            "completion_tokens": len(deltas),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        await asyncio.sleep(self.latency)
+
+        if not body.get("stream"):
+            return web.json_response(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(deltas)},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                },
+                headers=self._headers()
+            )
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            **self._headers(),
+        })
+        await response.prepare(request)
+
+        def event(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if finish_reason is not None:
+                # Groq reports usage in the last chunk
+                chunk["x_groq"] = {"id": completion_id, "usage": usage}
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        await response.write(event({"role": "assistant", "content": ""}))
+        for n, delta in enumerate(deltas):
+            if n and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            await response.write(event({"content": delta}))
+        await response.write(event({}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class StubDDGS:
+    """
+    Stand-in for ``DDGS`` returning generated results after a blocking delay.
+
+    Used as ``SearchWorkerPool.session_factory``; the delay blocks the
+    worker thread the way a real search does.
+    """
+
+    def __init__(self, timeout: int = 10, latency: float = 0.3, results: int = 5):
+        """
+        Initialize stub session.
+
+        Args:
+            timeout: Request timeout (accepted for compatibility)
+            latency: Blocking delay of every search in seconds
+            results: Results returned at most
+        """
+        self.timeout = timeout
+        self.latency = latency
+        self.results = results
+
+    def text(self, query: str, max_results: int = 10, **kwargs: Any) -> List[Dict[str, str]]:
+        """Return web results for a query."""
+        time.sleep(self.latency)
+        return [
+            {
+                "title": f"{query} — результат {n}",
+                "href": f"https://example.com/{n}?q={uuid.uuid5(uuid.NAMESPACE_URL, query).hex}",
+                "body": f"Описание результата {n} по запросу «{query}». " * 3,
+            }
+            for n in range(min(max_results, self.results))
+        ]
+
+    def news(self, query: str, max_results: int = 10, **kwargs: Any) -> List[Dict[str, str]]:
+        """Return news results for a query."""
+        time.sleep(self.latency)
+        return [
+            {
+                "title": f"{query} — новость {n}",
+                "url": f"https://news.example.com/{n}",
+                "body": f"Текст новости {n} по запросу «{query}».",
+                "date": "2026-01-01T00:00:00+00:00",
+                "source": "Example News",
+            }
+            for n in range(min(max_results, self.results))
+        ]
+
+
+class FakeWebServer:
+    """
+    Web server with HTML pages for page fetching tests.
+
+    ``/page/{name}`` serves pages added with ``add_page`` after their
+    delay, with an ``ETag`` and ``Cache-Control: max-age``. A request
+    with a matching ``If-None-Match`` gets 304 without a body.
+    """
+
+    def __init__(self, max_age: int = 0):
+        """
+        Initialize fake server.
+
+        Args:
+            max_age: ``max-age`` sent with every page in seconds
+        """
+        self.max_age = max_age
+        self.url = ""
+
+        self.pages: Dict[str, Tuple[bytes, str, float, str]] = {}
+        self.requests: Counter = Counter()
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_page(
+        self,
+        name: str,
+        body: bytes,
+        delay: float = 0.0,
+        content_type: str = "text/html; charset=utf-8"
+    ) -> str:
+        """
+        Add a page (after ``start``, so its URL is known).
+
+        Args:
+            name: Page name in the URL
+            body: Page content
+            delay: Time before the response starts in seconds
+            content_type: Content-Type header
+
+        Returns:
+            Page URL
+        """
+        etag = f'"{uuid.uuid5(uuid.NAMESPACE_URL, name + str(len(body))).hex}"'
+        self.pages[name] = (body, etag, delay, content_type)
+        return f"{self.url}/page/{name}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+
+        Returns:
+            Base URL of the server
+        """
+        app = web.Application()
+        app.router.add_get("/page/{name}", self._handle_page)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self) -> None:
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle_page(self, request: web.Request) -> web.StreamResponse:
+        """Serve a page, or 304 if the client's copy is current."""
+        name = request.match_info["name"]
+        if name not in self.pages:
+            raise web.HTTPNotFound()
+        body, etag, delay, content_type = self.pages[name]
+        self.requests[name] += 1
+
+        if delay:
+            await asyncio.sleep(delay)
+        headers = {"ETag": etag, "Cache-Control": f"max-age={self.max_age}"}
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+
+        headers["Content-Type"] = content_type
+        response = web.StreamResponse(headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        try:
+            for start in range(0, len(body), 64 * 1024):
+                await response.write(body[start:start + 64 * 1024])
+                self.bytes_sent += len(body[start:start + 64 * 1024])
+            await response.write_eof()
+        except ConnectionError:
+            # The client stopped reading at its byte cap
+            pass
+        return response
+
+
+class FakeRedisServer:
+    """
+    In-memory server speaking enough of the Redis protocol for the state backends.
+
+    Supports PING, AUTH, SELECT, GET, SET (with EX), DEL, EXISTS and
+    FLUSHDB. Expiry is recorded but not enforced.
+    """
+
+    def __init__(self):
+        """Initialize fake server."""
+        self.data: Dict[bytes, bytes] = {}
+        self.commands: Counter = Counter()
+        self.url = ""
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+
+        Returns:
+            Redis URL of the server
+        """
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"redis://{host}:{port}/0"
+        return self.url
+
+    async def close(self) -> None:
+        """Stop the server."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _execute(self, command: List[bytes]) -> bytes:
+        """Run a command and encode its reply."""
+        name = command[0].upper().decode()
+        args = command[1:]
+        self.commands[name] += 1
+
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if name == "GET":
+            value = self.data.get(args[0])
+            if value is None:
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "SET":
+            self.data[args[0]] = args[1]
+            return b"+OK\r\n"
+        if name == "DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args)
+        if name == "EXISTS":
+            return b":%d\r\n" % sum(key in self.data for key in args)
+        if name == "FLUSHDB":
+            self.data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve one client connection."""
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                command = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self._execute(command))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
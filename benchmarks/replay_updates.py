@@ -0,0 +1,159 @@
+"""
+Replay a recorded message stream against the bot wired to local fakes.
+
+Usage:
+    RECORD_UPDATES=updates.jsonl.gz python bot_main.py
+    python -m benchmarks.replay_updates updates.jsonl.gz [--speed 1] [--start 0] [--duration 0]
+
+Recordings are written by ``LoggingMiddleware`` when ``RECORD_UPDATES`` is
+set (one file per worker process; pass them all to merge). They keep only
+the shape of the traffic: timing, sender, kind, text length, commands and
+photo sizes. Replay rebuilds messages of the same shape and pushes them on
+the recorded schedule ``--speed`` times faster (1 is real time, 0 pushes
+everything at once), so an incident such as a morning photo storm can be
+reproduced with ``--start`` and ``--duration`` (seconds into the
+recording) and capacity checked before a deploy. The fakes, report and
+regression thresholds are the ones of ``bench_e2e``.
+"""
+import argparse
+import asyncio
+import io
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from benchmarks.bench_e2e import Harness, add_fake_arguments, finish
+from benchmarks.fakes import FakeBotAPI
+from utils.update_recorder import load_recordings
+
+
+FILLER = "пример текста запроса "
+
+
+def make_text(length: int, question: bool) -> str:
+    """Build a text of the given length, ending with "?" for search queries."""
+    length = max(length, 2)
+    text = (FILLER * (length // len(FILLER) + 1))[:length - 1].rstrip() or "а"
+    return text + ("?" if question else ".")
+
+
+class PhotoFactory:
+    """Synthetic JPEG photos of recorded resolutions, generated once per size."""
+
+    def __init__(self, max_side: int = 0):
+        """
+        Initialize factory.
+
+        Args:
+            max_side: Downscale larger photos to this side (0 keeps them)
+        """
+        self.max_side = max_side
+        self._photos: Dict[Tuple[int, int], bytes] = {}
+
+    def get(self, width: int, height: int) -> Tuple[bytes, Tuple[int, int]]:
+        """Get a photo of a resolution and its actual size."""
+        if self.max_side and max(width, height) > self.max_side:
+            scale = self.max_side / max(width, height)
+            width, height = max(1, int(width * scale)), max(1, int(height * scale))
+
+        size = (width, height)
+        if size not in self._photos:
+            # Low-entropy noise upscaled so the JPEG looks like a real photo
+            small = (max(1, width // 8), max(1, height // 8))
+            noise = Image.frombytes("RGB", small, os.urandom(small[0] * small[1] * 3))
+            output = io.BytesIO()
+            noise.resize(size, Image.BICUBIC).save(output, format="JPEG", quality=90)
+            self._photos[size] = output.getvalue()
+        return self._photos[size], size
+
+
+def build_update(fake: FakeBotAPI, item: Dict[str, Any], photos: PhotoFactory) -> Dict[str, Any]:
+    """Rebuild an update from a recorded message."""
+    user_id = 1000 + item["u"]
+    kind = item["k"]
+    if kind == "photo":
+        data, size = photos.get(item["w"], item["h"])
+        caption = make_text(item["c"], question=False) if item.get("c") else None
+        return fake.photo_update(user_id, data, size, caption)
+    if kind == "command":
+        return fake.message_update(user_id, item["cmd"])
+    return fake.message_update(user_id, make_text(item.get("n", 1), question=kind == "search"))
+
+
+def select(items: List[Dict[str, Any]], start: float, duration: float) -> List[Dict[str, Any]]:
+    """Get replayable records of a time window."""
+    end = start + duration if duration else float("inf")
+    return [item for item in items if start <= item["t"] < end and item["k"] != "other"]
+
+
+async def replay(items: List[Dict[str, Any]], args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Push records on their schedule and wait for the bot to handle them.
+
+    Returns:
+        Measured results with how far pushes fell behind the schedule
+    """
+    harness = Harness(args)
+    await harness.start()
+    try:
+        photos = PhotoFactory(args.max_photo_side)
+        loop = asyncio.get_running_loop()
+        origin = items[0]["t"]
+        behind = 0.0
+
+        # Photos are encoded up front so pushes are not delayed by it
+        updates = [build_update(harness.fake, item, photos) for item in items]
+
+        harness.measure()
+        started = loop.time()
+        for item, update in zip(items, updates):
+            if args.speed > 0:
+                due = started + (item["t"] - origin) / args.speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    behind = max(behind, -delay)
+            harness.fake.push(update)
+
+        results = await harness.drain(len(items))
+        results["schedule_behind_max_ms"] = behind * 1000
+        return results
+    finally:
+        await harness.close()
+
+
+def main() -> None:
+    """Run the replay."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("recordings", type=Path, nargs="+")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed-up factor (0 is as fast as possible)")
+    parser.add_argument("--start", type=float, default=0.0, help="Seconds into the recording")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to replay (0 is all)")
+    parser.add_argument("--max-photo-side", type=int, default=0, help="Downscale larger photos")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    items = select(load_recordings(args.recordings), args.start, args.duration)
+    if not items:
+        parser.error("nothing to replay in the selected window")
+
+    kinds: Dict[str, int] = {}
+    for item in items:
+        kinds[item["k"]] = kinds.get(item["k"], 0) + 1
+    span = items[-1]["t"] - items[0]["t"]
+    print(
+        f"{len(items)} messages over {span:.0f}s from {len({item['u'] for item in items})} users "
+        f"({', '.join(f'{count} {kind}' for kind, count in sorted(kinds.items()))}), "
+        f"speed {f'{args.speed:g}x' if args.speed > 0 else 'max'}"
+    )
+    results = asyncio.run(replay(items, args))
+    if args.speed > 0:
+        print(f"pushes fell behind schedule by at most {results['schedule_behind_max_ms']:.0f} ms")
+    finish(results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,629 @@
 """Main bot entry point."""
 import asyncio
 import logging
+import secrets
 import sys
+from dataclasses import replace
+from logging.handlers import QueueListener
 from pathlib import Path
+from typing import Any, Dict, Optional
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config import Config
 from handlers import setup_handlers
+from keyboards.main_keyboard import get_main_keyboard
+from services.groq_service import GroqService
+from services.groq_scheduler import GroqScheduler
+from services.groq_resilience import ResiliencePolicy
+from services.completion_cache import CompletionCache, SQLiteCompletionStore
+from services.page_fetcher import PageFetcher
+from services.search_service import SearchCache, SearchService, SearchWorkerPool
+from services.vision_cache import VisionCache
+from services.conversation_store import ConversationStore, SQLiteConversationBackend
+from services.redis_client import RedisClient
+from services.send_queue import SendQueue
+from services.update_workers import UpdateWorkerPool, serve_updates
+from services.user_state import RedisStateBackend, UserSettings
 from middlewares.logging_middleware import LoggingMiddleware
+from middlewares.metrics_middleware import MetricsMiddleware, TelegramMetricsMiddleware
+from middlewares.send_queue_middleware import SendQueueMiddleware
+from middlewares.sharding_middleware import ShardingMiddleware
+from middlewares.tracing_middleware import TracingMiddleware
+from utils.worker_pool import WorkerPool
+from utils.metrics import metrics
+from utils.logging_setup import setup_logging as setup_queue_logging
+from utils.search_context import SearchContextCompactor
+from utils.tracing import SlowUpdateProfiler
+from utils.update_recorder import UpdateRecorder
 
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot.log')
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
 
-async def main() -> None:
-    """Main bot function."""
-    try:
-        # Load configuration
-        config = Config.from_env()
-        logger.info("Configuration loaded successfully")
+def setup_logging(config: Config, log_file: Optional[Path] = None) -> QueueListener:
+    """
+    Configure queue-based logging from settings.
+    
+    Args:
+        config: Bot configuration
+        log_file: Log file overriding the configured one
         
-        # Initialize bot
-        bot = Bot(
-            token=config.telegram_token,
-            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    Returns:
+        Started listener (stop it on shutdown to flush pending records)
+    """
+    return setup_queue_logging(
+        log_file=log_file or config.log_file,
+        level=logging.getLevelName(config.log_level),
+        json_format=config.log_format == "json",
+        max_bytes=config.log_max_bytes,
+        backup_count=config.log_backup_count,
+        rotate_when=config.log_rotate_when,
+        sampling=config.log_sampling
+    )
+
+
+def create_send_queue(config: Config) -> Optional[SendQueue]:
+    """
+    Create the outbound send queue of this process.
+    
+    Worker processes split the global rate between them.
+    
+    Args:
+        config: Bot configuration
+        
+    Returns:
+        Send queue or None if it is disabled
+    """
+    if not config.send_queue_enabled:
+        return None
+    
+    send_queue = SendQueue(
+        global_rate=config.send_global_rate / max(1, config.bot_workers),
+        chat_rate=config.send_chat_rate,
+        group_rate=config.send_group_rate_per_minute / 60,
+        max_retries=config.send_max_retries
+    )
+    metrics.register_gauge(
+        "bot_send_queue_depth", "Bot API calls waiting for flood limits", lambda: send_queue.queue_depth
+    )
+    metrics.register_counter(
+        "bot_send_flood_waits", "Flood-control errors retried", lambda: send_queue.stats["flood_waits"]
+    )
+    metrics.register_counter(
+        "bot_send_coalesced", "Edits merged into a newer edit", lambda: send_queue.stats["coalesced"]
+    )
+    return send_queue
+
+
+def create_bot(config: Config, send_queue: Optional[SendQueue] = None) -> Bot:
+    """
+    Create bot, talking to a custom Bot API server if one is configured.
+    
+    Args:
+        config: Bot configuration
+        send_queue: Queue pacing calls made in chats
+        
+    Returns:
+        Bot instance
+    """
+    session = None
+    if config.telegram_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url))
+    bot = Bot(
+        token=config.telegram_token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    # The queue is the outer middleware, so metrics time only the request
+    if send_queue is not None:
+        bot.session.middleware(SendQueueMiddleware(send_queue))
+    if metrics.enabled:
+        bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
+
+
+async def start_metrics(config: Config, port: int) -> Optional[web.AppRunner]:
+    """
+    Enable metrics and serve them if a metrics port is configured.
+    
+    Args:
+        config: Bot configuration
+        port: Port of this process
+        
+    Returns:
+        Metrics server runner or None if metrics are disabled
+    """
+    if not config.metrics_port or not metrics.enable():
+        return None
+    return await metrics.start_server(config.metrics_host, port)
+
+
+def register_service_metrics(services: Dict[str, Any]) -> None:
+    """
+    Export cache hit rates and queue sizes of services.
+    
+    Args:
+        services: Services created by create_services
+    """
+    conversation_store = services["conversation_store"]
+    metrics.register_cache("conversations", lambda: conversation_store.stats)
+    metrics.register_gauge(
+        "bot_conversations", "Conversations held in memory", lambda: conversation_store.size
+    )
+    metrics.register_counter(
+        "bot_conversation_evictions",
+        "Conversations dropped from memory by reason (ttl, lru)",
+        lambda: {
+            ("ttl",): conversation_store.stats["evictions_ttl"],
+            ("lru",): conversation_store.stats["evictions_lru"],
+        },
+        labels=("reason",)
+    )
+    
+    search_service = services["search_service"]
+    if search_service.cache is not None:
+        metrics.register_cache("search", lambda: search_service.cache.results.stats)
+    search_pool = services["search_pool"]
+    metrics.register_gauge(
+        "bot_search_pending", "Searches running or queued", lambda: search_pool.pending
+    )
+    
+    page_fetcher = services["page_fetcher"]
+    if page_fetcher is not None:
+        metrics.register_cache("pages", lambda: page_fetcher.cache.stats)
+        metrics.register_counter(
+            "bot_pages_late", "Pages dropped for missing the deadline", lambda: page_fetcher.stats["late"]
+        )
+    
+    completion_cache = services["completion_cache"]
+    if completion_cache is not None:
+        metrics.register_cache("completions", lambda: completion_cache.memory.stats)
+    
+    vision_cache = services["vision_cache"]
+    if vision_cache is not None:
+        metrics.register_cache("vision_results", lambda: vision_cache.results.stats)
+        metrics.register_cache("vision_payloads", lambda: vision_cache.payloads.stats)
+    
+    resilience = services["groq_service"].resilience
+    if resilience is not None:
+        metrics.register_counter(
+            "groq_request_outcomes",
+            "Finished Groq requests by task and outcome (primary, retried, hedged, fallback, failed)",
+            lambda: resilience.outcomes,
+            labels=("task", "outcome")
+        )
+    
+    scheduler = services["groq_service"].scheduler
+    if scheduler is not None:
+        metrics.register_gauge(
+            "groq_queue_depth",
+            "Groq calls waiting for rate limits by priority",
+            scheduler.queue_depths,
+            labels=("priority",)
         )
+        metrics.register_counter(
+            "groq_scheduler_calls",
+            "Groq calls granted or cancelled while waiting for rate limits",
+            lambda: {(outcome,): count for outcome, count in scheduler.stats.items()},
+            labels=("outcome",)
+        )
+
+
+async def create_services(config: Config) -> Dict[str, Any]:
+    """
+    Create services shared by all handlers.
+    
+    Args:
+        config: Bot configuration
         
-        # Initialize dispatcher
-        dp = Dispatcher()
+    Returns:
+        Services by name, used as dispatcher workflow data
+    """
+    # Handlers get the configuration the same way as the services
+    services: Dict[str, Any] = {"config": config}
+    
+    # Cache of deterministic first-turn completions
+    completion_cache = None
+    if config.completion_cache_enabled:
+        store = None
+        if config.completion_cache_db_path is not None:
+            store = SQLiteCompletionStore(config.completion_cache_db_path)
+        completion_cache = CompletionCache(
+            max_entries=config.completion_cache_size,
+            ttl=config.completion_cache_ttl,
+            store=store,
+        )
+    services["completion_cache"] = completion_cache
+    
+    # Shared Groq client with a keep-alive connection pool
+    scheduler = None
+    if config.groq_scheduler_enabled:
+        scheduler = GroqScheduler(
+            requests_per_minute=config.groq_requests_per_minute,
+            tokens_per_minute=config.groq_tokens_per_minute,
+        )
+    resilience = ResiliencePolicy(
+        max_retries=config.groq_max_retries,
+        base_delay=config.groq_retry_base_delay,
+        max_delay=config.groq_retry_max_delay,
+        hedge=config.groq_hedge_enabled,
+        hedge_min_delay=config.groq_hedge_min_delay,
+        fallback_models={
+            "text": config.text_fallback_models,
+            "vision": config.vision_fallback_models,
+        },
+    )
+    services["groq_service"] = GroqService(
+        config,
+        cache=completion_cache,
+        scheduler=scheduler,
+        resilience=resilience,
+        compactor=SearchContextCompactor(
+            max_tokens=config.search_context_tokens,
+            dedup_threshold=config.search_dedup_threshold,
+        ),
+    )
+    
+    # Per-user state shared by worker processes through Redis, if configured
+    state_backend = None
+    if config.redis_url is not None:
+        state_backend = RedisStateBackend(
+            RedisClient.from_url(config.redis_url),
+            ttl=config.conversation_ttl,
+        )
+    
+    # Bounded conversation history with optional write-behind persistence
+    backend = state_backend
+    if backend is None and config.conversation_db_path is not None:
+        backend = SQLiteConversationBackend(config.conversation_db_path)
+    conversation_store = ConversationStore(
+        max_users=config.conversation_max_users,
+        max_messages=config.conversation_max_messages,
+        ttl=config.conversation_ttl,
+        memory_limit=config.conversation_memory_limit_mb * 1024 * 1024,
+        backend=backend,
+        flush_interval=config.conversation_flush_interval,
+    )
+    await conversation_store.start()
+    services["conversation_store"] = conversation_store
+    services["user_settings"] = UserSettings(
+        backend=state_backend,
+        max_users=config.conversation_max_users,
+        ttl=config.conversation_ttl,
+    )
+    
+    # Search service with results cache and worker pool shared across users
+    search_pool = SearchWorkerPool(
+        max_workers=config.search_workers,
+        max_queue=config.search_queue_size,
+        queue_timeout=config.search_timeout,
+    )
+    services["search_pool"] = search_pool
+    services["search_service"] = SearchService(
+        max_results=config.search_max_results,
+        region=config.search_region,
+        timeout=config.search_timeout,
+        cache=SearchCache(
+            max_entries=config.search_cache_size,
+            ttl=config.search_cache_ttl,
+        ),
+        pool=search_pool,
+    )
+    
+    # Pages behind top search results, extracted in their own worker pool
+    page_fetcher = None
+    if config.page_fetch_enabled:
+        services["page_pool"] = WorkerPool(
+            kind=config.page_pool_kind,
+            max_workers=config.page_workers,
+            max_queue=config.page_fetch_count * 8,
+            name="page",
+        )
+        page_fetcher = PageFetcher(
+            pool=services["page_pool"],
+            max_pages=config.page_fetch_count,
+            deadline=config.page_fetch_deadline,
+            fetch_timeout=config.page_fetch_timeout,
+            max_bytes=config.page_fetch_max_bytes,
+            max_chars=config.page_text_max_chars,
+            cache_size=config.page_cache_size,
+            cache_ttl=config.page_cache_ttl,
+            max_connections=config.page_fetch_connections,
+        )
+    services["page_fetcher"] = page_fetcher
+    
+    # Image decode/resize/encode runs off the event loop
+    services["image_pool"] = WorkerPool(
+        kind=config.image_pool_kind,
+        max_workers=config.image_workers,
+        max_queue=config.image_queue_size,
+        name="image",
+    )
+    
+    # Analysis results and payloads of photos seen before
+    vision_cache = None
+    if config.vision_cache_enabled:
+        vision_cache = VisionCache(
+            max_results=config.vision_cache_size,
+            result_ttl=config.vision_cache_ttl,
+            max_payload_bytes=config.vision_payload_cache_mb * 1024 * 1024,
+        )
+    services["vision_cache"] = vision_cache
+    
+    # Anonymized message stream for load replay, if configured
+    if config.record_updates_path is not None:
+        buttons = [button.text for row in get_main_keyboard().keyboard for button in row]
+        services["update_recorder"] = UpdateRecorder(config.record_updates_path, verbatim=buttons)
+    
+    if metrics.enabled:
+        register_service_metrics(services)
+    
+    return services
+
+
+async def close_services(services: Dict[str, Any]) -> None:
+    """
+    Release resources held by services.
+    
+    Args:
+        services: Services created by create_services
+    """
+    if services.get("image_pool") is not None:
+        services["image_pool"].close()
+    if services.get("search_pool") is not None:
+        services["search_pool"].close()
+    if services.get("page_fetcher") is not None:
+        await services["page_fetcher"].close()
+    if services.get("page_pool") is not None:
+        services["page_pool"].close()
+    if services.get("conversation_store") is not None:
+        await services["conversation_store"].close()
+    if services.get("user_settings") is not None:
+        await services["user_settings"].close()
+    if services.get("groq_service") is not None:
+        await services["groq_service"].close()
+    if services.get("completion_cache") is not None:
+        await services["completion_cache"].close()
+    if services.get("update_recorder") is not None:
+        await services["update_recorder"].close()
+
+
+def create_dispatcher(services: Dict[str, Any], config: Optional[Config] = None) -> Dispatcher:
+    """
+    Create dispatcher with middleware and handlers.
+    
+    Args:
+        services: Services injected into handlers as workflow data
+        config: Bot configuration enabling update tracing (omit to skip)
+        
+    Returns:
+        Configured dispatcher
+    """
+    dp = Dispatcher(**services)
+    
+    # Register middleware
+    if config is not None:
+        profiler = None
+        if config.trace_profile:
+            profiler = SlowUpdateProfiler(
+                threshold=config.trace_slow_threshold,
+                dump_dir=config.trace_dump_dir,
+                interval=config.trace_profile_interval,
+            )
+        dp.update.outer_middleware(TracingMiddleware(config.trace_slow_threshold, profiler))
+    if metrics.enabled:
+        dp.update.outer_middleware(MetricsMiddleware())
+    dp.message.middleware(LoggingMiddleware(services.get("update_recorder")))
+    
+    # Setup handlers
+    main_router = setup_handlers()
+    dp.include_router(main_router)
+    
+    logger.info("Bot handlers and middleware registered")
+    return dp
+
+
+async def run_polling(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Receive updates with long polling.
+    
+    Args:
+        dp: Dispatcher
+        bot: Bot instance
+    """
+    # A webhook left from webhook mode would block getUpdates
+    await bot.delete_webhook()
+    
+    logger.info("Starting bot polling...")
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, config: Config) -> None:
+    """
+    Receive updates on an embedded aiohttp webhook server.
+    
+    Updates are acknowledged as soon as they are accepted and handled
+    concurrently in background tasks. Requests without the expected
+    secret token are rejected.
+    
+    Args:
+        dp: Dispatcher
+        bot: Bot instance
+        config: Bot configuration
+    """
+    secret = config.webhook_secret or secrets.token_urlsafe(32)
+    
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret,
+    ).register(app, path=config.webhook_path)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.webhook_host, port=config.webhook_port)
+    await site.start()
+    
+    await bot.set_webhook(
+        url=f"{config.webhook_url.rstrip('/')}{config.webhook_path}",
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(
+        f"Webhook server listening on {config.webhook_host}:{config.webhook_port}"
+        f"{config.webhook_path}"
+    )
+    
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_worker(index: int, updates: Any, config: Config) -> None:
+    """
+    Entry point of a worker process handling sharded updates.
+    
+    Args:
+        index: Worker number
+        updates: Queue of serialized updates from the ingress process
+        config: Bot configuration
+    """
+    # Rotation is not safe across processes, so each worker has its own file
+    log_file = None
+    if config.log_file is not None:
+        log_file = config.log_file.with_name(
+            f"{config.log_file.stem}-worker{index}{config.log_file.suffix}"
+        )
+    listener = setup_logging(config, log_file)
+    # Each worker records its own shard of users (updates.jsonl.gz -> updates-worker0.jsonl.gz)
+    if config.record_updates_path is not None:
+        path = config.record_updates_path
+        name, dot, suffixes = path.name.partition(".")
+        config = replace(
+            config,
+            record_updates_path=path.with_name(f"{name}-worker{index}{dot}{suffixes}")
+        )
+    try:
+        logger.info(f"Worker {index} started")
+        asyncio.run(_worker_main(index, updates, config))
+    finally:
+        listener.stop()
+
+
+async def _worker_main(index: int, updates: Any, config: Config) -> None:
+    """Create services and handle updates from the queue."""
+    metrics_runner = await start_metrics(config, config.metrics_port + index + 1)
+    send_queue = create_send_queue(config)
+    bot = create_bot(config, send_queue)
+    services: Dict[str, Any] = {}
+    try:
+        services = await create_services(config)
+        dp = create_dispatcher(services, config)
+        await serve_updates(updates, dp, bot, config.bot_worker_max_in_flight)
+    finally:
+        await close_services(services)
+        if send_queue is not None:
+            send_queue.close()
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+async def main(config: Optional[Config] = None) -> None:
+    """
+    Main bot function.
+    
+    Args:
+        config: Bot configuration (loaded from the environment if omitted)
+    """
+    services: Dict[str, Any] = {}
+    worker_pool: Optional[UpdateWorkerPool] = None
+    send_queue: Optional[SendQueue] = None
+    bot: Optional[Bot] = None
+    metrics_runner: Optional[web.AppRunner] = None
+    try:
+        # Load configuration
+        if config is None:
+            config = Config.from_env()
+        logger.info("Configuration loaded successfully")
         
-        # Register middleware
-        dp.message.middleware(LoggingMiddleware())
+        metrics_runner = await start_metrics(config, config.metrics_port)
         
-        # Setup handlers
-        main_router = setup_handlers()
-        dp.include_router(main_router)
+        # Initialize bot
+        send_queue = create_send_queue(config)
+        bot = create_bot(config, send_queue)
         
-        logger.info("Bot handlers and middleware registered")
+        if config.bot_workers > 1:
+            # This process only receives updates; handlers run in workers
+            worker_pool = UpdateWorkerPool(
+                config.bot_workers,
+                run_worker,
+                (config,),
+                max_queue=config.bot_worker_queue_size,
+            )
+            worker_pool.start()
+            dp = create_dispatcher({})
+            dp.update.outer_middleware(ShardingMiddleware(worker_pool))
+            metrics.register_gauge(
+                "bot_worker_queue_depth",
+                "Updates queued for worker processes",
+                lambda: sum(depth or 0 for depth in worker_pool.depths())
+            )
+            metrics.register_counter(
+                "bot_worker_restarts", "Worker processes restarted after dying",
+                lambda: worker_pool.stats["restarts"]
+            )
+            metrics.register_counter(
+                "bot_worker_dropped_updates", "Updates dropped for a full queue or no live worker",
+                lambda: worker_pool.stats["dropped"]
+            )
+        else:
+            services = await create_services(config)
+            dp = create_dispatcher(services, config)
         
-        # Start polling
-        logger.info("Starting bot polling...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.bot_mode == "webhook":
+            await run_webhook(dp, bot, config)
+        else:
+            await run_polling(dp, bot)
         
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
         sys.exit(1)
+    
+    finally:
+        await close_services(services)
+        if send_queue is not None:
+            send_queue.close()
+        if bot is not None:
+            await bot.session.close()
+        if worker_pool is not None:
+            await asyncio.to_thread(worker_pool.close)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        bot_config = Config.from_env()
+    except ValueError as e:
+        print(f"Configuration error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    listener = setup_logging(bot_config)
+    try:
+        asyncio.run(main(bot_config))
     except KeyboardInterrupt:
-        logger.info("Bot stopped by user")
\ No newline at end of file
+        logger.info("Bot stopped by user")
+    finally:
+        listener.stop()
\ No newline at end of file
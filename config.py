@@ -2,7 +2,7 @@
 import os
 from pathlib import Path
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -18,6 +18,37 @@ else:
         load_dotenv(parent_env)
 
 
+# Prompt token budgets of known models, overridable with MODEL_TOKEN_BUDGETS
+DEFAULT_MODEL_TOKEN_BUDGETS = {
+    "openai/gpt-oss-120b": 16000,
+    "llama-3.2-90b-vision-preview": 4000,
+}
+
+
+def parse_token_budgets(value: str) -> dict[str, int]:
+    """
+    Parse per-model token budgets.
+    
+    Args:
+        value: Comma-separated ``model=tokens`` pairs
+        
+    Returns:
+        Budgets by model name
+        
+    Raises:
+        ValueError: If a pair is malformed
+    """
+    budgets = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        model, sep, tokens = pair.rpartition("=")
+        if not sep or not model.strip() or not tokens.strip().isdigit():
+            raise ValueError(f"MODEL_TOKEN_BUDGETS entry must be model=tokens, got {pair.strip()!r}")
+        budgets[model.strip()] = int(tokens)
+    return budgets
+
+
 @dataclass
 class Config:
     """Bot configuration."""
@@ -29,9 +60,59 @@ class Config:
     # Directories
     upload_directory: Path
     
+    # Update delivery: polling or webhook
+    telegram_api_url: Optional[str] = None
+    bot_mode: str = "polling"
+    webhook_url: str = ""
+    webhook_path: str = "/webhook"
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: Optional[str] = None
+    
+    # Worker processes (updates are sharded by user) and shared user state
+    bot_workers: int = 1
+    bot_worker_queue_size: int = 1000
+    bot_worker_max_in_flight: int = 500
+    redis_url: Optional[str] = None
+    
+    # Outbound send queue (Telegram flood limits, split between workers)
+    send_queue_enabled: bool = True
+    send_global_rate: float = 30.0
+    send_chat_rate: float = 1.0
+    send_group_rate_per_minute: int = 20
+    send_max_retries: int = 3
+    
+    # Prometheus metrics endpoint (0 disables; worker N listens on port + N + 1)
+    metrics_port: int = 0
+    metrics_host: str = "0.0.0.0"
+    
+    # Tracing: slow update reports and optional await-stack profiling
+    trace_slow_threshold: float = 10.0
+    trace_profile: bool = False
+    trace_profile_interval: float = 0.05
+    trace_dump_dir: Optional[Path] = None
+    
+    # Anonymized recording of incoming messages for load replay
+    record_updates_path: Optional[Path] = None
+    
+    # Logging (records are written by a background thread)
+    log_file: Optional[Path] = Path("bot.log")
+    log_level: str = "INFO"
+    log_format: str = "text"  # text or json
+    log_max_bytes: int = 10 * 1024 * 1024  # 10MB
+    log_backup_count: int = 5
+    log_rotate_when: Optional[str] = None
+    log_sampling: dict[str, float] = field(default_factory=dict)
+    
     # Image settings
-    max_image_size: int = 1024 * 1024  # 1MB
     max_image_resolution: tuple[int, int] = (1024, 1024)
+    image_pool_kind: str = "process"  # process, thread or inline
+    image_workers: int = 2
+    image_queue_size: int = 16
+    vision_cache_enabled: bool = True
+    vision_cache_ttl: int = 86400
+    vision_cache_size: int = 5000
+    vision_payload_cache_mb: int = 128
     
     # Text settings
     max_text_length: int = 200
@@ -41,10 +122,76 @@ class Config:
     vision_model: str = "llama-3.2-90b-vision-preview"
     text_model: str = "openai/gpt-oss-120b"
     
+    # Conversation store settings
+    conversation_max_users: int = 100_000
+    conversation_max_messages: int = 50
+    conversation_ttl: int = 86400
+    conversation_memory_limit_mb: int = 256
+    conversation_db_path: Optional[Path] = None
+    conversation_flush_interval: float = 5.0
+    
+    # History packing settings (prompt tokens per model, the global
+    # budget applies to models without their own)
+    history_token_budget: int = 6000
+    model_token_budgets: dict[str, int] = field(
+        default_factory=lambda: dict(DEFAULT_MODEL_TOKEN_BUDGETS)
+    )
+    
+    # Completion cache settings
+    completion_cache_enabled: bool = True
+    completion_cache_size: int = 2000
+    completion_cache_ttl: int = 3600
+    completion_cache_db_path: Optional[Path] = None
+    
+    # Streaming settings
+    stream_responses: bool = True
+    stream_edit_interval: float = 1.0
+    stream_max_edit_interval: float = 3.0
+    
+    # Groq client settings
+    groq_base_url: Optional[str] = None
+    groq_timeout: float = 60.0
+    groq_max_connections: int = 100
+    groq_max_keepalive_connections: int = 20
+    
+    # Groq scheduler settings (initial limits, recalibrated from headers)
+    groq_scheduler_enabled: bool = True
+    groq_requests_per_minute: int = 30
+    groq_tokens_per_minute: int = 8000
+    groq_completion_token_estimate: int = 1024
+    
+    # Groq resilience settings
+    groq_max_retries: int = 2
+    groq_retry_base_delay: float = 0.5
+    groq_retry_max_delay: float = 10.0
+    groq_hedge_enabled: bool = False
+    groq_hedge_min_delay: float = 2.0
+    text_fallback_models: list[str] = field(default_factory=list)
+    vision_fallback_models: list[str] = field(default_factory=list)
+    
     # Search settings
     search_region: str = "ru-ru"  # ru-ru for Russia, us-en for USA
     search_max_results: int = 5
     search_timeout: int = 10
+    search_cache_ttl: int = 600
+    search_cache_size: int = 1000
+    search_workers: int = 3
+    search_queue_size: int = 32
+    search_context_tokens: int = 1200  # 0 disables the cap
+    search_dedup_threshold: float = 0.6
+    
+    # Optional fetching of the pages behind top search results
+    page_fetch_enabled: bool = False
+    page_fetch_count: int = 3
+    page_fetch_deadline: float = 3.0
+    page_fetch_timeout: float = 10.0
+    page_fetch_connections: int = 20
+    page_fetch_max_bytes: int = 512 * 1024
+    page_text_max_chars: int = 1500
+    page_cache_size: int = 500
+    page_cache_ttl: int = 3600
+    page_workers: int = 2
+    page_pool_kind: str = "process"  # process, thread or inline
     
     # Instructions file
     instructions_file: Path = Path(".instruct")
@@ -63,20 +210,264 @@ class Config:
         upload_dir = Path(os.getenv("UPLOAD_DIRECTORY", "/tmp/bot_llama"))
         upload_dir.mkdir(parents=True, exist_ok=True)
         
+        # Optional update delivery settings
+        telegram_api_url = os.getenv("TELEGRAM_API_URL") or None
+        bot_mode = os.getenv("BOT_MODE", "polling").lower()
+        webhook_url = os.getenv("WEBHOOK_URL", "")
+        if bot_mode not in ("polling", "webhook"):
+            raise ValueError("BOT_MODE must be 'polling' or 'webhook'")
+        if bot_mode == "webhook" and not webhook_url:
+            raise ValueError("WEBHOOK_URL environment variable is required in webhook mode")
+        webhook_path = os.getenv("WEBHOOK_PATH", "/webhook")
+        webhook_host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+        webhook_port = int(os.getenv("WEBHOOK_PORT", "8080"))
+        webhook_secret = os.getenv("WEBHOOK_SECRET") or None
+        
+        # Optional scaling settings
+        bot_workers = int(os.getenv("BOT_WORKERS", "1"))
+        bot_worker_queue_size = int(os.getenv("BOT_WORKER_QUEUE_SIZE", "1000"))
+        bot_worker_max_in_flight = int(os.getenv("BOT_WORKER_MAX_IN_FLIGHT", "500"))
+        redis_url = os.getenv("REDIS_URL") or None
+        
+        # Optional send queue settings
+        send_queue_enabled = os.getenv("SEND_QUEUE_ENABLED", "true").lower() == "true"
+        send_global_rate = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+        send_chat_rate = float(os.getenv("SEND_CHAT_RATE", "1"))
+        send_group_rate_per_minute = int(os.getenv("SEND_GROUP_RATE_PER_MINUTE", "20"))
+        send_max_retries = int(os.getenv("SEND_MAX_RETRIES", "3"))
+        
+        # Optional metrics settings
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        metrics_host = os.getenv("METRICS_HOST", "0.0.0.0")
+        
+        # Optional tracing settings
+        trace_slow_threshold = float(os.getenv("TRACE_SLOW_THRESHOLD", "10"))
+        trace_profile = os.getenv("TRACE_PROFILE", "false").lower() == "true"
+        trace_profile_interval = float(os.getenv("TRACE_PROFILE_INTERVAL", "0.05"))
+        trace_dump = os.getenv("TRACE_DUMP_DIR")
+        trace_dump_dir = Path(trace_dump) if trace_dump else upload_dir / "traces"
+        
+        # Optional update recording
+        record_updates = os.getenv("RECORD_UPDATES")
+        record_updates_path = Path(record_updates) if record_updates else None
+        
+        # Optional logging settings
+        log_file_name = os.getenv("LOG_FILE", "bot.log")
+        log_file = Path(log_file_name) if log_file_name else None
+        log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        log_format = os.getenv("LOG_FORMAT", "text").lower()
+        if log_format not in ("text", "json"):
+            raise ValueError("LOG_FORMAT must be 'text' or 'json'")
+        log_max_bytes = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+        log_backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+        log_rotate_when = os.getenv("LOG_ROTATE_WHEN") or None
+        # Share of INFO records kept per logger, e.g. "aiogram.event=0.1"
+        log_sampling = {
+            name.strip(): max(0.0, min(1.0, float(rate)))
+            for name, rate in (
+                item.split("=", 1) for item in os.getenv("LOG_SAMPLING", "").split(",") if "=" in item
+            )
+        }
+        
+        # Optional image settings
+        image_pool_kind = os.getenv("IMAGE_POOL_KIND", "process")
+        image_workers = int(os.getenv("IMAGE_WORKERS", "2"))
+        image_queue_size = int(os.getenv("IMAGE_QUEUE_SIZE", "16"))
+        vision_cache_enabled = os.getenv("VISION_CACHE_ENABLED", "true").lower() == "true"
+        vision_cache_ttl = int(os.getenv("VISION_CACHE_TTL", "86400"))
+        vision_cache_size = int(os.getenv("VISION_CACHE_SIZE", "5000"))
+        vision_payload_cache_mb = int(os.getenv("VISION_PAYLOAD_CACHE_MB", "128"))
+        
         # Optional search settings
         search_region = os.getenv("SEARCH_REGION", "ru-ru")
         search_max_results = int(os.getenv("SEARCH_MAX_RESULTS", "5"))
         search_timeout = int(os.getenv("SEARCH_TIMEOUT", "10"))
+        search_cache_ttl = int(os.getenv("SEARCH_CACHE_TTL", "600"))
+        search_cache_size = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+        search_workers = int(os.getenv("SEARCH_WORKERS", "3"))
+        search_queue_size = int(os.getenv("SEARCH_QUEUE_SIZE", "32"))
+        search_context_tokens = int(os.getenv("SEARCH_CONTEXT_TOKENS", "1200"))
+        search_dedup_threshold = float(os.getenv("SEARCH_DEDUP_THRESHOLD", "0.6"))
+        
+        # Optional page fetching
+        page_fetch_enabled = os.getenv("PAGE_FETCH_ENABLED", "false").lower() == "true"
+        page_fetch_count = int(os.getenv("PAGE_FETCH_COUNT", "3"))
+        page_fetch_deadline = float(os.getenv("PAGE_FETCH_DEADLINE", "3.0"))
+        page_fetch_timeout = float(os.getenv("PAGE_FETCH_TIMEOUT", "10.0"))
+        page_fetch_connections = int(os.getenv("PAGE_FETCH_CONNECTIONS", "20"))
+        page_fetch_max_bytes = int(os.getenv("PAGE_FETCH_MAX_BYTES", str(512 * 1024)))
+        page_text_max_chars = int(os.getenv("PAGE_TEXT_MAX_CHARS", "1500"))
+        page_cache_size = int(os.getenv("PAGE_CACHE_SIZE", "500"))
+        page_cache_ttl = int(os.getenv("PAGE_CACHE_TTL", "3600"))
+        page_workers = int(os.getenv("PAGE_WORKERS", "2"))
+        page_pool_kind = os.getenv("PAGE_POOL_KIND", "process")
+        
+        # Optional conversation store settings
+        conversation_max_users = int(os.getenv("CONVERSATION_MAX_USERS", "100000"))
+        conversation_max_messages = int(os.getenv("CONVERSATION_MAX_MESSAGES", "50"))
+        conversation_ttl = int(os.getenv("CONVERSATION_TTL", "86400"))
+        conversation_memory_limit_mb = int(
+            os.getenv("CONVERSATION_MEMORY_LIMIT_MB", "256")
+        )
+        conversation_db = os.getenv("CONVERSATION_DB_PATH")
+        conversation_db_path = Path(conversation_db) if conversation_db else None
+        
+        # Optional history packing settings
+        history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+        model_token_budgets = {
+            **DEFAULT_MODEL_TOKEN_BUDGETS,
+            **parse_token_budgets(os.getenv("MODEL_TOKEN_BUDGETS", "")),
+        }
+        
+        # Optional completion cache settings
+        completion_cache_enabled = (
+            os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+        )
+        completion_cache_size = int(os.getenv("COMPLETION_CACHE_SIZE", "2000"))
+        completion_cache_ttl = int(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+        completion_cache_db = os.getenv("COMPLETION_CACHE_DB_PATH")
+        completion_cache_db_path = Path(completion_cache_db) if completion_cache_db else None
+        
+        # Optional streaming settings
+        stream_responses = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+        stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+        stream_max_edit_interval = float(os.getenv("STREAM_MAX_EDIT_INTERVAL", "3.0"))
+        
+        # Optional Groq client settings
+        groq_base_url = os.getenv("GROQ_BASE_URL") or None
+        groq_timeout = float(os.getenv("GROQ_TIMEOUT", "60"))
+        groq_max_connections = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+        groq_max_keepalive_connections = int(
+            os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "20")
+        )
+        
+        # Optional Groq scheduler settings
+        groq_scheduler_enabled = (
+            os.getenv("GROQ_SCHEDULER_ENABLED", "true").lower() == "true"
+        )
+        groq_requests_per_minute = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+        groq_tokens_per_minute = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "8000"))
+        groq_completion_token_estimate = int(
+            os.getenv("GROQ_COMPLETION_TOKEN_ESTIMATE", "1024")
+        )
+        
+        # Optional Groq resilience settings
+        groq_max_retries = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+        groq_retry_base_delay = float(os.getenv("GROQ_RETRY_BASE_DELAY", "0.5"))
+        groq_retry_max_delay = float(os.getenv("GROQ_RETRY_MAX_DELAY", "10.0"))
+        groq_hedge_enabled = os.getenv("GROQ_HEDGE_ENABLED", "false").lower() == "true"
+        groq_hedge_min_delay = float(os.getenv("GROQ_HEDGE_MIN_DELAY", "2.0"))
+        text_fallback_models = [
+            m.strip() for m in os.getenv("TEXT_FALLBACK_MODELS", "").split(",") if m.strip()
+        ]
+        vision_fallback_models = [
+            m.strip() for m in os.getenv("VISION_FALLBACK_MODELS", "").split(",") if m.strip()
+        ]
         
         return cls(
             telegram_token=telegram_token,
             groq_api_key=groq_api_key,
             upload_directory=upload_dir,
+            telegram_api_url=telegram_api_url,
+            bot_mode=bot_mode,
+            webhook_url=webhook_url,
+            webhook_path=webhook_path,
+            webhook_host=webhook_host,
+            webhook_port=webhook_port,
+            webhook_secret=webhook_secret,
+            bot_workers=bot_workers,
+            bot_worker_queue_size=bot_worker_queue_size,
+            bot_worker_max_in_flight=bot_worker_max_in_flight,
+            redis_url=redis_url,
+            send_queue_enabled=send_queue_enabled,
+            send_global_rate=send_global_rate,
+            send_chat_rate=send_chat_rate,
+            send_group_rate_per_minute=send_group_rate_per_minute,
+            send_max_retries=send_max_retries,
+            metrics_port=metrics_port,
+            metrics_host=metrics_host,
+            trace_slow_threshold=trace_slow_threshold,
+            trace_profile=trace_profile,
+            trace_profile_interval=trace_profile_interval,
+            trace_dump_dir=trace_dump_dir,
+            record_updates_path=record_updates_path,
+            log_file=log_file,
+            log_level=log_level,
+            log_format=log_format,
+            log_max_bytes=log_max_bytes,
+            log_backup_count=log_backup_count,
+            log_rotate_when=log_rotate_when,
+            log_sampling=log_sampling,
+            image_pool_kind=image_pool_kind,
+            image_workers=image_workers,
+            image_queue_size=image_queue_size,
+            vision_cache_enabled=vision_cache_enabled,
+            vision_cache_ttl=vision_cache_ttl,
+            vision_cache_size=vision_cache_size,
+            vision_payload_cache_mb=vision_payload_cache_mb,
             search_region=search_region,
             search_max_results=search_max_results,
             search_timeout=search_timeout,
+            search_cache_ttl=search_cache_ttl,
+            search_cache_size=search_cache_size,
+            search_workers=search_workers,
+            search_queue_size=search_queue_size,
+            search_context_tokens=search_context_tokens,
+            search_dedup_threshold=search_dedup_threshold,
+            page_fetch_enabled=page_fetch_enabled,
+            page_fetch_count=page_fetch_count,
+            page_fetch_deadline=page_fetch_deadline,
+            page_fetch_timeout=page_fetch_timeout,
+            page_fetch_connections=page_fetch_connections,
+            page_fetch_max_bytes=page_fetch_max_bytes,
+            page_text_max_chars=page_text_max_chars,
+            page_cache_size=page_cache_size,
+            page_cache_ttl=page_cache_ttl,
+            page_workers=page_workers,
+            page_pool_kind=page_pool_kind,
+            conversation_max_users=conversation_max_users,
+            conversation_max_messages=conversation_max_messages,
+            conversation_ttl=conversation_ttl,
+            conversation_memory_limit_mb=conversation_memory_limit_mb,
+            conversation_db_path=conversation_db_path,
+            history_token_budget=history_token_budget,
+            model_token_budgets=model_token_budgets,
+            completion_cache_enabled=completion_cache_enabled,
+            completion_cache_size=completion_cache_size,
+            completion_cache_ttl=completion_cache_ttl,
+            completion_cache_db_path=completion_cache_db_path,
+            stream_responses=stream_responses,
+            stream_edit_interval=stream_edit_interval,
+            stream_max_edit_interval=stream_max_edit_interval,
+            groq_base_url=groq_base_url,
+            groq_timeout=groq_timeout,
+            groq_max_connections=groq_max_connections,
+            groq_max_keepalive_connections=groq_max_keepalive_connections,
+            groq_scheduler_enabled=groq_scheduler_enabled,
+            groq_requests_per_minute=groq_requests_per_minute,
+            groq_tokens_per_minute=groq_tokens_per_minute,
+            groq_completion_token_estimate=groq_completion_token_estimate,
+            groq_max_retries=groq_max_retries,
+            groq_retry_base_delay=groq_retry_base_delay,
+            groq_retry_max_delay=groq_retry_max_delay,
+            groq_hedge_enabled=groq_hedge_enabled,
+            groq_hedge_min_delay=groq_hedge_min_delay,
+            text_fallback_models=text_fallback_models,
+            vision_fallback_models=vision_fallback_models,
         )
     
+    def token_budget(self, model: str) -> int:
+        """
+        Get prompt token budget for conversation history.
+        
+        Args:
+            model: Model name
+            
+        Returns:
+            Budget configured for the model, or the global history budget
+        """
+        return self.model_token_budgets.get(model, self.history_token_budget)
+    
     def load_instructions(self) -> str:
         """Load model instructions from file."""
         try:
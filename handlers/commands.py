@@ -6,14 +6,12 @@ from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
 
 from keyboards.main_keyboard import get_main_keyboard
+from services.user_state import UserSettings
 
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Global state for reasoning (in production, use FSM or database)
-reasoning_state = {"enabled": True}
-
 
 @router.message(CommandStart())
 async def cmd_start(message: Message) -> None:
@@ -26,29 +24,19 @@ async def cmd_start(message: Message) -> None:
 
 
 @router.message(Command("reasoning"))
-async def cmd_reasoning(message: Message) -> None:
+async def cmd_reasoning(message: Message, user_settings: UserSettings) -> None:
     """Handle /reasoning command."""
-    reasoning_state["enabled"] = not reasoning_state["enabled"]
-    status = "включен" if reasoning_state["enabled"] else "выключен"
-    
-    await message.reply(
-        f"Режим рассуждений теперь {status}.",
-        reply_markup=get_main_keyboard()
-    )
+    await toggle_reasoning(message, user_settings)
 
 
 @router.message(F.text == "Reasoning On/Off")
-async def toggle_reasoning(message: Message) -> None:
+async def toggle_reasoning(message: Message, user_settings: UserSettings) -> None:
     """Handle reasoning toggle button."""
-    reasoning_state["enabled"] = not reasoning_state["enabled"]
-    status = "включен" if reasoning_state["enabled"] else "выключен"
+    enabled = await user_settings.toggle(message.from_user.id, "reasoning")
+    status = "включен" if enabled else "выключен"
     
     await message.reply(
         f"Режим рассуждений теперь {status}.",
         reply_markup=get_main_keyboard()
     )
 
-
-def is_reasoning_enabled() -> bool:
-    """Check if reasoning is enabled."""
-    return reasoning_state["enabled"]
\ No newline at end of file
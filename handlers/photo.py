@@ -1,16 +1,24 @@
 """Photo message handlers."""
+import asyncio
+import html
+import io
 import logging
-from pathlib import Path
+from typing import Optional, Set
 
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.enums import ParseMode
+from aiogram.types import Message, PhotoSize
 from aiogram.exceptions import TelegramBadRequest
 
 from services.groq_service import GroqService
-from utils.image_processor import ImageProcessor
+from services.vision_cache import VisionCache
+from utils.image_processor import ImageProcessor, compress_image
+from utils.worker_pool import WorkerPool
+from utils.markdown_render import render_markdown
 from utils.message_splitter import MessageSplitter
+from utils.metrics import metrics
 from keyboards.main_keyboard import get_main_keyboard
-from config import get_config
+from config import Config
 
 
 logger = logging.getLogger(__name__)
@@ -32,78 +40,190 @@ async def safe_delete_message(message: Message) -> None:
         logger.error(f"Unexpected error deleting message: {e}")
 
 
-@router.message(F.photo)
-async def handle_photo(message: Message) -> None:
-    """Handle photo messages."""
-    config = get_config()
-    user_text = message.caption if message.caption else "Проанализируй это изображение."
+# Status messages being deleted in the background
+_deletions: Set[asyncio.Task] = set()
+
+
+def delete_later(message: Message) -> None:
+    """
+    Delete a message without waiting for it.
+    
+    Deletes go out at the lowest send priority, so the answer is sent
+    first and the status message is removed after it.
+    
+    Args:
+        message: Message to delete
+    """
+    task = asyncio.get_running_loop().create_task(safe_delete_message(message))
+    _deletions.add(task)
+    task.add_done_callback(_deletions.discard)
+
+
+async def prepare_image(
+    message: Message,
+    photo: PhotoSize,
+    image_pool: WorkerPool,
+    config: Config
+) -> str:
+    """
+    Download and compress a photo into a base64 payload.
+    
+    Args:
+        message: Message with the photo
+        photo: Photo size to download
+        image_pool: Image worker pool
+        config: Bot configuration
+        
+    Returns:
+        Base64 encoded image
+    """
+    # Download photo into memory (the Bot API serves files up to 20MB)
+    buffer = io.BytesIO()
+    with metrics.track("download"):
+        await message.bot.download(
+            file=photo.file_id,
+            destination=buffer
+        )
+    
+    # Compress image to the base64 budget in the worker pool
+    image_processor = ImageProcessor(config)
+    with metrics.track("compress"):
+        compression = await image_pool.run(
+            compress_image,
+            buffer.getvalue(),
+            image_processor.max_bytes,
+            config.max_image_resolution
+        )
+    metrics.record_compression(compression.passes, len(compression.data))
+    logger.info(
+        f"Photo {photo.file_unique_id}: {compression.original_size} -> "
+        f"{len(compression.data)} bytes, {compression.passes} passes, "
+        f"quality {compression.quality}, fits={compression.fits}"
+    )
+    
+    # Encode image
+    with metrics.track("encode"):
+        return image_processor.encode_bytes(compression.data)
+
+
+async def analyze_photo(
+    message: Message,
+    user_text: str,
+    groq_service: GroqService,
+    image_pool: WorkerPool,
+    vision_cache: Optional[VisionCache],
+    config: Config
+) -> str:
+    """
+    Analyze the largest photo of a message, reusing cached work.
     
-    # Get largest photo
+    Args:
+        message: Message with the photo
+        user_text: User prompt
+        groq_service: Groq service
+        image_pool: Image worker pool
+        vision_cache: Optional vision cache
+        config: Bot configuration
+        
+    Returns:
+        Model response
+    """
     photo = message.photo[-1]
+    # Key the cache on the prompt the model actually gets
+    user_text = groq_service.clip_prompt(user_text)
+    
+    if vision_cache is None:
+        base64_image = await prepare_image(message, photo, image_pool, config)
+        return await groq_service.analyze_image(
+            base64_image,
+            user_text,
+            user_id=message.from_user.id
+        )
+    
+    key = VisionCache.result_key(
+        photo.file_unique_id,
+        user_text,
+        groq_service.config.vision_model,
+        groq_service.instructions_version
+    )
+    result = vision_cache.get_result(key)
+    if result is not None:
+        logger.info(f"Vision cache hit for {photo.file_unique_id}")
+        return result
+    
+    async def _analyze() -> str:
+        base64_image = vision_cache.get_payload(photo.file_unique_id)
+        if base64_image is None:
+            base64_image = await prepare_image(message, photo, image_pool, config)
+            vision_cache.set_payload(photo.file_unique_id, base64_image)
+        
+        analysis = await groq_service.analyze_image(
+            base64_image,
+            user_text,
+            user_id=message.from_user.id
+        )
+        vision_cache.set_result(key, analysis)
+        return analysis
+    
+    # Identical photos sent at the same time share one analysis
+    return await vision_cache.flights.do(key, _analyze)
+
+
+@router.message(F.photo)
+async def handle_photo(
+    message: Message,
+    config: Config,
+    groq_service: GroqService,
+    image_pool: WorkerPool,
+    vision_cache: Optional[VisionCache] = None
+) -> None:
+    """
+    Handle photo messages.
     
-    # Generate file paths
-    file_name = f"{message.from_user.id}_{photo.file_unique_id}.jpg"
-    file_path = config.upload_directory / file_name
-    compressed_path = config.upload_directory / f"compressed_{file_name}"
+    Args:
+        message: Incoming message
+        config: Bot configuration injected by the dispatcher
+        groq_service: Shared Groq service injected by the dispatcher
+        image_pool: Shared image worker pool injected by the dispatcher
+        vision_cache: Shared vision cache injected by the dispatcher
+    """
+    user_text = message.caption if message.caption else "Проанализируй это изображение."
     
     # Send status message
     status_msg = await message.answer("Запрос получен, анализирую...")
     
     try:
-        # Download photo
-        await message.bot.download(
-            file=photo.file_id,
-            destination=file_path
+        result = await analyze_photo(
+            message,
+            user_text,
+            groq_service,
+            image_pool,
+            vision_cache,
+            config
         )
         
-        # Process image
-        image_processor = ImageProcessor()
-        image_processor.reduce_image_size(file_path, compressed_path)
-        
-        # Encode image
-        base64_image = image_processor.encode_image(compressed_path)
-        
-        # Analyze image
-        groq_service = GroqService()
-        result = await groq_service.analyze_image(base64_image, user_text)
-        
-        # Delete status message safely
-        await safe_delete_message(status_msg)
-        
-        # Split message if too long and send
-        message_chunks = MessageSplitter.split_message(result)
+        # Render to Telegram HTML, split if too long and send
+        message_chunks = MessageSplitter.split_message(
+            render_markdown(result) or "Пустой ответ.",
+            parse_mode=ParseMode.HTML
+        )
         
         for idx, chunk in enumerate(message_chunks):
-            try:
-                # Only add keyboard to the last message
-                keyboard = get_main_keyboard() if idx == len(message_chunks) - 1 else None
-                
-                await message.answer(chunk, reply_markup=keyboard)
-            except TelegramBadRequest as e:
-                logger.error(f"Failed to send chunk {idx + 1}: {e}")
-                await message.answer(
-                    f"Часть {idx + 1}: [Не удалось отправить]",
-                    reply_markup=keyboard
-                )
+            # Only add keyboard to the last message
+            keyboard = get_main_keyboard() if idx == len(message_chunks) - 1 else None
+            await message.answer(chunk, parse_mode=ParseMode.HTML, reply_markup=keyboard)
         
     except ValueError as ve:
         logger.error(f"Validation error: {ve}")
-        await safe_delete_message(status_msg)
-        await message.reply(f"Ошибка: {ve}", reply_markup=get_main_keyboard())
+        await message.reply(f"Ошибка: {html.escape(str(ve))}", reply_markup=get_main_keyboard())
         
     except Exception as e:
         logger.error(f"Error analyzing image: {e}", exc_info=True)
-        await safe_delete_message(status_msg)
         await message.reply(
             "Произошла ошибка при анализе изображения.",
             reply_markup=get_main_keyboard()
         )
-        
+    
     finally:
-        # Cleanup files
-        for path in [file_path, compressed_path]:
-            if path.exists():
-                try:
-                    path.unlink()
-                except Exception as e:
-                    logger.warning(f"Could not delete file {path}: {e}")
\ No newline at end of file
+        # Only after the answer, which has a higher send priority
+        delete_later(status_msg)
\ No newline at end of file
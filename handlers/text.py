@@ -1,6 +1,9 @@
 """Text message handlers."""
+import asyncio
+import html
 import logging
 import re
+from typing import AsyncIterator, Optional, Set
 
 from aiogram import Router, F
 from aiogram.types import Message
@@ -8,19 +11,22 @@ from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramBadRequest
 
 from services.groq_service import GroqService
+from services.groq_scheduler import Priority
+from services.page_fetcher import PageFetcher
 from services.search_service import SearchService
+from services.conversation_store import ConversationStore, pack_messages
+from services.user_state import UserSettings
 from keyboards.main_keyboard import get_main_keyboard
-from handlers.commands import is_reasoning_enabled
+from utils.markdown_render import render_markdown
 from utils.message_splitter import MessageSplitter
-from config import get_config
+from utils.stream_editor import StreamingReply
+from utils.tokens import count_messages_tokens
+from config import Config
 
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Conversation history (in production, use database or FSM)
-conversation_history = {}
-
 
 async def safe_delete_message(message: Message) -> None:
     """
@@ -37,110 +43,213 @@ async def safe_delete_message(message: Message) -> None:
         logger.error(f"Unexpected error deleting message: {e}")
 
 
+# Status messages being deleted in the background
+_deletions: Set[asyncio.Task] = set()
+
+
+def delete_later(message: Message) -> None:
+    """
+    Delete a message without waiting for it.
+    
+    Deletes go out at the lowest send priority, so the answer is sent
+    first and the status message is removed after it.
+    
+    Args:
+        message: Message to delete
+    """
+    task = asyncio.get_running_loop().create_task(safe_delete_message(message))
+    _deletions.add(task)
+    task.add_done_callback(_deletions.discard)
+
+
+def visible_text(text: str, reasoning: bool, partial: bool = False) -> str:
+    """
+    Get the part of a model response that should be shown to the user.
+    
+    Args:
+        text: Model response
+        reasoning: Whether the user wants to see thinking blocks
+        partial: Whether the response is still being streamed
+        
+    Returns:
+        Response without thinking blocks when reasoning is disabled
+    """
+    if reasoning:
+        return text
+    
+    # Remove thinking tags
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    
+    # Hide a thinking block that is still being generated
+    if partial and '<think>' in text:
+        text = text[:text.index('<think>')]
+    
+    return text.strip()
+
+
+async def stream_response(
+    status_msg: Message,
+    tokens: AsyncIterator[str],
+    reasoning: bool,
+    config: Config
+) -> str:
+    """
+    Stream model output into the status message.
+    
+    Args:
+        status_msg: Status message to edit progressively
+        tokens: Content deltas from the model
+        reasoning: Whether the user wants to see thinking blocks
+        config: Bot configuration with the edit intervals
+        
+    Returns:
+        Full model response
+    """
+    reply = StreamingReply(
+        status_msg,
+        min_interval=config.stream_edit_interval,
+        max_interval=config.stream_max_edit_interval
+    )
+    
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        # Joining and filtering the whole text is only worth it when an edit is due
+        if reply.due:
+            await reply.update(visible_text("".join(parts), reasoning, partial=True))
+    
+    response_content = "".join(parts)
+    await reply.finish(visible_text(response_content, reasoning) or "Пустой ответ.")
+    return response_content
+
+
+async def send_chunks(message: Message, text: str) -> None:
+    """
+    Render a response to Telegram HTML, split it and send it.
+    
+    Args:
+        message: Message to answer
+        text: Response text
+    """
+    message_chunks = MessageSplitter.split_message(
+        render_markdown(text) or "Пустой ответ.",
+        parse_mode=ParseMode.HTML
+    )
+    
+    for idx, chunk in enumerate(message_chunks):
+        # Only add keyboard to the last message
+        keyboard = get_main_keyboard() if idx == len(message_chunks) - 1 else None
+        await message.answer(chunk, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+
 @router.message(F.text)
-async def handle_text(message: Message) -> None:
-    """Handle text messages."""
+async def handle_text(
+    message: Message,
+    config: Config,
+    groq_service: GroqService,
+    conversation_store: ConversationStore,
+    search_service: SearchService,
+    user_settings: UserSettings,
+    page_fetcher: Optional[PageFetcher] = None
+) -> None:
+    """
+    Handle text messages.
+    
+    Args:
+        message: Incoming message
+        config: Bot configuration injected by the dispatcher
+        groq_service: Shared Groq service injected by the dispatcher
+        conversation_store: Shared conversation store injected by the dispatcher
+        search_service: Shared search service injected by the dispatcher
+        user_settings: Per-user settings injected by the dispatcher
+        page_fetcher: Optional page fetcher injected by the dispatcher
+    """
     user_id = message.from_user.id
     text = " ".join(message.text.split())
     
-    # Initialize user's conversation history
-    if user_id not in conversation_history:
-        conversation_history[user_id] = []
-    
     # Add user message to history
-    conversation_history[user_id].append({
-        "role": "user",
-        "content": text
-    })
+    await conversation_store.append(user_id, "user", text)
     
-    # Keep only last 6 messages
-    if len(conversation_history[user_id]) > 6:
-        conversation_history[user_id] = conversation_history[user_id][-6:]
+    history = await conversation_store.get_history(user_id)
     
-    # Send initial response
+    # Send initial response (edited in place when streaming)
     status_msg = await message.answer("Запрос получен, анализирую...")
     
     try:
-        groq_service = GroqService()
-        config = get_config()
+        reasoning = await user_settings.get(user_id, "reasoning")
+        budget = config.token_budget(config.text_model)
+        priority = Priority.TEXT
         
         # Check if query ends with '?' - perform web search
         if text.strip().endswith('?'):
             logger.info(f"Performing web search for query: {text}")
             
-            # Initialize SearchService with config settings
-            search_service = SearchService(
-                max_results=config.search_max_results,
-                region=config.search_region,
-                timeout=config.search_timeout
-            )
             search_results = await search_service.search(text)
             
+            # Snippets are short; add page text of the top results if enabled
+            if search_results and page_fetcher is not None:
+                search_results = await page_fetcher.enrich(search_results)
+            
             if search_results:
-                # Get AI response with search context
-                response_content = await groq_service.analyze_with_search(
+                # Build request with search context, then fill the rest of
+                # the token budget with earlier conversation
+                search_messages = groq_service.build_search_messages(
                     query=text,
                     search_results=search_results,
-                    conversation_history=conversation_history[user_id][:-1]
+                    conversation_history=[]
                 )
+                history_budget = budget - count_messages_tokens(search_messages)
+                priority = Priority.SEARCH
+                request_messages = pack_messages(
+                    history[:-1],
+                    history_budget,
+                    keep_last=False
+                ) + search_messages
             else:
-                response_content = (
-                    "Не удалось получить результаты поиска. "
-                    "Попробуйте изменить запрос или повторить позже."
-                )
+                request_messages = None
         else:
-            # Regular text analysis
-            response_content = await groq_service.analyze_text(
-                conversation_history[user_id]
-            )
-        
-        # Process response based on reasoning mode
-        if is_reasoning_enabled():
-            final_response = response_content
-        else:
-            # Remove thinking tags
-            final_response = re.sub(
-                r'<think>.*?</think>',
-                '',
-                response_content,
-                flags=re.DOTALL
-            ).strip()
-        
-        # Delete status message safely
-        await safe_delete_message(status_msg)
+            # Regular text analysis with history packed into the budget
+            request_messages = pack_messages(history, budget)
         
-        # Split message if too long and send
-        message_chunks = MessageSplitter.split_message(final_response)
+        # Responses that do not depend on earlier turns may come from cache
+        use_cache = request_messages is not None and len(request_messages) == 1
         
-        for idx, chunk in enumerate(message_chunks):
-            try:
-                # Only add keyboard to the last message
-                keyboard = get_main_keyboard() if idx == len(message_chunks) - 1 else None
-                
-                await message.answer(
-                    chunk,
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=keyboard
+        if request_messages is not None and config.stream_responses:
+            response_content = await stream_response(
+                status_msg,
+                groq_service.stream_text(
+                    request_messages,
+                    use_cache=use_cache,
+                    user_id=user_id,
+                    priority=priority
+                ),
+                reasoning,
+                config
+            )
+        else:
+            if request_messages is None:
+                response_content = (
+                    "Не удалось получить результаты поиска. "
+                    "Попробуйте изменить запрос или повторить позже."
                 )
-            except TelegramBadRequest as e:
-                logger.error(f"Failed to send chunk {idx + 1} with Markdown: {e}")
-                # Try without markdown parsing
-                await message.answer(
-                    chunk,
-                    reply_markup=keyboard
+            else:
+                response_content = await groq_service.analyze_text(
+                    request_messages,
+                    use_cache=use_cache,
+                    user_id=user_id,
+                    priority=priority
                 )
+            
+            await send_chunks(message, visible_text(response_content, reasoning))
+            delete_later(status_msg)
         
         # Add assistant response to history
-        conversation_history[user_id].append({
-            "role": "assistant",
-            "content": response_content
-        })
+        await conversation_store.append(user_id, "assistant", response_content)
         
     except Exception as e:
         logger.error(f"Error handling text message: {e}", exc_info=True)
-        await safe_delete_message(status_msg)
         
-        error_message = f"Произошла ошибка при обработке запроса: {str(e)}"
+        error_message = f"Произошла ошибка при обработке запроса: {html.escape(str(e))}"
         
         try:
             await message.reply(
@@ -149,4 +258,6 @@ async def handle_text(message: Message) -> None:
             )
         except TelegramBadRequest:
             # If reply fails, just send a simple message
-            await message.answer("Произошла ошибка при обработке запроса.")
\ No newline at end of file
+            await message.answer("Произошла ошибка при обработке запроса.")
+        finally:
+            delete_later(status_msg)
\ No newline at end of file
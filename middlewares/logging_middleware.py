@@ -1,10 +1,12 @@
 """Logging middleware."""
 import logging
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message
 
+from utils.update_recorder import UpdateRecorder
+
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +14,15 @@ logger = logging.getLogger(__name__)
 class LoggingMiddleware(BaseMiddleware):
     """Middleware for logging incoming messages."""
     
+    def __init__(self, recorder: Optional[UpdateRecorder] = None):
+        """
+        Initialize middleware.
+        
+        Args:
+            recorder: Optional recorder of anonymized message streams
+        """
+        self.recorder = recorder
+    
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -25,5 +36,7 @@ class LoggingMiddleware(BaseMiddleware):
                 f"Message from {user.id} (@{user.username}): "
                 f"{event.text or '[media]'}"
             )
+            if self.recorder is not None:
+                self.recorder.record(event)
         
         return await handler(event, data)
\ No newline at end of file
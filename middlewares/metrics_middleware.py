@@ -0,0 +1,43 @@
+"""Metrics middlewares for updates and Bot API requests."""
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.types import TelegramObject
+
+from utils.metrics import metrics
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Outer update middleware measuring the whole handling of an update."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Process event through middleware."""
+        with metrics.track("update"):
+            return await handler(event, data)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware measuring outgoing Bot API requests."""
+    
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Response:
+        """Send request, timing everything except long polling."""
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        
+        with metrics.track("telegram_send"):
+            return await make_request(bot, method)
@@ -0,0 +1,73 @@
+"""Route outgoing chat calls through the send queue."""
+from typing import Hashable, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import (
+    DeleteMessage,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    Response,
+    SendChatAction,
+    TelegramMethod,
+)
+
+from services.send_queue import SendPriority, SendQueue
+
+
+_EDITS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+_COSMETIC = (DeleteMessage, SendChatAction)
+
+
+def classify(method: TelegramMethod) -> tuple:
+    """
+    Get priority and coalescing key of a call.
+
+    Args:
+        method: Bot API method
+
+    Returns:
+        Priority and key (None if the call must not be coalesced)
+    """
+    if isinstance(method, _EDITS):
+        key: Optional[Hashable] = (type(method).__name__, method.message_id)
+        return SendPriority.EDIT, key
+    if isinstance(method, _COSMETIC):
+        return SendPriority.COSMETIC, None
+    return SendPriority.REPLY, None
+
+
+class SendQueueMiddleware(BaseRequestMiddleware):
+    """Bot session middleware queueing every call made in a chat."""
+
+    def __init__(self, queue: SendQueue):
+        """
+        Initialize middleware.
+
+        Args:
+            queue: Shared send queue
+        """
+        self.queue = queue
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Response:
+        """Send chat calls through the queue, anything else directly."""
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority, key = classify(method)
+        return await self.queue.submit(
+            chat_id,
+            lambda: make_request(bot, method),
+            priority,
+            key
+        )
@@ -0,0 +1,38 @@
+"""Middleware forwarding updates to sharded worker processes."""
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services.update_workers import UpdateWorkerPool, shard_key
+
+
+class ShardingMiddleware(BaseMiddleware):
+    """
+    Outer update middleware of the ingress process.
+    
+    Serializes every update and queues it for the worker owning its user
+    instead of handling it locally.
+    """
+    
+    def __init__(self, pool: UpdateWorkerPool):
+        """
+        Initialize middleware.
+        
+        Args:
+            pool: Worker processes handling updates
+        """
+        self.pool = pool
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Forward update to its worker without calling the handler."""
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        
+        await self.pool.submit(shard_key(event), event.model_dump_json(exclude_unset=True))
+        return None
@@ -0,0 +1,90 @@
+"""Tracing middleware."""
+import asyncio
+import logging
+from typing import Callable, Dict, Any, Awaitable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.tracing import SlowUpdateProfiler, Span, end_trace, start_trace
+
+
+logger = logging.getLogger(__name__)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Outer update middleware opening a trace per update.
+    
+    The update ID becomes the correlation ID of every log record written
+    while the update is handled, and service calls are recorded as child
+    spans. Updates slower than ``slow_threshold`` are logged with their
+    span tree and, with a profiler, dumped with sampled await stacks.
+    """
+    
+    def __init__(
+        self,
+        slow_threshold: float = 10.0,
+        profiler: Optional[SlowUpdateProfiler] = None
+    ):
+        """
+        Initialize middleware.
+        
+        Args:
+            slow_threshold: Duration in seconds after which an update is slow
+                (0 disables slow update reports)
+            profiler: Optional profiler for slow updates
+        """
+        self.slow_threshold = slow_threshold
+        self.profiler = profiler
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Process event inside a trace."""
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        
+        cid = f"u{event.update_id}"
+        user = getattr(event.event, "from_user", None)
+        trace, tokens = start_trace(
+            cid,
+            "update",
+            type=event.event_type,
+            user_id=user.id if user else None
+        )
+        watch = None
+        task = asyncio.current_task()
+        if self.profiler is not None and task is not None:
+            watch = self.profiler.watch(task)
+        
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            trace.finish(error)
+            if watch is not None:
+                self.profiler.stop(watch)
+            try:
+                if self.slow_threshold and trace.duration >= self.slow_threshold:
+                    await self._report_slow(cid, trace, watch)
+            finally:
+                end_trace(tokens)
+    
+    async def _report_slow(self, cid: str, trace: Span, watch: Any) -> None:
+        """Log span tree of a slow update and dump its profile."""
+        logger.warning(f"Slow update took {trace.duration:.1f}s:\n{trace.format()}")
+        
+        if watch is None or not watch.samples:
+            return
+        try:
+            path = await asyncio.to_thread(self.profiler.dump, cid, trace, watch)
+            logger.warning(f"Slow update profile written to {path}")
+        except Exception as e:
+            logger.error(f"Failed to write slow update profile: {e}")
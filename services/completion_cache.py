@@ -0,0 +1,201 @@
+"""Exact-match cache for deterministic Groq completions."""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from utils.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCompletionStore:
+    """On-disk completion tier (blocking, run in a thread)."""
+
+    def __init__(self, db_path: Path):
+        """
+        Initialize SQLite store.
+
+        Args:
+            db_path: Path to the database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, "
+            "content TEXT NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a completion that has not expired.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Completion text or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM completions WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, content: str, ttl: float) -> None:
+        """
+        Store a completion.
+
+        Args:
+            key: Cache key
+            content: Completion text
+            ttl: Time to live in seconds
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, content, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, content, time.time() + ttl)
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired completions.
+
+        Returns:
+            Number of deleted rows
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM completions WHERE expires_at <= ?",
+                (time.time(),)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Close database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class CompletionCache:
+    """
+    Two-tier cache of model responses keyed by the exact request.
+
+    The in-memory LRU tier is checked first; the optional SQLite tier
+    survives restarts and promotes its hits back into memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        ttl: float = 3600,
+        store: Optional[SQLiteCompletionStore] = None
+    ):
+        """
+        Initialize completion cache.
+
+        Args:
+            max_entries: Maximum number of in-memory entries
+            ttl: Default time to live in seconds
+            store: Optional on-disk tier
+        """
+        self.ttl = ttl
+        self.memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.store = store
+        self.stats = {"disk_hits": 0, "disk_errors": 0}
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        instructions_version: str
+    ) -> str:
+        """
+        Build cache key for a request.
+
+        Args:
+            model: Model name
+            messages: Chat messages
+            temperature: Model temperature
+            instructions_version: Hash of the instructions in use
+
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = json.dumps(
+            [model, messages, temperature, instructions_version],
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Get a cached completion.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Completion text or None
+        """
+        content = self.memory.get(key)
+        if content is not None or self.store is None:
+            return content
+
+        try:
+            content = await asyncio.to_thread(self.store.get, key)
+        except Exception as e:
+            self.stats["disk_errors"] += 1
+            logger.warning(f"Completion cache read failed: {e}")
+            return None
+
+        if content is not None:
+            self.stats["disk_hits"] += 1
+            self.memory.set(key, content)
+        return content
+
+    async def set(self, key: str, content: str, ttl: Optional[float] = None) -> None:
+        """
+        Store a completion.
+
+        Args:
+            key: Cache key
+            content: Completion text
+            ttl: Time to live in seconds (default TTL if omitted)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, content, ttl)
+
+        if self.store is None:
+            return
+
+        try:
+            await asyncio.to_thread(self.store.set, key, content, ttl)
+        except Exception as e:
+            self.stats["disk_errors"] += 1
+            logger.warning(f"Completion cache write failed: {e}")
+
+    async def close(self) -> None:
+        """Purge expired rows and close the on-disk tier."""
+        if self.store is not None:
+            await asyncio.to_thread(self.store.purge_expired)
+            await asyncio.to_thread(self.store.close)
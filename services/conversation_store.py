@@ -0,0 +1,395 @@
+"""Bounded conversation history store with optional SQLite persistence."""
+import asyncio
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable, Protocol, Tuple
+
+from utils.tokens import estimate_message_tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Fixed per-message overhead used for memory accounting (object header,
+# slots and list pointer), added to the length of the content
+MESSAGE_OVERHEAD = 80
+
+
+@dataclass(slots=True)
+class ChatMessage:
+    """Single conversation message."""
+
+    role: str
+    content: str
+    tokens: int = -1
+
+    def __post_init__(self):
+        """Intern role and count tokens once when the message is stored."""
+        self.role = sys.intern(self.role)
+        if self.tokens < 0:
+            self.tokens = estimate_message_tokens(self.content)
+
+    def as_dict(self) -> Dict[str, str]:
+        """Convert message to Groq chat format."""
+        return {"role": self.role, "content": self.content}
+
+    @property
+    def footprint(self) -> int:
+        """Approximate memory footprint in bytes."""
+        return len(self.content) + MESSAGE_OVERHEAD
+
+
+@dataclass(slots=True)
+class _Conversation:
+    """In-memory conversation of a single user."""
+
+    messages: List[ChatMessage] = field(default_factory=list)
+    last_access: float = 0.0
+    footprint: int = 0
+
+
+class ConversationBackend(Protocol):
+    """Blocking persistence interface used by ``ConversationStore``."""
+
+    def load(self, user_id: int) -> Optional[List[ChatMessage]]: ...
+
+    def save_many(self, items: Iterable[Tuple[int, List[ChatMessage]]]) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class SQLiteConversationBackend:
+    """SQLite persistence for conversations (blocking, run in a thread)."""
+
+    def __init__(self, db_path: Path):
+        """
+        Initialize SQLite backend.
+
+        Args:
+            db_path: Path to the database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "user_id INTEGER PRIMARY KEY, "
+            "messages TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, user_id: int) -> Optional[List[ChatMessage]]:
+        """
+        Load conversation of a user.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Stored messages or None if the user is unknown
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages FROM conversations WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        return [ChatMessage(*item) for item in json.loads(row[0])]
+
+    def save_many(self, items: Iterable[Tuple[int, List[ChatMessage]]]) -> None:
+        """
+        Save conversations in a single transaction.
+
+        Args:
+            items: Pairs of user ID and messages
+        """
+        now = time.time()
+        rows = [
+            (
+                user_id,
+                json.dumps(
+                    [(m.role, m.content, m.tokens) for m in messages],
+                    ensure_ascii=False
+                ),
+                now
+            )
+            for user_id, messages in items
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversations (user_id, messages, updated_at) "
+                "VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def pack_messages(
+    messages: List[ChatMessage],
+    budget: int,
+    keep_last: bool = True
+) -> List[Dict[str, str]]:
+    """
+    Select the newest messages that fit into a token budget.
+
+    Token counts are cached on the messages, so packing is a backward scan
+    over integers.
+
+    Args:
+        messages: Messages from oldest to newest
+        budget: Maximum number of prompt tokens
+        keep_last: Include the newest message even if it exceeds the budget
+
+    Returns:
+        Packed messages in Groq chat format, oldest first
+    """
+    start = len(messages)
+    used = 0
+
+    while start > 0:
+        tokens = messages[start - 1].tokens
+        if used + tokens > budget and (start < len(messages) or not keep_last):
+            break
+        used += tokens
+        start -= 1
+
+    return [m.as_dict() for m in messages[start:]]
+
+
+class ConversationStore:
+    """
+    Conversation history with an LRU + TTL in-memory tier.
+
+    Users are evicted when they are idle longer than ``ttl``, or least
+    recently used first when ``max_users`` or the memory limit is exceeded.
+    With a backend configured, changed conversations are written behind
+    in batches every ``flush_interval`` seconds and reloaded on a miss.
+    """
+
+    def __init__(
+        self,
+        max_users: int = 100_000,
+        max_messages: int = 50,
+        ttl: float = 86400,
+        memory_limit: int = 256 * 1024 * 1024,
+        backend: Optional[ConversationBackend] = None,
+        flush_interval: float = 5.0
+    ):
+        """
+        Initialize conversation store.
+
+        Args:
+            max_users: Maximum number of conversations kept in memory
+            max_messages: Maximum number of messages kept per user
+            ttl: Idle time in seconds after which a conversation is evicted
+            memory_limit: Approximate memory budget in bytes
+            backend: Optional persistence backend (SQLite or Redis)
+            flush_interval: Delay between write-behind flushes in seconds
+        """
+        self.max_users = max_users
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.memory_limit = memory_limit
+        self.backend = backend
+        self.flush_interval = flush_interval
+
+        self._conversations: "OrderedDict[int, _Conversation]" = OrderedDict()
+        self._footprint = 0
+        self._dirty: Dict[int, List[ChatMessage]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "evictions_ttl": 0,
+            "evictions_lru": 0,
+            "flushes": 0,
+        }
+
+    @property
+    def size(self) -> int:
+        """Number of conversations held in memory."""
+        return len(self._conversations)
+
+    @property
+    def footprint(self) -> int:
+        """Approximate memory used by conversations in bytes."""
+        return self._footprint
+
+    async def start(self) -> None:
+        """Start the write-behind flusher."""
+        if self.backend is not None and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop the flusher, write pending changes and close the backend."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        if self.backend is not None:
+            await self.flush()
+            await asyncio.to_thread(self.backend.close)
+
+    async def get_history(self, user_id: int) -> List[ChatMessage]:
+        """
+        Get conversation of a user.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Messages from oldest to newest
+        """
+        conversation = await self._get(user_id)
+        return list(conversation.messages)
+
+    async def append(self, user_id: int, role: str, content: str) -> None:
+        """
+        Append a message to the conversation of a user.
+
+        Args:
+            user_id: Telegram user ID
+            role: Message role (user or assistant)
+            content: Message text
+        """
+        conversation = await self._get(user_id)
+        message = ChatMessage(role, content)
+        conversation.messages.append(message)
+        conversation.footprint += message.footprint
+        self._footprint += message.footprint
+
+        # Drop oldest messages over the per-user limit
+        overflow = len(conversation.messages) - self.max_messages
+        if overflow > 0:
+            dropped = sum(m.footprint for m in conversation.messages[:overflow])
+            del conversation.messages[:overflow]
+            conversation.footprint -= dropped
+            self._footprint -= dropped
+
+        if self.backend is not None:
+            self._dirty[user_id] = conversation.messages
+
+        self._evict()
+
+    async def flush(self) -> None:
+        """Write all changed conversations to the backend."""
+        if self.backend is None or not self._dirty:
+            return
+
+        items = [(user_id, list(messages)) for user_id, messages in self._dirty.items()]
+        self._dirty.clear()
+
+        try:
+            await asyncio.to_thread(self.backend.save_many, items)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            logger.error(f"Failed to flush conversations: {e}", exc_info=True)
+            # Keep changes for the next attempt unless newer ones exist
+            for user_id, messages in items:
+                self._dirty.setdefault(user_id, messages)
+
+    async def _flush_loop(self) -> None:
+        """Periodically flush changed conversations."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _get(self, user_id: int) -> _Conversation:
+        """Get or load in-memory conversation and mark it recently used."""
+        now = time.monotonic()
+        conversation = self._conversations.get(user_id)
+
+        if conversation is not None and now - conversation.last_access > self.ttl:
+            self._remove(user_id)
+            self.stats["evictions_ttl"] += 1
+            conversation = None
+
+        if conversation is not None:
+            self.stats["hits"] += 1
+            self._conversations.move_to_end(user_id)
+            conversation.last_access = now
+            return conversation
+
+        self.stats["misses"] += 1
+        messages = await self._load(user_id)
+
+        # Another coroutine may have created it while loading
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            conversation = _Conversation(
+                messages=messages[-self.max_messages:],
+                footprint=sum(m.footprint for m in messages[-self.max_messages:])
+            )
+            self._conversations[user_id] = conversation
+            self._footprint += conversation.footprint
+
+        conversation.last_access = now
+        return conversation
+
+    async def _load(self, user_id: int) -> List[ChatMessage]:
+        """Load conversation from pending writes or the backend."""
+        if self.backend is None:
+            return []
+
+        pending = self._dirty.get(user_id)
+        if pending is not None:
+            return list(pending)
+
+        try:
+            messages = await asyncio.to_thread(self.backend.load, user_id)
+        except Exception as e:
+            logger.error(f"Failed to load conversation of {user_id}: {e}")
+            return []
+
+        if messages is None:
+            return []
+
+        self.stats["loads"] += 1
+        return messages
+
+    def _remove(self, user_id: int) -> None:
+        """Remove conversation from memory (pending writes are kept)."""
+        conversation = self._conversations.pop(user_id)
+        self._footprint -= conversation.footprint
+
+    def _evict(self) -> None:
+        """Evict expired and least recently used conversations."""
+        now = time.monotonic()
+
+        while self._conversations:
+            user_id, conversation = next(iter(self._conversations.items()))
+
+            if now - conversation.last_access > self.ttl:
+                self.stats["evictions_ttl"] += 1
+            elif (
+                len(self._conversations) > self.max_users
+                or self._footprint > self.memory_limit
+            ):
+                self.stats["evictions_lru"] += 1
+            else:
+                break
+
+            self._remove(user_id)
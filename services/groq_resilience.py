@@ -0,0 +1,292 @@
+"""Retry, hedging and model fallback policy for Groq requests."""
+import asyncio
+import logging
+import random
+from collections import Counter, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from groq import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    InternalServerError,
+    NotFoundError,
+    RateLimitError,
+)
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of request latencies for quantile estimates."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Initialize latency tracker.
+
+        Args:
+            window: Number of recent samples kept
+            min_samples: Samples required before quantiles are reported
+        """
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, latency: float) -> None:
+        """Record a latency in seconds."""
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Get latency quantile.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            Latency in seconds or None if there are too few samples
+        """
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether an error is transient and the request may be retried."""
+    return isinstance(
+        error,
+        (RateLimitError, InternalServerError, APIConnectionError, APITimeoutError)
+    )
+
+
+def is_model_unavailable(error: BaseException) -> bool:
+    """Check whether an error means the model cannot serve requests now."""
+    if isinstance(error, NotFoundError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in (503, 498)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Get server-requested delay from ``retry-after`` headers.
+
+    Args:
+        error: Raised API error
+
+    Returns:
+        Delay in seconds or None if the server did not ask for one
+    """
+    if not isinstance(error, APIStatusError):
+        return None
+
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class ResiliencePolicy:
+    """
+    Run Groq requests with retries, hedging and ordered model fallback.
+
+    Transient errors (429, 5xx, connection problems, timeouts) are retried
+    with jittered exponential backoff, honoring ``retry-after``. When a
+    model keeps failing or is unavailable, the next model from the task's
+    fallback list is used. Optionally a second identical request is sent
+    when the first one is slower than the observed latency quantile, and
+    whichever finishes first wins. Every finished request is tagged with
+    an outcome counted in ``outcomes``.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 10.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 2.0,
+        fallback_models: Optional[Dict[str, List[str]]] = None
+    ):
+        """
+        Initialize policy.
+
+        Args:
+            max_retries: Retries per model for transient errors
+            base_delay: Backoff delay of the first retry in seconds
+            max_delay: Maximum backoff delay in seconds
+            hedge: Send a hedged request after the latency quantile
+            hedge_quantile: Latency quantile that triggers hedging
+            hedge_min_delay: Lower bound of the hedging delay in seconds
+            fallback_models: Ordered fallback models per task
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.fallback_models = fallback_models or {}
+
+        self.outcomes: Counter = Counter()
+        self._latency: Dict[str, LatencyTracker] = {}
+
+    def models_for(self, task: str, primary: str) -> List[str]:
+        """
+        Get models to try for a task, primary first.
+
+        Args:
+            task: Task name (text or vision)
+            primary: Configured model of the task
+
+        Returns:
+            Ordered list of distinct models
+        """
+        models = [primary]
+        for model in self.fallback_models.get(task, []):
+            if model not in models:
+                models.append(model)
+        return models
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """
+        Get delay before the next attempt.
+
+        Args:
+            attempt: Zero-based number of the failed attempt
+            error: Error of the failed attempt
+
+        Returns:
+            Delay in seconds
+        """
+        requested = retry_after(error)
+        if requested is not None:
+            return min(requested, self.max_delay)
+
+        # Full jitter keeps retries from many chats from synchronizing
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def execute(
+        self,
+        task: str,
+        models: List[str],
+        call: Callable[[str], Awaitable[T]],
+        hedge: bool = True
+    ) -> T:
+        """
+        Run a request with the policy.
+
+        Args:
+            task: Task name used to tag outcomes
+            models: Models to try in order
+            call: Coroutine function sending the request for a model
+            hedge: Allow hedging (disable for calls returning open streams)
+
+        Returns:
+            Result of the first successful attempt
+        """
+        last_error: Optional[BaseException] = None
+
+        for model_idx, model in enumerate(models):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result, hedged = await self._run(model, call, hedge)
+                except Exception as e:
+                    last_error = e
+                    if is_model_unavailable(e):
+                        logger.warning(f"Model {model} unavailable: {e}")
+                        break
+                    if not is_retryable(e):
+                        self._tag(task, "failed")
+                        raise
+                    if attempt == self.max_retries:
+                        logger.warning(f"Model {model} failed after {attempt + 1} attempts: {e}")
+                        break
+
+                    delay = self.backoff(attempt, e)
+                    logger.warning(
+                        f"Transient Groq error on {model} ({type(e).__name__}), "
+                        f"retrying in {delay:.2f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+                if model_idx > 0:
+                    outcome = "fallback"
+                elif hedged:
+                    outcome = "hedged"
+                elif attempt > 0:
+                    outcome = "retried"
+                else:
+                    outcome = "primary"
+                self._tag(task, outcome, model)
+                return result
+
+        self._tag(task, "failed")
+        raise last_error
+
+    def _tag(self, task: str, outcome: str, model: Optional[str] = None) -> None:
+        """Count and log request outcome."""
+        self.outcomes[(task, outcome)] += 1
+        if outcome != "primary":
+            logger.info(f"Groq {task} request outcome: {outcome} (model={model})")
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Get delay after which a hedged request is sent."""
+        if not self.hedge:
+            return None
+        quantile = self._latency.setdefault(model, LatencyTracker()).quantile(self.hedge_quantile)
+        if quantile is None:
+            return None
+        return max(quantile, self.hedge_min_delay)
+
+    async def _run(self, model: str, call: Callable[[str], Awaitable[T]], hedge: bool):
+        """
+        Run one attempt, hedged if the model is slow.
+
+        Returns:
+            Tuple of result and whether the hedged request won
+        """
+        tracker = self._latency.setdefault(model, LatencyTracker())
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        delay = self._hedge_delay(model) if hedge else None
+        if delay is None:
+            result = await call(model)
+            tracker.add(loop.time() - started)
+            return result, False
+
+        primary = asyncio.ensure_future(call(model))
+        pending = {primary}
+        error: Optional[BaseException] = None
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                tracker.add(loop.time() - started)
+                return primary.result(), False
+
+            logger.info(f"Hedging slow request to {model} after {delay:.2f}s")
+            hedged = asyncio.ensure_future(call(model))
+            pending = {primary, hedged}
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        tracker.add(loop.time() - started)
+                        return task.result(), task is hedged
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
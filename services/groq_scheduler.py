@@ -0,0 +1,312 @@
+"""Fair, rate-limit-aware scheduling of Groq API calls."""
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Deque, Dict, Mapping, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class Priority(IntEnum):
+    """Request priority (lower value is served first)."""
+
+    TEXT = 0
+    VISION = 1
+    SEARCH = 2
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """
+    Parse a Groq reset duration such as ``2m59.56s`` or ``120ms``.
+
+    Args:
+        value: Duration string from a response header
+
+    Returns:
+        Duration in seconds or None if it cannot be parsed
+    """
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """Token bucket with a refill rate that can be recalibrated."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        Initialize token bucket.
+
+        Args:
+            capacity: Maximum number of tokens
+            refill_per_second: Tokens added per second
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        """Add tokens accumulated since the last update."""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self._updated) * self.refill_per_second
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Get time until ``amount`` tokens are available.
+
+        Args:
+            amount: Number of tokens (capped at capacity)
+
+        Returns:
+            Delay in seconds (0 if available now)
+        """
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return 1.0
+        return missing / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        """
+        Take tokens (the balance may go negative for corrections).
+
+        Args:
+            amount: Number of tokens
+        """
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def calibrate(self, limit: float, remaining: float, reset: Optional[float]) -> None:
+        """
+        Align the bucket with limits reported by the server.
+
+        Args:
+            limit: Total limit of the window
+            remaining: Tokens left in the current window
+            reset: Seconds until the window is fully replenished
+        """
+        self._refill()
+        self.capacity = limit
+        self.tokens = min(self.tokens, remaining)
+        if reset and reset > 0 and limit > remaining:
+            self.refill_per_second = (limit - remaining) / reset
+
+
+@dataclass
+class _Waiter:
+    """Request waiting for permission to call the API."""
+
+    tokens: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class GroqScheduler:
+    """
+    Gate Groq calls through request and token buckets.
+
+    Waiting calls are grouped by priority. Within a priority, users are
+    served round-robin, so a single chat with many queued requests cannot
+    starve others. Buckets start from configured per-minute limits and are
+    recalibrated from ``x-ratelimit-*`` headers of every response.
+    """
+
+    def __init__(self, requests_per_minute: int = 30, tokens_per_minute: int = 8000):
+        """
+        Initialize scheduler.
+
+        Args:
+            requests_per_minute: Initial request limit
+            tokens_per_minute: Initial token limit
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+        self._queues: Dict[Priority, "OrderedDict[int, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._depth = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "granted": 0,
+            "cancelled": 0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for permission."""
+        return self._depth
+
+    def queue_depths(self) -> Dict[Tuple[str], int]:
+        """Number of waiting calls per priority, keyed for a labelled gauge."""
+        return {
+            (priority.name.lower(),): sum(len(q) for q in queue.values())
+            for priority, queue in self._queues.items()
+        }
+
+    async def acquire(self, user_id: int, priority: Priority, tokens: int) -> float:
+        """
+        Wait until a call may be sent.
+
+        Args:
+            user_id: Telegram user ID the call is made for
+            priority: Call priority
+            tokens: Estimated tokens the call will consume
+
+        Returns:
+            Time spent waiting in seconds
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._dispatch())
+
+        waiter = _Waiter(tokens=tokens, future=loop.create_future())
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._depth += 1
+        self._wakeup.set()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.done() or waiter.future.cancelled():
+                self._discard(priority, user_id, waiter)
+            raise
+
+        return time.monotonic() - waiter.enqueued_at
+
+    def record_usage(self, estimated: int, actual: Optional[int]) -> None:
+        """
+        Correct token bucket with actual usage of a finished call.
+
+        Args:
+            estimated: Tokens reserved when the call was admitted
+            actual: Tokens reported in the response usage
+        """
+        if actual is not None:
+            self.tokens.consume(actual - estimated)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Recalibrate buckets from Groq rate limit headers.
+
+        Args:
+            headers: Response headers
+        """
+        for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            try:
+                limit = float(headers[f"x-ratelimit-limit-{name}"])
+                remaining = float(headers[f"x-ratelimit-remaining-{name}"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{name}", ""))
+            bucket.calibrate(limit, remaining, reset)
+
+    def close(self) -> None:
+        """Stop dispatching and fail waiting calls."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        for queue in self._queues.values():
+            for waiters in queue.values():
+                for waiter in waiters:
+                    if not waiter.future.done():
+                        waiter.future.cancel()
+            queue.clear()
+        self._depth = 0
+
+    def _discard(self, priority: Priority, user_id: int, waiter: _Waiter) -> None:
+        """Remove a cancelled waiter from its queue."""
+        waiters = self._queues[priority].get(user_id)
+        if waiters is None or waiter not in waiters:
+            return
+
+        waiters.remove(waiter)
+        if not waiters:
+            del self._queues[priority][user_id]
+        self._depth -= 1
+        self.stats["cancelled"] += 1
+
+    def _peek(self) -> Optional[_Waiter]:
+        """Get the next waiter: highest priority, then round-robin user."""
+        for priority in Priority:
+            queue = self._queues[priority]
+            if queue:
+                return next(iter(queue.values()))[0]
+        return None
+
+    def _pop(self) -> _Waiter:
+        """Remove the next waiter and rotate its user to the back."""
+        for priority in Priority:
+            queue = self._queues[priority]
+            if not queue:
+                continue
+
+            user_id, waiters = next(iter(queue.items()))
+            waiter = waiters.popleft()
+            del queue[user_id]
+            if waiters:
+                queue[user_id] = waiters
+            self._depth -= 1
+            return waiter
+
+        raise LookupError("No waiting calls")
+
+    async def _dispatch(self) -> None:
+        """Grant waiting calls as bucket capacity becomes available."""
+        while True:
+            waiter = self._peek()
+            if waiter is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = max(
+                self.requests.wait_time(1),
+                self.tokens.wait_time(waiter.tokens)
+            )
+            if delay > 0:
+                # Re-evaluate early if a higher priority call arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            waiter = self._pop()
+            if waiter.future.done():
+                continue
+
+            self.requests.consume(1)
+            self.tokens.consume(waiter.tokens)
+
+            waited = time.monotonic() - waiter.enqueued_at
+            self.stats["granted"] += 1
+            if waited > 1:
+                logger.info(f"Groq call waited {waited:.1f}s, {self._depth} still queued")
+
+            waiter.future.set_result(None)
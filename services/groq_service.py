@@ -1,28 +1,208 @@
 """Groq API service for LLM interactions."""
+import hashlib
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
 
-from groq import Groq
+import httpx
+from groq import APIStatusError, AsyncGroq, DefaultAsyncHttpxClient
 
-from config import get_config
+from config import Config, get_config
+from services.completion_cache import CompletionCache
+from services.groq_scheduler import GroqScheduler, Priority
+from services.groq_resilience import ResiliencePolicy
+from utils.metrics import metrics
+from utils.search_context import SearchContextCompactor, format_result
+from utils.tokens import estimate_tokens, MESSAGE_TOKEN_OVERHEAD
 
 
 logger = logging.getLogger(__name__)
 
+# Rough prompt cost of one image for rate limit accounting
+IMAGE_TOKEN_ESTIMATE = 1500
+
 
 class GroqService:
-    """Service for interacting with Groq API."""
+    """
+    Service for interacting with Groq API.
+    
+    A single instance is created at startup and shared by all handlers, so
+    every request reuses the same keep-alive connection pool.
+    """
     
-    def __init__(self):
-        """Initialize Groq service."""
-        self.config = get_config()
-        self.client = Groq(api_key=self.config.groq_api_key)
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        cache: Optional[CompletionCache] = None,
+        scheduler: Optional[GroqScheduler] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        compactor: Optional[SearchContextCompactor] = None
+    ):
+        """
+        Initialize Groq service.
+        
+        Args:
+            config: Bot configuration (global config is used if omitted)
+            cache: Optional cache for deterministic text completions
+            scheduler: Optional rate-limit-aware scheduler for all calls
+            resilience: Optional retry, hedging and fallback policy
+            compactor: Optional ranking, dedup and token cap of search context
+        """
+        self.config = config or get_config()
+        self.cache = cache
+        self.scheduler = scheduler
+        self.resilience = resilience
+        self.compactor = compactor
+        self.client = AsyncGroq(
+            api_key=self.config.groq_api_key,
+            base_url=self.config.groq_base_url,
+            timeout=self.config.groq_timeout,
+            # Retries are handled by the resilience policy when present
+            max_retries=0 if resilience is not None else 2,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.config.groq_max_connections,
+                    max_keepalive_connections=self.config.groq_max_keepalive_connections,
+                )
+            ),
+        )
         self.instructions = self.config.load_instructions()
+        self.instructions_version = hashlib.sha256(
+            self.instructions.encode('utf-8')
+        ).hexdigest()[:16]
+    
+    def _cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        use_cache: bool
+    ) -> Optional[str]:
+        """
+        Get completion cache key if the request may be cached.
+        
+        Args:
+            messages: List of chat messages
+            temperature: Model temperature
+            use_cache: Whether the caller allows caching
+            
+        Returns:
+            Cache key or None if the cache must be bypassed
+        """
+        if self.cache is None or not use_cache or temperature != 0:
+            return None
+        
+        return CompletionCache.make_key(
+            self.config.text_model,
+            messages,
+            temperature,
+            self.instructions_version
+        )
+    
+    async def close(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        if self.scheduler is not None:
+            self.scheduler.close()
+        await self.client.close()
+    
+    def _estimate_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Estimate tokens a request will consume, including the completion.
+        
+        Args:
+            messages: Chat messages (text or multimodal content)
+            
+        Returns:
+            Estimated token count
+        """
+        total = self.config.groq_completion_token_estimate
+        for message in messages:
+            total += MESSAGE_TOKEN_OVERHEAD
+            content = message["content"]
+            if isinstance(content, str):
+                total += estimate_tokens(content)
+                continue
+            for part in content:
+                if part.get("type") == "text":
+                    total += estimate_tokens(part["text"])
+                else:
+                    total += IMAGE_TOKEN_ESTIMATE
+        return total
+    
+    async def _create(self, user_id: int, priority: Priority, **kwargs: Any) -> Any:
+        """
+        Send a chat completion request through the scheduler.
+        
+        Args:
+            user_id: Telegram user ID the request is made for
+            priority: Request priority
+            **kwargs: Arguments for chat.completions.create
+            
+        Returns:
+            Parsed completion (or stream when ``stream=True``)
+        """
+        if self.scheduler is None:
+            result = await self.client.chat.completions.create(**kwargs)
+            metrics.record_tokens(kwargs["model"], getattr(result, "usage", None))
+            return result
+        
+        estimated = self._estimate_tokens(kwargs["messages"])
+        waited = await self.scheduler.acquire(user_id, priority, estimated)
+        metrics.observe("groq_queue", waited)
+        
+        try:
+            raw = await self.client.chat.completions.with_raw_response.create(**kwargs)
+        except APIStatusError as e:
+            self.scheduler.update_from_headers(e.response.headers)
+            raise
+        
+        result = await raw.parse()
+        metrics.record_tokens(kwargs["model"], getattr(result, "usage", None))
+        if "x-ratelimit-remaining-tokens" in raw.headers:
+            self.scheduler.update_from_headers(raw.headers)
+        else:
+            usage = getattr(result, "usage", None)
+            self.scheduler.record_usage(estimated, usage.total_tokens if usage else None)
+        return result
+    
+    async def _call(
+        self,
+        task: str,
+        user_id: int,
+        priority: Priority,
+        hedge: bool = True,
+        **kwargs: Any
+    ) -> Any:
+        """
+        Send a request with the resilience policy, if configured.
+        
+        Args:
+            task: Task name selecting fallback models (text or vision)
+            user_id: Telegram user ID the request is made for
+            priority: Request priority
+            hedge: Allow hedged requests
+            **kwargs: Arguments for chat.completions.create
+            
+        Returns:
+            Parsed completion (or stream when ``stream=True``)
+        """
+        with metrics.track("groq"):
+            if self.resilience is None:
+                return await self._create(user_id, priority, **kwargs)
+            
+            models = self.resilience.models_for(task, kwargs.pop("model"))
+            return await self.resilience.execute(
+                task,
+                models,
+                lambda model: self._create(user_id, priority, model=model, **kwargs),
+                hedge=hedge
+            )
     
     async def analyze_text(
         self,
         messages: List[Dict[str, str]],
-        temperature: float = 0
+        temperature: float = 0,
+        use_cache: bool = False,
+        user_id: int = 0,
+        priority: Priority = Priority.TEXT
     ) -> str:
         """
         Analyze text using Groq API.
@@ -30,14 +210,28 @@ class GroqService:
         Args:
             messages: List of chat messages
             temperature: Model temperature
+            use_cache: Allow serving the response from the completion cache
+                (only deterministic requests without history should set it)
+            user_id: Telegram user ID used for fair scheduling
+            priority: Scheduling priority
             
         Returns:
             Model response
         """
+        cache_key = self._cache_key(messages, temperature, use_cache)
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Completion cache hit")
+                return cached
+        
         try:
             logger.info("Sending text analysis request to Groq")
             
-            response = self.client.chat.completions.create(
+            response = await self._call(
+                "text",
+                user_id,
+                priority,
                 model=self.config.text_model,
                 messages=messages,
                 temperature=temperature
@@ -45,16 +239,97 @@ class GroqService:
             
             content = response.choices[0].message.content
             logger.info("Received response from Groq")
+            
+            if cache_key is not None and content:
+                await self.cache.set(cache_key, content)
             return content
             
         except Exception as e:
             logger.error(f"Groq text analysis error: {e}", exc_info=True)
             raise
     
+    async def stream_text(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0,
+        use_cache: bool = False,
+        user_id: int = 0,
+        priority: Priority = Priority.TEXT
+    ) -> AsyncIterator[str]:
+        """
+        Stream text completion from Groq API token by token.
+        
+        Args:
+            messages: List of chat messages
+            temperature: Model temperature
+            use_cache: Allow serving the response from the completion cache
+            user_id: Telegram user ID used for fair scheduling
+            priority: Scheduling priority
+            
+        Yields:
+            Content deltas as they arrive (a cached response is yielded whole)
+        """
+        cache_key = self._cache_key(messages, temperature, use_cache)
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Completion cache hit")
+                yield cached
+                return
+        
+        parts = []
+        try:
+            logger.info("Sending streaming text request to Groq")
+            
+            stream = await self._call(
+                "text",
+                user_id,
+                priority,
+                hedge=False,
+                model=self.config.text_model,
+                messages=messages,
+                temperature=temperature,
+                stream=True
+            )
+            
+            async for chunk in stream:
+                # Groq reports usage in the last chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None:
+                    metrics.record_tokens(chunk.model, getattr(x_groq, "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            
+            logger.info("Finished streaming response from Groq")
+            
+            if cache_key is not None and parts:
+                await self.cache.set(cache_key, "".join(parts))
+            
+        except Exception as e:
+            logger.error(f"Groq streaming error: {e}", exc_info=True)
+            raise
+    
+    def clip_prompt(self, user_text: str) -> str:
+        """
+        Cut a user prompt to the length sent with an image.
+        
+        Args:
+            user_text: User's text prompt
+            
+        Returns:
+            Prompt of at most ``max_text_length`` characters
+        """
+        return user_text[:self.config.max_text_length]
+    
     async def analyze_image(
         self,
         base64_image: str,
-        user_text: str
+        user_text: str,
+        user_id: int = 0
     ) -> str:
         """
         Analyze image using Groq vision model.
@@ -62,14 +337,14 @@ class GroqService:
         Args:
             base64_image: Base64 encoded image
             user_text: User's text prompt
+            user_id: Telegram user ID used for fair scheduling
             
         Returns:
             Model response
         """
         try:
             # Validate input sizes
-            if len(user_text) > self.config.max_text_length:
-                user_text = user_text[:self.config.max_text_length]
+            user_text = self.clip_prompt(user_text)
             
             if len(base64_image) > self.config.max_base64_size:
                 raise ValueError(
@@ -78,7 +353,10 @@ class GroqService:
             
             logger.info("Sending image analysis request to Groq")
             
-            chat_completion = self.client.chat.completions.create(
+            chat_completion = await self._call(
+                "vision",
+                user_id,
+                Priority.VISION,
                 messages=[
                     {
                         "role": "user",
@@ -111,7 +389,8 @@ class GroqService:
         self,
         query: str,
         search_results: List[Dict[str, Any]],
-        conversation_history: List[Dict[str, str]]
+        conversation_history: List[Dict[str, str]],
+        user_id: int = 0
     ) -> str:
         """
         Analyze query with search results context.
@@ -120,15 +399,45 @@ class GroqService:
             query: User query
             search_results: Search results from DuckDuckGo
             conversation_history: Previous conversation messages
+            user_id: Telegram user ID used for fair scheduling
             
         Returns:
             Model response
         """
+        messages = self.build_search_messages(
+            query,
+            search_results,
+            conversation_history
+        )
+        return await self.analyze_text(
+            messages,
+            user_id=user_id,
+            priority=Priority.SEARCH
+        )
+    
+    def build_search_messages(
+        self,
+        query: str,
+        search_results: List[Dict[str, Any]],
+        conversation_history: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """
+        Build chat messages for a search-augmented request.
+        
+        Args:
+            query: User query
+            search_results: Search results from DuckDuckGo
+            conversation_history: Previous conversation messages
+            
+        Returns:
+            Messages with search context appended
+        """
+        # Keep the most relevant distinct results within the context budget
+        if self.compactor is not None:
+            search_results = self.compactor.compact(query, search_results)
+        
         # Format search results for context
-        search_context = "\n\n".join([
-            f"Источник {r['number']}: {r['title']}\n{r['body']}"
-            for r in search_results
-        ])
+        search_context = "\n\n".join(format_result(r) for r in search_results)
         
         # Build messages with search context
         messages = conversation_history + [
@@ -143,4 +452,4 @@ class GroqService:
             }
         ]
         
-        return await self.analyze_text(messages)
\ No newline at end of file
+        return messages
\ No newline at end of file
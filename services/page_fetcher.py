@@ -0,0 +1,249 @@
+"""Fetch and extract the pages behind top search results."""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+import aiohttp
+
+from utils.cache import SingleFlight, TTLCache
+from utils.worker_pool import WorkerPool
+from utils.metrics import metrics
+from utils.page_text import extract_main_text
+
+
+logger = logging.getLogger(__name__)
+
+# Pages that failed or are not HTML are not retried for this long
+FAILURE_TTL = 300.0
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; GroqTGBot/1.0)",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,text/plain;q=0.8",
+}
+
+
+@dataclass
+class CachedPage:
+    """Extracted text of a page with its validators."""
+
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class PageFetcher:
+    """
+    Enrich search results with the main text of their pages.
+
+    The top ``max_pages`` links are fetched concurrently over one shared
+    connection pool. Each download stops at ``max_bytes`` and the text is
+    extracted in a worker pool. ``enrich`` returns after ``deadline``
+    seconds at most: pages that are not ready by then are left out of the
+    answer, while their fetches finish in the background (up to
+    ``fetch_timeout``) and only warm the cache. Texts are cached by URL for
+    ``cache_ttl`` seconds or the page's ``max-age`` if shorter. Expired
+    pages are revalidated with ``If-None-Match``/``If-Modified-Since``, so
+    an unchanged page costs a 304 and no extraction.
+    """
+
+    def __init__(
+        self,
+        pool: WorkerPool,
+        max_pages: int = 3,
+        deadline: float = 3.0,
+        fetch_timeout: float = 10.0,
+        max_bytes: int = 512 * 1024,
+        max_chars: int = 1500,
+        cache_size: int = 500,
+        cache_ttl: float = 3600,
+        max_connections: int = 20
+    ):
+        """
+        Initialize page fetcher.
+
+        Args:
+            pool: Worker pool running text extraction
+            max_pages: Results to fetch pages for
+            deadline: Maximum time ``enrich`` waits in seconds
+            fetch_timeout: Maximum time a background fetch may take in seconds
+            max_bytes: Bytes read from a page at most
+            max_chars: Characters of text kept per page
+            cache_size: Maximum number of cached pages
+            cache_ttl: Time to live of cached pages in seconds
+            max_connections: Size of the connection pool
+        """
+        self.pool = pool
+        self.max_pages = max_pages
+        self.deadline = deadline
+        self.fetch_timeout = fetch_timeout
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.max_connections = max_connections
+
+        self.cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self.flights = SingleFlight()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._running: Set[asyncio.Task] = set()
+
+        self.stats = {
+            "fetched": 0,
+            "not_modified": 0,
+            "late": 0,
+            "failed": 0,
+            "truncated": 0,
+        }
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session, created on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.fetch_timeout),
+                headers=_HEADERS,
+            )
+        return self._session
+
+    async def enrich(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Append page text to the bodies of the top results.
+
+        Args:
+            results: Search results with link and body (not modified)
+
+        Returns:
+            Copies of the results, with page text after the snippet for
+            pages that were ready before the deadline
+        """
+        links = []
+        for result in results[:self.max_pages]:
+            link = result.get("link", "")
+            if link.startswith(("http://", "https://")) and link not in links:
+                links.append(link)
+        if not links:
+            return results
+
+        with metrics.track("fetch"):
+            tasks = {link: self._start(link) for link in links}
+            done, pending = await asyncio.wait(tasks.values(), timeout=self.deadline)
+
+        if pending:
+            self.stats["late"] += len(pending)
+            logger.info(f"Dropped {len(pending)} of {len(tasks)} pages not ready in {self.deadline}s")
+
+        pages = {link: task.result() for link, task in tasks.items() if task in done}
+        enriched = []
+        for result in results:
+            text = pages.get(result.get("link"))
+            if text:
+                body = result.get("body", "")
+                result = dict(result, body=f"{body}\n{text}" if body else text)
+            enriched.append(result)
+        return enriched
+
+    async def fetch(self, url: str) -> str:
+        """
+        Get the main text of a page.
+
+        Args:
+            url: Page URL
+
+        Returns:
+            Extracted text (empty if the page could not be used)
+        """
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached.text
+        return await self.flights.do(url, lambda: self._load(url))
+
+    async def close(self) -> None:
+        """Cancel background fetches and close the connection pool."""
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    def _start(self, url: str) -> asyncio.Task:
+        """Fetch a page in a task that outlives the caller's deadline."""
+        task = asyncio.get_running_loop().create_task(self.fetch(url))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    def _ttl(self, headers: Any) -> Optional[float]:
+        """
+        Get how long a response may be cached.
+
+        Returns:
+            TTL in seconds, or None if the page must not be stored
+        """
+        cache_control = headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        match = _MAX_AGE.search(cache_control)
+        if match:
+            return min(float(match.group(1)), self.cache.ttl)
+        return self.cache.ttl
+
+    async def _read(self, response: aiohttp.ClientResponse) -> bytes:
+        """Read a response body up to the byte cap."""
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_bytes:
+                self.stats["truncated"] += 1
+                break
+        return b"".join(chunks)[:self.max_bytes]
+
+    async def _load(self, url: str) -> str:
+        """Download a page, revalidating a stale copy, and extract its text."""
+        stale = self.cache.get_stale(url)
+        headers = {}
+        if stale is not None and stale.etag:
+            headers["If-None-Match"] = stale.etag
+        if stale is not None and stale.last_modified:
+            headers["If-Modified-Since"] = stale.last_modified
+
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                ttl = self._ttl(response.headers)
+                if response.status == 304 and stale is not None:
+                    self.stats["not_modified"] += 1
+                    if ttl is not None:
+                        self.cache.set(url, stale, ttl)
+                    return stale.text
+
+                content_type = response.headers.get("Content-Type", "")
+                if response.status != 200 or not content_type.startswith(("text/html", "application/xhtml", "text/plain")):
+                    logger.info(f"Skipping page {url}: HTTP {response.status}, {content_type or 'no type'}")
+                    self.cache.set(url, CachedPage(""), FAILURE_TTL)
+                    return ""
+
+                data = await self._read(response)
+                charset = response.charset
+                page = CachedPage(
+                    "",
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
+
+            page.text = await self.pool.run(extract_main_text, data, charset, self.max_chars)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            metrics.record_error("fetch", e)
+            logger.info(f"Could not fetch page {url}: {e!r}")
+            return stale.text if stale is not None else ""
+
+        self.stats["fetched"] += 1
+        if ttl is not None:
+            self.cache.set(url, page, ttl)
+        return page.text
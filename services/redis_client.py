@@ -0,0 +1,189 @@
+"""Minimal blocking client for the Redis protocol (RESP2)."""
+import socket
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    """Error reply from the server."""
+
+
+class RedisClient:
+    """
+    Thread-safe Redis client over a single connection.
+
+    Only what the state backends need is implemented: commands are sent as
+    RESP arrays of bulk strings and replies are parsed into Python values
+    (bytes for bulk strings). Calls block, so use it from worker threads
+    like the SQLite backends. The connection is reopened once if it breaks.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = 5.0
+    ):
+        """
+        Initialize client (the connection is opened on first use).
+
+        Args:
+            host: Server host
+            port: Server port
+            db: Database number
+            password: Optional password
+            timeout: Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = 5.0) -> "RedisClient":
+        """
+        Create client from a ``redis://[:password@]host[:port][/db]`` URL.
+
+        Args:
+            url: Server URL
+            timeout: Socket timeout in seconds
+
+        Returns:
+            Redis client
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme}")
+
+        db = parsed.path.lstrip("/")
+        return cls(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=parsed.password,
+            timeout=timeout,
+        )
+
+    def execute(self, *args: Any) -> Any:
+        """
+        Run a command.
+
+        Args:
+            *args: Command name and arguments
+
+        Returns:
+            Parsed reply
+        """
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands: Sequence[Tuple[Any, ...]]) -> List[Any]:
+        """
+        Send commands in one round trip.
+
+        Args:
+            commands: Commands, each a tuple of name and arguments
+
+        Returns:
+            Parsed replies in order (error replies are raised)
+        """
+        payload = b"".join(self._encode(command) for command in commands)
+
+        with self._lock:
+            try:
+                replies = self._roundtrip(payload, len(commands))
+            except (ConnectionError, socket.timeout, OSError):
+                self._disconnect()
+                replies = self._roundtrip(payload, len(commands))
+
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def close(self) -> None:
+        """Close the connection."""
+        with self._lock:
+            self._disconnect()
+
+    def _roundtrip(self, payload: bytes, count: int) -> List[Any]:
+        """Send payload and read ``count`` replies."""
+        if self._sock is None:
+            self._connect()
+        self._sock.sendall(payload)
+        return [self._read_reply() for _ in range(count)]
+
+    def _connect(self) -> None:
+        """Open connection, authenticate and select the database."""
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._sock.sendall(b"".join(self._encode(command) for command in setup))
+            for _ in setup:
+                reply = self._read_reply()
+                if isinstance(reply, RedisError):
+                    self._disconnect()
+                    raise reply
+
+    def _disconnect(self) -> None:
+        """Drop the connection."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    @staticmethod
+    def _encode(command: Tuple[Any, ...]) -> bytes:
+        """Encode a command as a RESP array of bulk strings."""
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if isinstance(arg, bytes):
+                data = arg
+            elif isinstance(arg, str):
+                data = arg.encode("utf-8")
+            else:
+                data = str(arg).encode("ascii")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self) -> Any:
+        """Read one reply from the connection."""
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by Redis server")
+
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            return RedisError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from Redis server: {line!r}")
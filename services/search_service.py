@@ -1,16 +1,234 @@
 """DuckDuckGo search service using ddgs library."""
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
 import asyncio
+import contextvars
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
 from ddgs import DDGS
 from ddgs.exceptions import DDGSException, RatelimitException, TimeoutException
 
+from utils.cache import TTLCache, SingleFlight
+from utils.metrics import metrics
+
 
 logger = logging.getLogger(__name__)
 
 
+class SearchCache:
+    """
+    Shared cache of search results.
+    
+    Fresh results are served for ``ttl`` seconds. Concurrent identical
+    queries share a single upstream call, and when the upstream call
+    fails (for example on a DDGS rate limit) expired results are served
+    instead of an empty list.
+    """
+    
+    def __init__(self, max_entries: int = 1000, ttl: float = 600):
+        """
+        Initialize search cache.
+        
+        Args:
+            max_entries: Maximum number of cached queries
+            ttl: Time to live of results in seconds
+        """
+        self.results = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.flights = SingleFlight()
+    
+    @staticmethod
+    def make_key(
+        kind: str,
+        query: str,
+        region: str,
+        max_results: int
+    ) -> Tuple[str, str, str, int]:
+        """
+        Build cache key for a query.
+        
+        Args:
+            kind: Search kind (text or news)
+            query: Search query
+            region: Search region
+            max_results: Maximum number of results
+            
+        Returns:
+            Cache key with normalized query
+        """
+        normalized = " ".join(query.lower().split()).rstrip("?!. ")
+        return (kind, normalized, region, max_results)
+    
+    async def get_or_fetch(
+        self,
+        key: Tuple[str, str, str, int],
+        fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Get cached results or fetch them once for all concurrent callers.
+        
+        Args:
+            key: Cache key
+            fetch: Coroutine function performing the upstream search
+            
+        Returns:
+            List of search results
+        """
+        cached = self.results.get(key)
+        if cached is not None:
+            logger.info(f"Search cache hit for: {key[1]}")
+            return cached
+        
+        async def _load() -> List[Dict[str, Any]]:
+            results = await fetch()
+            if results:
+                self.results.set(key, results)
+                return results
+            
+            stale = self.results.get_stale(key)
+            if stale is not None:
+                logger.warning(f"Serving stale search results for: {key[1]}")
+                return stale
+            return results
+        
+        return await self.flights.do(key, _load)
+
+
+class SearchQueueFull(Exception):
+    """Raised when the search worker pool cannot accept more work."""
+
+
+class SearchWorkerPool:
+    """
+    Process-wide pool of search worker threads.
+    
+    At most ``max_workers + max_queue`` searches are admitted at once;
+    callers wait up to ``queue_timeout`` seconds for a slot and get
+    ``SearchQueueFull`` after that. Work that exceeds its deadline is
+    cancelled if it has not started yet and abandoned otherwise, keeping
+    its slot until the thread actually finishes. Each worker thread keeps
+    its own ``DDGS`` session so connections stay warm.
+    """
+    
+    def __init__(
+        self,
+        max_workers: int = 3,
+        max_queue: int = 32,
+        queue_timeout: float = 5.0,
+        session_factory: Callable[..., Any] = DDGS
+    ):
+        """
+        Initialize worker pool.
+        
+        Args:
+            max_workers: Number of worker threads
+            max_queue: Number of searches allowed to wait for a worker
+            queue_timeout: Maximum time to wait for a free slot in seconds
+            session_factory: Creates a search session from a timeout
+                (``DDGS``; benchmarks pass a local stub)
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_factory = session_factory
+        
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="search"
+        )
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._local = threading.local()
+        self._pending = 0
+        
+        self.stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "cancelled": 0,
+        }
+    
+    @property
+    def pending(self) -> int:
+        """Number of searches queued or running."""
+        return self._pending
+    
+    def session(self, timeout: int) -> DDGS:
+        """
+        Get DDGS session of the current worker thread.
+        
+        Args:
+            timeout: Timeout for search requests
+            
+        Returns:
+            DDGS instance reused by this thread
+        """
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+        
+        ddgs = sessions.get(timeout)
+        if ddgs is None:
+            ddgs = sessions[timeout] = self.session_factory(timeout=timeout)
+        return ddgs
+    
+    async def run(self, timeout: float, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a blocking function on a worker thread.
+        
+        Args:
+            timeout: Deadline for the work in seconds
+            fn: Function to run
+            *args: Function arguments
+            
+        Returns:
+            Function result
+            
+        Raises:
+            SearchQueueFull: If no slot became free in time
+            asyncio.TimeoutError: If the work did not finish in time
+        """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise SearchQueueFull(
+                f"Search queue is full ({self._pending} pending)"
+            ) from None
+        
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        self.stats["submitted"] += 1
+        
+        def _release(_) -> None:
+            loop.call_soon_threadsafe(self._release)
+        
+        try:
+            # Keep the correlation ID of the update in worker thread logs
+            context = contextvars.copy_context()
+            future = self._executor.submit(context.run, fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(_release)
+        
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            if future.cancel():
+                self.stats["cancelled"] += 1
+            raise
+    
+    def _release(self) -> None:
+        """Free a slot after work has finished or was cancelled."""
+        self._pending -= 1
+        self._slots.release()
+    
+    def close(self) -> None:
+        """Cancel queued work and stop worker threads."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 class SearchService:
     """Service for performing web searches using DuckDuckGo via ddgs library."""
     
@@ -18,7 +236,9 @@ class SearchService:
         self,
         max_results: int = 5,
         region: str = "ru-ru",
-        timeout: int = 10
+        timeout: int = 10,
+        cache: Optional[SearchCache] = None,
+        pool: Optional[SearchWorkerPool] = None
     ):
         """
         Initialize search service.
@@ -27,11 +247,15 @@ class SearchService:
             max_results: Maximum number of search results
             region: Search region (ru-ru for Russia, us-en for USA, etc.)
             timeout: Timeout for search requests
+            cache: Optional shared search result cache
+            pool: Shared worker pool (a private one is created if omitted)
         """
         self.max_results = max_results
         self.region = region
         self.timeout = timeout
-        self._executor = ThreadPoolExecutor(max_workers=3)
+        self.cache = cache
+        self._owns_pool = pool is None
+        self.pool = pool or SearchWorkerPool()
     
     def _perform_search_sync(self, query: str) -> List[Dict[str, Any]]:
         """
@@ -46,8 +270,8 @@ class SearchService:
         try:
             logger.info(f"Performing DDGS search for: {query}")
             
-            # Initialize DDGS with timeout
-            ddgs = DDGS(timeout=self.timeout)
+            # Reuse DDGS session of this worker thread
+            ddgs = self.pool.session(self.timeout)
             
             # Perform text search
             # text() returns a list directly, not an iterator
@@ -74,15 +298,19 @@ class SearchService:
             return results
             
         except RatelimitException as e:
+            metrics.record_error("search", e)
             logger.error(f"Rate limit exceeded: {e}")
             return []
         except TimeoutException as e:
+            metrics.record_error("search", e)
             logger.error(f"Search timeout: {e}")
             return []
         except DDGSException as e:
+            metrics.record_error("search", e)
             logger.error(f"DDGS error: {e}")
             return []
         except Exception as e:
+            metrics.record_error("search", e)
             logger.error(f"Unexpected search error: {e}", exc_info=True)
             return []
     
@@ -96,14 +324,32 @@ class SearchService:
         Returns:
             List of search results with title, link, and body
         """
-        # Run synchronous search in executor to avoid blocking
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(
-            self._executor,
-            self._perform_search_sync,
-            query
-        )
-        return results
+        if self.cache is None:
+            return await self._search_uncached(query)
+        
+        key = SearchCache.make_key("text", query, self.region, self.max_results)
+        return await self.cache.get_or_fetch(key, lambda: self._search_uncached(query))
+    
+    async def _search_uncached(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Perform a web search without the cache.
+        
+        Args:
+            query: Search query
+            
+        Returns:
+            List of search results with title, link, and body
+        """
+        # Run synchronous search in worker pool to avoid blocking
+        try:
+            with metrics.track("search"):
+                return await self.pool.run(self.timeout, self._perform_search_sync, query)
+        except SearchQueueFull as e:
+            logger.error(f"Search rejected: {e}")
+            return []
+        except asyncio.TimeoutError:
+            logger.error(f"Search abandoned after {self.timeout}s: {query}")
+            return []
     
     def format_search_results(self, results: List[Dict[str, Any]]) -> str:
         """
@@ -136,6 +382,22 @@ class SearchService:
         """
         Perform a news search.
         
+        Args:
+            query: Search query
+            
+        Returns:
+            List of news results
+        """
+        if self.cache is None:
+            return await self._search_news_uncached(query)
+        
+        key = SearchCache.make_key("news", query, self.region, self.max_results)
+        return await self.cache.get_or_fetch(key, lambda: self._search_news_uncached(query))
+    
+    async def _search_news_uncached(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Perform a news search without the cache.
+        
         Args:
             query: Search query
             
@@ -145,10 +407,8 @@ class SearchService:
         try:
             logger.info(f"Performing DDGS news search for: {query}")
             
-            loop = asyncio.get_event_loop()
-            
             def _search_news():
-                ddgs = DDGS(timeout=self.timeout)
+                ddgs = self.pool.session(self.timeout)
                 return ddgs.news(
                     query=query,
                     region=self.region,
@@ -158,10 +418,8 @@ class SearchService:
                     backend="auto"
                 )
             
-            news_results = await loop.run_in_executor(
-                self._executor,
-                _search_news
-            )
+            with metrics.track("search"):
+                news_results = await self.pool.run(self.timeout, _search_news)
             
             # Format results
             results = []
@@ -178,11 +436,14 @@ class SearchService:
             logger.info(f"Found {len(results)} news results")
             return results
             
+        except (SearchQueueFull, asyncio.TimeoutError) as e:
+            logger.error(f"News search rejected or abandoned: {e!r}")
+            return []
         except Exception as e:
             logger.error(f"News search error: {e}", exc_info=True)
             return []
     
-    def __del__(self):
-        """Cleanup executor on deletion."""
-        if hasattr(self, '_executor'):
-            self._executor.shutdown(wait=False)
\ No newline at end of file
+    def close(self) -> None:
+        """Stop the worker pool if this service created it."""
+        if self._owns_pool:
+            self.pool.close()
\ No newline at end of file
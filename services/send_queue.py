@@ -0,0 +1,308 @@
+"""Outbound Bot API calls paced by Telegram flood limits."""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple, Union
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from services.groq_scheduler import TokenBucket
+from utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+
+class SendPriority(IntEnum):
+    """Call priority (lower value is sent first)."""
+
+    REPLY = 0
+    EDIT = 1
+    COSMETIC = 2
+
+
+@dataclass
+class _Job:
+    """Call waiting to be sent, possibly standing for several coalesced calls."""
+
+    call: Callable[[], Awaitable[Any]]
+    priority: SendPriority
+    key: Optional[Hashable]
+    seq: int
+    futures: List[asyncio.Future] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class _Chat:
+    """Pending calls and flood state of one chat."""
+
+    __slots__ = ("jobs", "bucket", "busy", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.jobs: Deque[_Job] = deque()
+        self.bucket = bucket
+        self.busy = False
+        self.paused_until = 0.0
+
+    def head(self) -> Optional[_Job]:
+        """Get the first job of the best priority."""
+        best = None
+        for job in self.jobs:
+            if best is None or job.priority < best.priority:
+                best = job
+                if job.priority == SendPriority.REPLY:
+                    break
+        return best
+
+
+class SendQueue:
+    """
+    Pace Bot API calls through a global and per-chat token buckets.
+
+    A chat has at most one call in flight, so its messages arrive in the
+    order they were sent. Replies go before edits, and edits go before
+    cosmetic calls such as deletes. An edit of a message that already has
+    an edit waiting replaces it, and both callers get the result of the
+    newer edit. ``TelegramRetryAfter`` pauses the chat for ``retry_after``
+    and the call is retried instead of failing.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: int = 3,
+        max_retries: int = 3
+    ):
+        """
+        Initialize send queue.
+
+        Args:
+            global_rate: Calls per second across all chats
+            chat_rate: Calls per second in a private chat
+            group_rate: Calls per second in a group
+            chat_burst: Calls a chat may make at once after being idle
+            max_retries: Flood-control retries before a call fails
+        """
+        self.global_bucket = TokenBucket(max(1.0, global_rate), global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._chats: Dict[ChatId, _Chat] = {}
+        self._depth = 0
+        self._seq = 0
+        self._running: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "sent": 0,
+            "coalesced": 0,
+            "flood_waits": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting to be sent."""
+        return self._depth
+
+    @property
+    def average_wait(self) -> float:
+        """Average time calls waited before being sent in seconds."""
+        sent = self.stats["sent"]
+        return self.stats["wait_total"] / sent if sent else 0.0
+
+    async def submit(
+        self,
+        chat_id: ChatId,
+        call: Callable[[], Awaitable[Any]],
+        priority: SendPriority = SendPriority.REPLY,
+        key: Optional[Hashable] = None
+    ) -> Any:
+        """
+        Queue a call and wait for its result.
+
+        Args:
+            chat_id: Chat the call is made in
+            call: Coroutine function making the request
+            priority: Call priority
+            key: Calls with the same key in a chat are coalesced while waiting
+
+        Returns:
+            Result of the call (of the newest call for coalesced calls)
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._dispatch())
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_burst, rate))
+
+        future = loop.create_future()
+        job = None
+        if key is not None:
+            job = next((j for j in chat.jobs if j.key == key), None)
+        if job is not None:
+            job.call = call
+            self.stats["coalesced"] += 1
+        else:
+            self._seq += 1
+            job = _Job(call=call, priority=priority, key=key, seq=self._seq)
+            chat.jobs.append(job)
+            self._depth += 1
+        job.futures.append(future)
+        self._wakeup.set()
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._discard(chat, job, future)
+            raise
+
+    def close(self) -> None:
+        """Stop dispatching and fail waiting calls."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                for future in job.futures:
+                    if not future.done():
+                        future.cancel()
+        self._chats.clear()
+        self._depth = 0
+
+    def _discard(self, chat: _Chat, job: _Job, future: asyncio.Future) -> None:
+        """Forget a cancelled caller and drop its call if nobody waits for it."""
+        if future in job.futures:
+            job.futures.remove(future)
+        if not job.futures and job in chat.jobs:
+            chat.jobs.remove(job)
+            self._depth -= 1
+            self.stats["cancelled"] += 1
+
+    def _next(self, now: float) -> Tuple[Optional[ChatId], Optional[_Job], Optional[float]]:
+        """
+        Find the next call that chat limits allow.
+
+        Returns:
+            Chat ID and job (None if no chat is ready), and the delay until
+            the next waiting chat is ready (None if nothing waits)
+        """
+        best_id, best_job = None, None
+        delay = None
+        idle = []
+        for chat_id, chat in self._chats.items():
+            if chat.busy:
+                continue
+            job = chat.head()
+            if job is None:
+                if now >= chat.paused_until and not chat.bucket.wait_time(chat.bucket.capacity):
+                    idle.append(chat_id)
+                continue
+
+            wait = max(chat.paused_until - now, chat.bucket.wait_time(1))
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            if best_job is None or (job.priority, job.seq) < (best_job.priority, best_job.seq):
+                best_id, best_job = chat_id, job
+
+        # Chats with a full bucket and nothing queued carry no state
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+        return best_id, best_job, delay
+
+    async def _sleep(self, delay: Optional[float]) -> None:
+        """Wait for a new call, a finished call or the delay."""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self) -> None:
+        """Send queued calls as bucket capacity becomes available."""
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id, job, delay = self._next(time.monotonic())
+            if job is None:
+                await self._sleep(delay)
+                continue
+
+            delay = self.global_bucket.wait_time(1)
+            if delay > 0:
+                await self._sleep(delay)
+                continue
+
+            chat = self._chats[chat_id]
+            chat.jobs.remove(job)
+            chat.busy = True
+            self._depth -= 1
+            chat.bucket.consume(1)
+            self.global_bucket.consume(1)
+
+            waited = time.monotonic() - job.enqueued_at
+            self.stats["wait_total"] += waited
+            self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+            metrics.observe("telegram_queue", waited)
+            if waited > 5:
+                logger.info(f"Bot API call waited {waited:.1f}s, {self._depth} still queued")
+
+            task = loop.create_task(self._send(chat, job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _send(self, chat: _Chat, job: _Job) -> None:
+        """Make a call and settle its callers, or requeue it on flood control."""
+        try:
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            self.stats["flood_waits"] += 1
+            chat.paused_until = time.monotonic() + e.retry_after
+            logger.warning(f"Flood control: chat paused for {e.retry_after}s")
+            if job.attempts <= self.max_retries and any(not f.done() for f in job.futures):
+                chat.jobs.appendleft(job)
+                self._depth += 1
+            else:
+                self._settle(job, error=e)
+        except Exception as e:
+            self._settle(job, error=e)
+        else:
+            self.stats["sent"] += 1
+            self._settle(job, result=result)
+        finally:
+            chat.busy = False
+            self._wakeup.set()
+
+    def _settle(self, job: _Job, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Resolve callers of a job."""
+        if error is not None:
+            self.stats["failed"] += 1
+        for future in job.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,314 @@
+"""Fan-out of updates from one ingress process to sharded worker processes."""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_key(update: Update) -> int:
+    """
+    Get the key an update is sharded by.
+
+    Updates of the same user share a key, so they are handled by one
+    worker in order. Updates without a user fall back to the chat, then
+    to the update ID.
+
+    Args:
+        update: Incoming update
+
+    Returns:
+        Non-negative shard key
+    """
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return abs(chat.id)
+    return update.update_id
+
+
+class UpdateWorkerPool:
+    """
+    Worker processes fed with serialized updates.
+
+    Each worker has its own bounded queue and every update goes to the
+    worker chosen by its shard key, so a user is always served by the same
+    process. When a queue is full, ``submit`` waits for room up to
+    ``put_timeout`` and then drops the update. A worker found dead is
+    restarted with a fresh queue that takes over the updates still queued
+    for it. A worker that died again within ``restart_delay`` is not
+    restarted yet; its updates fail over to the next live worker.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        target: Callable[..., None],
+        args: Tuple[Any, ...] = (),
+        max_queue: int = 1000,
+        put_timeout: float = 5.0,
+        restart_delay: float = 5.0
+    ):
+        """
+        Initialize pool.
+
+        Args:
+            workers: Number of worker processes
+            target: Worker entry point called as ``target(index, queue, *args)``
+            args: Extra picklable arguments of the entry point
+            max_queue: Updates queued per worker at most
+            put_timeout: Maximum time to wait for room in a full queue in seconds
+            restart_delay: Minimum time between restarts of a worker in seconds
+        """
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.restart_delay = restart_delay
+
+        # Spawn so workers do not inherit the ingress event loop
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(max_queue) for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._started_at = [0.0] * workers
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._closing = False
+
+        self.stats = {
+            "submitted": [0] * workers,
+            "restarts": 0,
+            "failed_over": 0,
+            "dropped": 0,
+        }
+
+    def start(self) -> None:
+        """Start worker processes."""
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Started {self.workers} update workers")
+
+    def _spawn(self, index: int) -> None:
+        """Start the worker process of a queue."""
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self._queues[index], *self.args),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def _alive(self, index: int) -> bool:
+        """Check a worker, restarting it if it died and may be restarted."""
+        process = self._processes[index]
+        if process is None or process.is_alive():
+            return process is not None
+        if self._closing or time.monotonic() - self._started_at[index] < self.restart_delay:
+            return False
+
+        logger.error(f"Worker {process.name} died with exit code {process.exitcode}, restarting")
+        process.close()
+        # The dead worker may have held the queue's read lock, so move what
+        # can still be read to a fresh queue instead of reusing it
+        old, new = self._queues[index], self._context.Queue(self.max_queue)
+        moved = 0
+        while True:
+            try:
+                new.put_nowait(old.get_nowait())
+                moved += 1
+            except (queue.Empty, queue.Full):
+                break
+        old.close()
+        self._queues[index] = new
+        self._spawn(index)
+        self.stats["restarts"] += 1
+        logger.info(f"Worker {index} restarted with {moved} queued updates")
+        return True
+
+    def _route(self, key: int) -> Optional[int]:
+        """Get the worker for a shard key, failing over from a dead one."""
+        home = key % self.workers
+        for offset in range(self.workers):
+            index = (home + offset) % self.workers
+            if self._alive(index):
+                if offset:
+                    self.stats["failed_over"] += 1
+                return index
+        return None
+
+    async def submit(self, key: int, payload: str) -> bool:
+        """
+        Queue a serialized update for the worker owning ``key``.
+
+        Args:
+            key: Shard key
+            payload: Update JSON
+
+        Returns:
+            False if the update was dropped
+        """
+        index = self._route(key)
+        if index is None:
+            self.stats["dropped"] += 1
+            logger.error("No live update worker, dropping update")
+            return False
+
+        lock = self._locks.setdefault(index, asyncio.Lock())
+        # Fast path; later updates must not overtake ones waiting for room
+        if not lock.locked():
+            try:
+                self._queues[index].put_nowait(payload)
+                self.stats["submitted"][index] += 1
+                return True
+            except queue.Full:
+                pass
+
+        async with lock:
+            deadline = time.monotonic() + self.put_timeout
+            while time.monotonic() < deadline:
+                if not self._alive(index):
+                    break
+                try:
+                    self._queues[index].put_nowait(payload)
+                    self.stats["submitted"][index] += 1
+                    return True
+                except queue.Full:
+                    await asyncio.sleep(0.05)
+
+        self.stats["dropped"] += 1
+        logger.error(f"Update worker {index} is not keeping up, dropping update")
+        return False
+
+    def depths(self) -> List[Optional[int]]:
+        """Approximate number of queued updates per worker (None if unknown)."""
+        depths = []
+        for updates in self._queues:
+            try:
+                depths.append(updates.qsize())
+            except NotImplementedError:
+                depths.append(None)
+        return depths
+
+    def close(self, timeout: float = 30.0) -> None:
+        """
+        Let workers finish queued updates and stop them.
+
+        Args:
+            timeout: Time to wait for each worker before terminating it
+        """
+        self._closing = True
+        for index, updates in enumerate(self._queues):
+            process = self._processes[index]
+            if process is None or not process.is_alive():
+                continue
+            try:
+                updates.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning(f"Could not send stop signal to {process.name}")
+
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+                process.join()
+        self._processes = [None] * self.workers
+
+
+async def serve_updates(
+    updates: "multiprocessing.Queue",
+    dp: Dispatcher,
+    bot: Bot,
+    max_in_flight: int = 500
+) -> None:
+    """
+    Handle updates from a worker queue until the stop sentinel arrives.
+
+    Updates of different users run concurrently; updates sharing a shard
+    key run one after another in arrival order. A dedicated thread reads
+    the queue, and no more than ``max_in_flight`` updates are taken from
+    it at a time, so a busy worker leaves the rest queued where the
+    ingress can see them.
+
+    Args:
+        updates: Queue of update JSON strings (None stops the loop)
+        dp: Dispatcher with handlers and services
+        bot: Bot instance used to answer
+        max_in_flight: Updates handled concurrently at most
+    """
+    loop = asyncio.get_running_loop()
+    locks: Dict[int, asyncio.Lock] = {}
+    pending: Dict[int, int] = {}
+    tasks: Set[asyncio.Task] = set()
+    slots = asyncio.Semaphore(max_in_flight)
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    def read() -> None:
+        """Hand queued payloads to the event loop one at a time."""
+        while True:
+            payload = updates.get()
+            try:
+                asyncio.run_coroutine_threadsafe(inbox.put(payload), loop).result()
+            except RuntimeError:
+                # The event loop is gone
+                return
+            if payload is None:
+                return
+
+    reader = threading.Thread(target=read, name="update-reader", daemon=True)
+    reader.start()
+
+    async def process(update: Update) -> None:
+        """Handle an update after earlier updates with the same key."""
+        key = shard_key(update)
+        # Locks are FIFO and tasks start in creation order, so updates
+        # of one user are handled in the order they were received
+        lock = locks.setdefault(key, asyncio.Lock())
+        pending[key] = pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Failed to handle update {update.update_id}: {e}", exc_info=True)
+        finally:
+            pending[key] -= 1
+            if not pending[key]:
+                del pending[key]
+                del locks[key]
+            slots.release()
+
+    while True:
+        await slots.acquire()
+        payload = await inbox.get()
+        if payload is None:
+            slots.release()
+            break
+
+        try:
+            update = Update.model_validate_json(payload, context={"bot": bot})
+        except Exception as e:
+            slots.release()
+            logger.error(f"Dropping malformed update: {e}")
+            continue
+
+        task = loop.create_task(process(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
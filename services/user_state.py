@@ -0,0 +1,206 @@
+"""Per-user settings and the Redis backend for shared user state."""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.conversation_store import ChatMessage
+from services.redis_client import RedisClient
+from utils.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS: Dict[str, Any] = {"reasoning": True}
+
+
+class RedisStateBackend:
+    """
+    Redis persistence for conversations and settings (blocking, run in a thread).
+
+    Implements the conversation backend interface of ``ConversationStore``
+    and the settings backend interface of ``UserSettings``, so worker
+    processes can share user state through one Redis server.
+    """
+
+    def __init__(self, client: RedisClient, prefix: str = "groqbot:", ttl: Optional[int] = None):
+        """
+        Initialize Redis backend.
+
+        Args:
+            client: Redis client
+            prefix: Key prefix
+            ttl: Optional expiry of idle users in seconds
+        """
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _set_command(self, key: str, value: str) -> Tuple[Any, ...]:
+        """Build SET command with the optional expiry."""
+        if self.ttl:
+            return ("SET", key, value, "EX", self.ttl)
+        return ("SET", key, value)
+
+    def load(self, user_id: int) -> Optional[List[ChatMessage]]:
+        """
+        Load conversation of a user.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Stored messages or None if the user is unknown
+        """
+        data = self.client.execute("GET", f"{self.prefix}conv:{user_id}")
+        if data is None:
+            return None
+        return [ChatMessage(*item) for item in json.loads(data)]
+
+    def save_many(self, items: Iterable[Tuple[int, List[ChatMessage]]]) -> None:
+        """
+        Save conversations in one pipeline.
+
+        Args:
+            items: Pairs of user ID and messages
+        """
+        commands = [
+            self._set_command(
+                f"{self.prefix}conv:{user_id}",
+                json.dumps(
+                    [(m.role, m.content, m.tokens) for m in messages],
+                    ensure_ascii=False
+                )
+            )
+            for user_id, messages in items
+        ]
+        if commands:
+            self.client.pipeline(commands)
+
+    def load_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Load settings of a user.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Stored settings or None if the user is unknown
+        """
+        data = self.client.execute("GET", f"{self.prefix}settings:{user_id}")
+        return json.loads(data) if data is not None else None
+
+    def save_settings(self, user_id: int, settings: Dict[str, Any]) -> None:
+        """
+        Save settings of a user.
+
+        Args:
+            user_id: Telegram user ID
+            settings: Settings to store
+        """
+        self.client.execute(
+            *self._set_command(f"{self.prefix}settings:{user_id}", json.dumps(settings))
+        )
+
+    def close(self) -> None:
+        """Close Redis connection."""
+        self.client.close()
+
+
+class UserSettings:
+    """
+    Per-user bot settings.
+
+    Settings live in an in-process LRU + TTL cache. With a backend they
+    are written through on change and reloaded on a miss; without one the
+    cache is the only copy, which is enough when each user is always
+    served by the same process.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[RedisStateBackend] = None,
+        max_users: int = 100_000,
+        ttl: float = 86400
+    ):
+        """
+        Initialize settings store.
+
+        Args:
+            backend: Optional shared backend
+            max_users: Maximum number of users kept in memory
+            ttl: Idle time in seconds after which settings are evicted
+        """
+        self.backend = backend
+        self._cache = TTLCache(max_entries=max_users, ttl=ttl)
+
+    async def get(self, user_id: int, key: str) -> Any:
+        """
+        Get a setting of a user.
+
+        Args:
+            user_id: Telegram user ID
+            key: Setting name
+
+        Returns:
+            Setting value or its default
+        """
+        settings = await self._load(user_id)
+        return settings.get(key, DEFAULT_SETTINGS.get(key))
+
+    async def set(self, user_id: int, key: str, value: Any) -> None:
+        """
+        Change a setting of a user.
+
+        Args:
+            user_id: Telegram user ID
+            key: Setting name
+            value: New value
+        """
+        settings = dict(await self._load(user_id))
+        settings[key] = value
+        self._cache.set(user_id, settings)
+
+        if self.backend is None:
+            return
+
+        try:
+            await asyncio.to_thread(self.backend.save_settings, user_id, settings)
+        except Exception as e:
+            logger.error(f"Failed to save settings of {user_id}: {e}")
+
+    async def toggle(self, user_id: int, key: str) -> bool:
+        """
+        Invert a boolean setting.
+
+        Args:
+            user_id: Telegram user ID
+            key: Setting name
+
+        Returns:
+            New value
+        """
+        value = not await self.get(user_id, key)
+        await self.set(user_id, key, value)
+        return value
+
+    async def close(self) -> None:
+        """Close the backend."""
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.close)
+
+    async def _load(self, user_id: int) -> Dict[str, Any]:
+        """Get cached settings or load them from the backend."""
+        settings = self._cache.get(user_id)
+        if settings is not None:
+            return settings
+
+        settings = {}
+        if self.backend is not None:
+            try:
+                settings = await asyncio.to_thread(self.backend.load_settings, user_id) or {}
+            except Exception as e:
+                logger.error(f"Failed to load settings of {user_id}: {e}")
+
+        self._cache.set(user_id, settings)
+        return settings
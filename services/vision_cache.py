@@ -0,0 +1,119 @@
+"""Caches for vision analysis keyed on Telegram file_unique_id."""
+import logging
+from typing import Optional, Tuple
+
+from utils.cache import TTLCache, SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+
+class VisionCache:
+    """
+    Cache of image analysis results and compressed image payloads.
+    
+    Results are keyed by (file_unique_id, normalized caption, vision model,
+    instructions version). Base64 payloads are keyed by file_unique_id
+    alone, so a known image with a new caption skips download and
+    compression. Both tiers are bounded by entry count and total size.
+    """
+    
+    def __init__(
+        self,
+        max_results: int = 5000,
+        result_ttl: float = 86400,
+        max_result_bytes: int = 32 * 1024 * 1024,
+        max_payloads: int = 500,
+        payload_ttl: float = 3600,
+        max_payload_bytes: int = 128 * 1024 * 1024
+    ):
+        """
+        Initialize vision cache.
+        
+        Args:
+            max_results: Maximum number of cached analysis results
+            result_ttl: Time to live of results in seconds
+            max_result_bytes: Size limit of all cached results
+            max_payloads: Maximum number of cached base64 payloads
+            payload_ttl: Time to live of payloads in seconds
+            max_payload_bytes: Size limit of all cached payloads
+        """
+        self.results = TTLCache(
+            max_entries=max_results,
+            ttl=result_ttl,
+            max_weight=max_result_bytes,
+            weigher=len
+        )
+        self.payloads = TTLCache(
+            max_entries=max_payloads,
+            ttl=payload_ttl,
+            max_weight=max_payload_bytes,
+            weigher=len
+        )
+        self.flights = SingleFlight()
+    
+    @staticmethod
+    def result_key(
+        file_unique_id: str,
+        caption: str,
+        model: str,
+        instructions_version: str
+    ) -> Tuple[str, str, str, str]:
+        """
+        Build result cache key.
+        
+        Args:
+            file_unique_id: Telegram file_unique_id of the photo
+            caption: User prompt
+            model: Vision model name
+            instructions_version: Hash of the instructions in use
+            
+        Returns:
+            Cache key with normalized caption
+        """
+        normalized = " ".join(caption.lower().split())
+        return (file_unique_id, normalized, model, instructions_version)
+    
+    def get_result(self, key: Tuple[str, str, str, str]) -> Optional[str]:
+        """
+        Get cached analysis result.
+        
+        Args:
+            key: Result cache key
+            
+        Returns:
+            Model response or None
+        """
+        return self.results.get(key)
+    
+    def set_result(self, key: Tuple[str, str, str, str], result: str) -> None:
+        """
+        Store analysis result.
+        
+        Args:
+            key: Result cache key
+            result: Model response
+        """
+        self.results.set(key, result)
+    
+    def get_payload(self, file_unique_id: str) -> Optional[str]:
+        """
+        Get cached base64 payload.
+        
+        Args:
+            file_unique_id: Telegram file_unique_id of the photo
+            
+        Returns:
+            Base64 encoded image or None
+        """
+        return self.payloads.get(file_unique_id)
+    
+    def set_payload(self, file_unique_id: str, base64_image: str) -> None:
+        """
+        Store base64 payload.
+        
+        Args:
+            file_unique_id: Telegram file_unique_id of the photo
+            base64_image: Base64 encoded image
+        """
+        self.payloads.set(file_unique_id, base64_image)
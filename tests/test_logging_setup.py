@@ -0,0 +1,48 @@
+"""Queue-based logging."""
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+from utils.worker_pool import WorkerPool
+from utils.logging_setup import setup_logging
+
+
+def log_from_worker(message: str) -> None:
+    """Log a record from a pool worker."""
+    logging.getLogger("tests.worker").info(message)
+
+
+def worker_lines(log_file: Path) -> int:
+    """Count records logged by pool workers."""
+    return sum("tests.worker" in line for line in log_file.read_text(encoding="utf-8").splitlines())
+
+
+def test_process_pool_workers_log_to_the_listener(tmp_path: Path) -> None:
+    log_file = tmp_path / "bot.log"
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    listener = setup_logging(log_file)
+    try:
+        async def scenario() -> None:
+            pool = WorkerPool(kind="process", max_workers=2)
+            try:
+                for n in range(3):
+                    await pool.run(log_from_worker, f"from worker {n}")
+            finally:
+                pool.close()
+
+        asyncio.run(scenario())
+        # Worker records cross a pipe, so they may land after the results
+        deadline = time.monotonic() + 5
+        while worker_lines(log_file) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        listener.stop()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+
+    assert worker_lines(log_file) == 3
@@ -0,0 +1,246 @@
+"""Message splitting and Markdown rendering on random answers.
+
+Inputs are drawn from seeded generators, so every case is reproducible
+from its seed.
+"""
+import html
+import random
+import re
+from typing import List, Tuple
+
+import pytest
+
+from utils.markdown_render import render_markdown
+from utils.message_splitter import MessageSplitter
+
+
+WORDS = [
+    "ответ", "модель", "данные", "запрос", "Telegram", "value", "x2", "42",
+    "очень", "длинное", "слово" * 8, "a<b", "R&D", "ok", "да",
+]
+LANGUAGES = ["", "python", "bash"]
+TELEGRAM_TAGS = {"b", "i", "s", "u", "code", "pre", "a", "blockquote", "tg-spoiler"}
+
+MARKDOWN_LINK = re.compile(r"\[[^\[\]\n]*\]\([^()\s]+\)")
+HTML_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^<>]*>")
+HTML_ENTITY = re.compile(r"&(?:#\d+|\w+);")
+
+
+def words(rng: random.Random, low: int, high: int) -> List[str]:
+    """Draw a run of words."""
+    return [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+
+
+def telegram_markdown(rng: random.Random, size: int) -> str:
+    """Build balanced Telegram Markdown of about ``size`` characters."""
+    blocks = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.15:
+            lines = [" ".join(words(rng, 0, 12)) for _ in range(rng.randint(1, 15))]
+            block = f"```{rng.choice(LANGUAGES)}\n" + "\n".join(lines) + "\n```"
+        else:
+            parts = []
+            for _ in range(rng.randint(1, 40)):
+                span = " ".join(words(rng, 1, 6))
+                style = rng.random()
+                if style < 0.1:
+                    span = f"*{span}*"
+                elif style < 0.2:
+                    span = f"_{span}_"
+                elif style < 0.3:
+                    span = f"`{span}`"
+                elif style < 0.35:
+                    span = f"[{span}](https://example.com/{rng.randint(0, 99)})"
+                elif style < 0.4:
+                    span = f"*{span} _{' '.join(words(rng, 1, 3))}_*"
+                parts.append(span + rng.choice(["", ".", "!", "\n"]))
+            block = " ".join(parts)
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks)
+
+
+def model_markdown(rng: random.Random, size: int) -> Tuple[str, List[str]]:
+    """Build model-style Markdown and the words a reader should see."""
+    blocks = []
+    visible: List[str] = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            lines = [" ".join(words(rng, 1, 8)) for _ in range(rng.randint(1, 6))]
+            block = f"```{rng.choice(LANGUAGES)}\n" + "\n".join(lines) + "\n```"
+            visible.extend(" ".join(lines).split())
+        elif kind < 0.2:
+            text = words(rng, 1, 6)
+            block = f"{'#' * rng.randint(1, 3)} {' '.join(text)}"
+            visible.extend(text)
+        elif kind < 0.3:
+            items = [words(rng, 1, 8) for _ in range(rng.randint(1, 5))]
+            block = "\n".join(f"- {' '.join(item)}" for item in items)
+            visible.extend(word for item in items for word in item)
+        elif kind < 0.35:
+            text = words(rng, 1, 10)
+            block = f"> {' '.join(text)}"
+            visible.extend(text)
+        else:
+            parts = []
+            for _ in range(rng.randint(1, 20)):
+                text = words(rng, 1, 6)
+                span = " ".join(text)
+                style = rng.random()
+                if style < 0.1:
+                    span = f"**{span}**"
+                elif style < 0.2:
+                    span = f"*{span}*"
+                elif style < 0.3:
+                    span = f"`{span}`"
+                elif style < 0.35:
+                    span = f"[{span}](https://example.com/{rng.randint(0, 99)})"
+                elif style < 0.4:
+                    span = f"~~{span}~~"
+                parts.append(span)
+                visible.extend(text)
+            block = " ".join(parts)
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks), visible
+
+
+def open_markdown(chunk: str) -> List[str]:
+    """Get entities a Telegram Markdown chunk leaves open."""
+    stack: List[str] = []
+    i = 0
+    while i < len(chunk):
+        if stack and stack[-1] in ("```", "`"):
+            end = chunk.find(stack[-1], i)
+            if end < 0:
+                return stack
+            stack.pop()
+            i = end + 3 if chunk.startswith("```", end) else end + 1
+            continue
+        if chunk.startswith("```", i):
+            stack.append("```")
+            i += 3
+        elif chunk[i] == "`":
+            stack.append("`")
+            i += 1
+        elif chunk[i] in "*_":
+            if chunk[i] in stack:
+                del stack[stack.index(chunk[i]):]
+            else:
+                stack.append(chunk[i])
+            i += 1
+        elif chunk[i] == "[":
+            link = MARKDOWN_LINK.match(chunk, i)
+            if link is None:
+                return ["["]
+            i = link.end()
+        else:
+            i += 1
+    return stack
+
+
+def open_html(chunk: str) -> List[str]:
+    """Get tags an HTML chunk leaves open, or a marker for broken markup."""
+    stack: List[str] = []
+    for match in HTML_TAG.finditer(chunk):
+        closing, name = match.groups()
+        if not closing:
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            return [f"</{name}>"]
+    text = HTML_TAG.sub("", chunk)
+    if "<" in text or ">" in text or text.count("&") != len(HTML_ENTITY.findall(text)):
+        return ["broken markup"]
+    return stack
+
+
+def visible_text(text: str, mode: str) -> str:
+    """Strip markup and whitespace, leaving what a chunk contributes."""
+    if mode == "markdown":
+        text = re.sub(r"```[^\n`]*\n?", "", text)
+        text = re.sub(r"\]\([^()\s]*\)", "", text)
+        text = re.sub(r"[`*_\[]", "", text)
+    elif mode == "html":
+        text = HTML_TAG.sub("", text)
+    return re.sub(r"\s+", "", text)
+
+
+def check_chunks(text: str, chunks: List[str], max_length: int, mode: str) -> None:
+    """Assert the splitting invariants."""
+    assert all(len(chunk) <= max_length for chunk in chunks)
+    if mode == "markdown":
+        assert [open_markdown(chunk) for chunk in chunks] == [[]] * len(chunks)
+    elif mode == "html":
+        assert [open_html(chunk) for chunk in chunks] == [[]] * len(chunks)
+    assert "".join(visible_text(chunk, mode) for chunk in chunks) == visible_text(text, mode)
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_markdown_chunks_fit_and_stay_balanced(seed: int) -> None:
+    rng = random.Random(seed)
+    text = telegram_markdown(rng, rng.randint(300, 6000))
+    max_length = rng.randint(80, 1000)
+    chunks = MessageSplitter.split_message(text, max_length, "Markdown")
+    check_chunks(text, chunks, max_length, "markdown")
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_html_chunks_fit_and_stay_balanced(seed: int) -> None:
+    rng = random.Random(seed)
+    text = render_markdown(model_markdown(rng, rng.randint(300, 6000))[0])
+    max_length = rng.randint(120, 1000)
+    chunks = MessageSplitter.split_message(text, max_length, "HTML")
+    check_chunks(text, chunks, max_length, "html")
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_plain_chunks_keep_the_text(seed: int) -> None:
+    rng = random.Random(seed)
+    text = telegram_markdown(rng, rng.randint(300, 6000))
+    max_length = rng.randint(20, 1000)
+    chunks = MessageSplitter.split_message(text, max_length, None)
+    check_chunks(text, chunks, max_length, "plain")
+
+
+def test_word_breaks_are_preferred_to_cutting_words() -> None:
+    text = " ".join(["слово"] * 100)
+    chunks = MessageSplitter.split_message(text, 64, None)
+    assert all(set(chunk.split()) == {"слово"} for chunk in chunks)
+
+
+def test_paragraph_breaks_are_preferred_to_word_breaks() -> None:
+    first = " ".join(["первый"] * 8)
+    second = " ".join(["второй"] * 20)
+    chunks = MessageSplitter.split_message(f"{first}\n\n{second}", 100, None)
+    assert chunks[0] == first
+
+
+def test_cut_never_lands_inside_a_tag() -> None:
+    code = "\n".join(["print(1)"] * 50)
+    text = "слово " * 9 + f'<pre><code class="language-python">{code}</code></pre>'
+    for max_length in range(80, 200, 7):
+        chunks = MessageSplitter.split_message(text, max_length, "HTML")
+        check_chunks(text, chunks, max_length, "html")
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_rendered_html_is_balanced_and_keeps_the_words(seed: int) -> None:
+    rng = random.Random(seed)
+    markdown, visible = model_markdown(rng, rng.randint(50, 3000))
+    rendered = render_markdown(markdown)
+
+    assert {name for _, name in HTML_TAG.findall(rendered)} <= TELEGRAM_TAGS
+    assert open_html(rendered) == []
+    shown = html.unescape(HTML_TAG.sub("", rendered)).split()
+    # Bullets are the only text the renderer adds
+    assert [word for word in shown if word != "•"] == " ".join(visible).split()
+
+
+def test_unterminated_fence_and_thinking_are_closed() -> None:
+    rendered = render_markdown("<think>думаю & считаю\n\n```python\nx = 1 < 2")
+    assert open_html(rendered) == []
+    assert "x = 1 &lt; 2" in rendered
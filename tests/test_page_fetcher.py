@@ -0,0 +1,89 @@
+"""Page fetching against a local web server."""
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.bench_page_fetch import PARAGRAPH, make_page
+from benchmarks.fakes import FakeWebServer
+from services.page_fetcher import PageFetcher
+from utils.worker_pool import WorkerPool
+
+
+SNIPPET = "Короткий сниппет."
+
+
+def result(link: str) -> Dict[str, Any]:
+    """Build a search result for a page."""
+    return {"number": 1, "title": "Результат", "link": link, "body": SNIPPET}
+
+
+async def start(**kwargs: Any) -> Tuple[FakeWebServer, PageFetcher]:
+    """Start a web server and a fetcher extracting text inline."""
+    server = FakeWebServer(max_age=3600)
+    await server.start()
+    pool = WorkerPool(kind="inline", name="page")
+    return server, PageFetcher(pool, **kwargs)
+
+
+async def stop(server: FakeWebServer, fetcher: PageFetcher) -> None:
+    """Stop the fetcher and the web server."""
+    await fetcher.close()
+    fetcher.pool.close()
+    await server.close()
+
+
+def test_pages_missing_the_deadline_are_dropped() -> None:
+    async def scenario() -> Tuple[List[Dict[str, Any]], float, Dict[str, int]]:
+        server, fetcher = await start(deadline=0.3)
+        rng = random.Random(0)
+        fast = server.add_page("fast", make_page(rng, 3))
+        slow = server.add_page("slow", make_page(rng, 3), delay=1.0)
+        try:
+            started = time.perf_counter()
+            enriched = await fetcher.enrich([result(fast), result(slow)])
+            return enriched, time.perf_counter() - started, dict(fetcher.stats)
+        finally:
+            await stop(server, fetcher)
+
+    enriched, elapsed, stats = asyncio.run(scenario())
+    assert elapsed < 0.9
+    assert PARAGRAPH.split(",")[0] in enriched[0]["body"]
+    assert enriched[1]["body"] == SNIPPET
+    assert stats["late"] == 1
+
+
+def test_expired_pages_are_revalidated() -> None:
+    async def scenario() -> Tuple[str, str, FakeWebServer, PageFetcher]:
+        server, fetcher = await start(cache_ttl=0.1)
+        link = server.add_page("page", make_page(random.Random(0), 3))
+        try:
+            first = await fetcher.fetch(link)
+            await asyncio.sleep(0.2)
+            second = await fetcher.fetch(link)
+            return first, second, server, fetcher
+        finally:
+            await stop(server, fetcher)
+
+    first, second, server, fetcher = asyncio.run(scenario())
+    assert first and second == first
+    assert server.requests["page"] == 2
+    assert server.not_modified == 1
+    assert fetcher.stats["not_modified"] == 1
+    # The unchanged page was not downloaded and extracted again
+    assert fetcher.stats["fetched"] == 1
+
+
+def test_large_pages_are_cut_at_the_byte_cap() -> None:
+    async def scenario() -> Tuple[str, Dict[str, int]]:
+        server, fetcher = await start(max_bytes=64 * 1024)
+        link = server.add_page("big", make_page(random.Random(0), 3, padding=4 * 1024 * 1024))
+        try:
+            return await fetcher.fetch(link), dict(fetcher.stats)
+        finally:
+            await stop(server, fetcher)
+
+    text, stats = asyncio.run(scenario())
+    assert PARAGRAPH.split(",")[0] in text
+    assert stats["truncated"] == 1
+    assert stats["fetched"] == 1
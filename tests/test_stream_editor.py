@@ -0,0 +1,92 @@
+"""Streamed replies edited in the background."""
+import asyncio
+from typing import List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from utils.stream_editor import StreamingReply
+
+
+class SlowMessage:
+    """Message whose edits wait until released."""
+
+    def __init__(self, text: str = "Запрос получен"):
+        self.text = text
+        self.edits: List[str] = []
+        self.release: Optional[asyncio.Event] = None
+        self.failures: List[Exception] = []
+        self.sent: List["SlowMessage"] = []
+        self.deleted = False
+
+    async def edit_text(self, text: str, **kwargs) -> None:
+        if self.release is not None:
+            await self.release.wait()
+        if self.failures:
+            raise self.failures.pop(0)
+        self.edits.append(text)
+        self.text = text
+
+    async def answer(self, text: str, **kwargs) -> "SlowMessage":
+        self.sent.append(SlowMessage(text))
+        return self.sent[-1]
+
+    async def delete(self) -> None:
+        self.deleted = True
+
+
+def retry_after(seconds: float) -> TelegramRetryAfter:
+    """Build a flood-control error with a short wait."""
+    error = TelegramRetryAfter(EditMessageText(text=""), "Too Many Requests", 1)
+    error.retry_after = seconds
+    return error
+
+
+def test_update_does_not_wait_for_the_edit() -> None:
+    async def scenario() -> SlowMessage:
+        message = SlowMessage()
+        message.release = asyncio.Event()
+        reply = StreamingReply(message, min_interval=0.0, max_interval=0.0)
+
+        await reply.update("первая часть")
+        await asyncio.sleep(0.01)
+        # The edit is in flight; newer text waits for the next edit
+        assert message.edits == []
+        assert not reply.due
+        await reply.update("первая часть и вторая")
+
+        message.release.set()
+        await reply.finish("первая часть, вторая и третья")
+        return message
+
+    message = asyncio.run(scenario())
+    assert message.edits == ["первая часть", "первая часть, вторая и третья"]
+
+
+def test_final_edit_is_retried_after_flood_control() -> None:
+    async def scenario() -> SlowMessage:
+        message = SlowMessage()
+        message.failures = [retry_after(0.05)]
+        reply = StreamingReply(message, min_interval=0.0, max_interval=0.0)
+        await reply.finish("ответ")
+        return message
+
+    message = asyncio.run(scenario())
+    assert message.edits == ["ответ"]
+    assert message.sent == []
+
+
+def test_final_text_is_sent_when_the_edit_fails() -> None:
+    async def scenario() -> SlowMessage:
+        message = SlowMessage()
+        reply = StreamingReply(message, min_interval=0.0, max_interval=0.0)
+        await reply.update("первая часть")
+        await asyncio.sleep(0.01)
+        message.failures = [TelegramBadRequest(EditMessageText(text=""), "message can't be edited")]
+        await reply.finish("первая часть и вторая")
+        return message
+
+    message = asyncio.run(scenario())
+    assert message.edits == ["первая часть"]
+    assert [sent.text for sent in message.sent] == ["первая часть и вторая"]
+    assert message.deleted
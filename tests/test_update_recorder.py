@@ -0,0 +1,57 @@
+"""Anonymized update recording."""
+import asyncio
+import json
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from utils.update_recorder import UpdateRecorder
+
+
+def text_message(user_id: int, text: str = "Привет") -> SimpleNamespace:
+    """Build the parts of a message the recorder reads."""
+    return SimpleNamespace(
+        photo=None,
+        text=text,
+        from_user=SimpleNamespace(id=user_id),
+        chat=SimpleNamespace(id=user_id),
+    )
+
+
+def written_records(path: Path) -> List[Dict[str, Any]]:
+    """Read the records flushed so far from a file that is still open."""
+    data = zlib.decompressobj(wbits=31).decompress(path.read_bytes())
+    lines = data.decode("utf-8").splitlines()
+    return [json.loads(line) for line in lines[1:]]
+
+
+def test_records_are_flushed_on_a_timer(tmp_path: Path) -> None:
+    path = tmp_path / "updates.jsonl.gz"
+
+    async def scenario() -> List[Dict[str, Any]]:
+        recorder = UpdateRecorder(path, batch_size=256, flush_interval=0.05)
+        for user_id in (10, 20, 10):
+            recorder.record(text_message(user_id))
+        await asyncio.sleep(0.3)
+        records = written_records(path)
+        await recorder.close()
+        return records
+
+    records = asyncio.run(scenario())
+    assert [record["u"] for record in records] == [0, 1, 0]
+
+
+def test_forgotten_senders_get_new_numbers(tmp_path: Path) -> None:
+    path = tmp_path / "updates.jsonl.gz"
+
+    async def scenario() -> UpdateRecorder:
+        recorder = UpdateRecorder(path, max_users=2)
+        for user_id in (10, 20, 10, 30, 20):
+            recorder.record(text_message(user_id))
+        await recorder.close()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert len(recorder._users) == 2
+    assert [record["u"] for record in written_records(path)] == [0, 1, 0, 2, 3]
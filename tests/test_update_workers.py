@@ -0,0 +1,71 @@
+"""Sharded update workers: bounded queues and restarts."""
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from services.update_workers import UpdateWorkerPool
+
+
+def record_after_first_crash(index: int, updates, marker: str) -> None:
+    """Worker that dies on its first update once, then records what it gets."""
+    if not os.path.exists(marker):
+        updates.get()
+        Path(marker).touch()
+        os._exit(3)
+    with open(f"{marker}.{index}", "a") as out:
+        while True:
+            payload = updates.get()
+            if payload is None:
+                return
+            out.write(payload + "\n")
+            out.flush()
+
+
+def block(index: int, updates, marker: str) -> None:
+    """Worker that never reads its queue and exits once the stop file appears."""
+    while not os.path.exists(f"{marker}.stop"):
+        time.sleep(0.01)
+
+
+def test_dead_worker_is_restarted_with_its_queue(tmp_path: Path) -> None:
+    marker = str(tmp_path / "crashed")
+
+    async def scenario() -> UpdateWorkerPool:
+        pool = UpdateWorkerPool(
+            1, record_after_first_crash, (marker,), max_queue=10, restart_delay=0.0
+        )
+        pool.start()
+        # The first update kills the worker; the rest stay queued
+        for n in range(4):
+            assert await pool.submit(0, f"update {n}")
+        while pool._processes[0].is_alive():
+            await asyncio.sleep(0.05)
+
+        assert await pool.submit(0, "update 4")
+        await asyncio.to_thread(pool.close, 30)
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.stats["restarts"] == 1
+    assert pool.stats["dropped"] == 0
+    received = Path(f"{marker}.0").read_text().split("\n")[:-1]
+    assert received == [f"update {n}" for n in range(1, 5)]
+
+
+def test_full_queue_drops_after_timeout(tmp_path: Path) -> None:
+    marker = str(tmp_path / "blocked")
+
+    async def scenario() -> UpdateWorkerPool:
+        pool = UpdateWorkerPool(1, block, (marker,), max_queue=2, put_timeout=0.2)
+        pool.start()
+        results = [await pool.submit(0, f"update {n}") for n in range(4)]
+        Path(f"{marker}.stop").touch()
+        while pool._processes[0].is_alive():
+            await asyncio.sleep(0.05)
+        await asyncio.to_thread(pool.close, 30)
+        return pool, results
+
+    pool, results = asyncio.run(scenario())
+    assert results[:2] == [True, True]
+    assert pool.stats["dropped"] == results.count(False) >= 1
@@ -0,0 +1,122 @@
+"""Webhook mode against the fake Bot API."""
+import asyncio
+import socket
+from pathlib import Path
+from typing import List
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from benchmarks.fakes import FakeBotAPI
+from bot_main import run_webhook
+from config import Config
+
+
+def free_port() -> int:
+    """Get a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_config(token: str, port: int, tmp_path: Path) -> Config:
+    """Build a webhook configuration listening on a local port."""
+    return Config(
+        telegram_token=token,
+        groq_api_key="",
+        upload_directory=tmp_path,
+        bot_mode="webhook",
+        webhook_url=f"http://127.0.0.1:{port}",
+        webhook_host="127.0.0.1",
+        webhook_port=port,
+        webhook_secret="test-secret",
+    )
+
+
+async def start_webhook(fake: FakeBotAPI, bot: Bot, dp: Dispatcher, config: Config) -> asyncio.Task:
+    """Run the webhook server until the fake Bot API has received ``setWebhook``."""
+    server = asyncio.create_task(run_webhook(dp, bot, config))
+    await fake.wait_for("setWebhook", 1, timeout=10)
+    return server
+
+
+async def stop(server: asyncio.Task, fake: FakeBotAPI, bot: Bot) -> None:
+    """Stop the webhook server and the fake Bot API."""
+    server.cancel()
+    try:
+        await server
+    except asyncio.CancelledError:
+        pass
+    await bot.session.close()
+    await fake.close()
+
+
+def echo_dispatcher(received: List[str]) -> Dispatcher:
+    """Create a dispatcher that records and echoes text messages."""
+    router = Router()
+
+    @router.message()
+    async def echo(message: Message) -> None:
+        received.append(message.text)
+        await message.answer(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def test_webhook_dispatches_updates(tmp_path: Path) -> None:
+    received: List[str] = []
+
+    async def scenario() -> None:
+        fake = FakeBotAPI()
+        await fake.start()
+        bot = fake.make_bot()
+        dp = echo_dispatcher(received)
+        config = make_config(bot.token, free_port(), tmp_path)
+        server = await start_webhook(fake, bot, dp, config)
+        try:
+            assert fake.webhook_url == f"{config.webhook_url}{config.webhook_path}"
+            assert fake.webhook_secret == "test-secret"
+
+            for n in range(50):
+                fake.push(fake.message_update(1000 + n % 7, f"message {n}"))
+            await fake.wait_for("sendMessage", 50, timeout=10)
+        finally:
+            await stop(server, fake, bot)
+
+        assert fake.webhook_statuses == {200: 50}
+        assert sorted(message["text"] for message in fake.sent) == sorted(f"message {n}" for n in range(50))
+
+    asyncio.run(scenario())
+    assert sorted(received) == sorted(f"message {n}" for n in range(50))
+
+
+def test_webhook_rejects_wrong_secret(tmp_path: Path) -> None:
+    received: List[str] = []
+
+    async def scenario() -> int:
+        fake = FakeBotAPI()
+        await fake.start()
+        bot = fake.make_bot()
+        dp = echo_dispatcher(received)
+        config = make_config(bot.token, free_port(), tmp_path)
+        server = await start_webhook(fake, bot, dp, config)
+        try:
+            update = fake.message_update(1000, "forged")
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    fake.webhook_url,
+                    json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+                ) as response:
+                    status = response.status
+            # Give a wrongly accepted update time to reach the handler
+            await asyncio.sleep(0.1)
+        finally:
+            await stop(server, fake, bot)
+        return status
+
+    assert asyncio.run(scenario()) == 401
+    assert received == []
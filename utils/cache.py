@@ -0,0 +1,193 @@
+"""In-memory caching utilities."""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    LRU cache with per-entry TTL and optional weight limit.
+
+    Expired entries are not returned by ``get`` but stay in the cache until
+    they are evicted, so callers can still fall back to them with
+    ``get_stale`` when the upstream source fails.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 600,
+        max_weight: Optional[int] = None,
+        weigher: Optional[Callable[[Any], int]] = None
+    ):
+        """
+        Initialize cache.
+
+        Args:
+            max_entries: Maximum number of entries
+            ttl: Default time to live in seconds
+            max_weight: Optional limit for the total weight of entries
+            weigher: Function returning the weight of a value (required
+                together with max_weight)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._weight = 0
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "evictions": 0,
+        }
+
+    def __len__(self) -> int:
+        """Number of entries, including expired ones."""
+        return len(self._entries)
+
+    @property
+    def weight(self) -> int:
+        """Total weight of cached values."""
+        return self._weight
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups served from the cache."""
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a fresh value.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[2]
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a value even if it has expired.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value or None if missing
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        self.stats["stale_hits"] += 1
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Time to live in seconds (default TTL if omitted)
+        """
+        weight = self.weigher(value) if self.weigher else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+
+        self.pop(key)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, weight, value)
+        self._weight += weight
+
+        while len(self._entries) > self.max_entries or (
+            self.max_weight is not None and self._weight > self.max_weight
+        ):
+            _, (_, evicted_weight, _) = self._entries.popitem(last=False)
+            self._weight -= evicted_weight
+            self.stats["evictions"] += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """
+        Remove a value.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Removed value or None if missing
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+
+        self._weight -= entry[1]
+        return entry[2]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._entries.clear()
+        self._weight = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        """Initialize single-flight group."""
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of calls currently running."""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn`` unless a call with the same key is already running.
+
+        Args:
+            key: Call key
+            fn: Coroutine function producing the result
+
+        Returns:
+            Result of the (possibly shared) call
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark exception as retrieved if nobody else was waiting
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
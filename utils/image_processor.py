@@ -1,61 +1,168 @@
 """Image processing utilities."""
 import base64
+import io
 import logging
-from pathlib import Path
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
 from PIL import Image
 
-from config import get_config
+from config import Config, get_config
 
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class CompressionResult:
+    """Compressed image with encoder statistics."""
+    
+    data: bytes
+    original_size: int
+    resolution: Tuple[int, int]
+    quality: Optional[int]
+    passes: int
+    fits: bool
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    """Encode image as optimized JPEG."""
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def compress_image(
+    data: bytes,
+    max_bytes: int,
+    max_resolution: Tuple[int, int],
+    min_quality: int = 40,
+    max_quality: int = 90,
+    max_passes: int = 8
+) -> CompressionResult:
+    """
+    Encode an image to land just under a byte budget.
+    
+    Module-level so it can run in a worker process. JPEGs that already fit
+    the budget and resolution are passed through untouched. Otherwise the
+    image is downscaled to ``max_resolution`` (large JPEGs are decoded in
+    draft mode at the nearest DCT scale) and JPEG quality is bisected
+    between ``min_quality`` and ``max_quality``, stopping early once the
+    result is within 10% of the budget. If even ``min_quality`` does not
+    fit, the resolution is reduced by the estimated factor and the search
+    repeats from the lowest quality upwards. At most ``max_passes``
+    encodes are performed.
+    
+    Args:
+        data: Original image
+        max_bytes: Maximum size of the encoded image
+        max_resolution: Maximum resolution of the encoded image
+        min_quality: Lowest JPEG quality to try
+        max_quality: Highest JPEG quality to try
+        max_passes: Maximum number of encode passes
+        
+    Returns:
+        Compression result (``fits`` is False if the budget was not met)
+        
+    Raises:
+        ValueError: If ``max_passes`` is below 1 or the quality range is empty
+    """
+    if max_passes < 1:
+        raise ValueError(f"max_passes must be at least 1, got {max_passes}")
+    if min_quality > max_quality:
+        raise ValueError(f"min_quality {min_quality} is above max_quality {max_quality}")
+    
+    img = Image.open(io.BytesIO(data))
+    
+    if (
+        img.format == "JPEG"
+        and len(data) <= max_bytes
+        and img.width <= max_resolution[0]
+        and img.height <= max_resolution[1]
+    ):
+        return CompressionResult(data, len(data), img.size, None, 0, True)
+    
+    if img.format == "JPEG":
+        img.draft("RGB", max_resolution)
+    
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.thumbnail(max_resolution)
+    
+    passes = 0
+    smallest: Optional[Tuple[bytes, int]] = None
+    
+    while passes < max_passes:
+        lo, hi = min_quality, max_quality
+        # After a downscale the budget is tight, so start from the bottom
+        quality = max_quality if smallest is None else min_quality
+        fit: Optional[Tuple[bytes, int]] = None
+        
+        while lo <= hi and passes < max_passes:
+            encoded = _encode_jpeg(img, quality)
+            passes += 1
+            
+            if smallest is None or len(encoded) < len(smallest[0]):
+                smallest = (encoded, quality)
+            
+            if len(encoded) <= max_bytes:
+                fit = (encoded, quality)
+                if len(encoded) >= max_bytes * 0.9:
+                    break
+                lo = quality + 1
+            else:
+                hi = quality - 1
+            quality = (lo + hi) // 2
+        
+        if fit is not None:
+            result = CompressionResult(fit[0], len(data), img.size, fit[1], passes, True)
+            break
+        
+        if passes >= max_passes:
+            encoded, quality = smallest
+            result = CompressionResult(encoded, len(data), img.size, quality, passes, False)
+            break
+        
+        # Even the lowest quality is too large: shrink by the estimated factor
+        scale = max(0.5, min(0.9, 0.95 * (max_bytes / len(smallest[0])) ** 0.5))
+        img = img.resize(
+            (max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+            Image.LANCZOS
+        )
+    
+    logger.info(
+        f"Image compressed from {result.original_size} to {len(result.data)} bytes "
+        f"with resolution {result.resolution}, quality {result.quality} "
+        f"in {result.passes} passes"
+    )
+    return result
+
+
 class ImageProcessor:
     """Image processing utilities."""
     
-    def __init__(self):
-        """Initialize image processor."""
-        self.config = get_config()
-    
-    def encode_image(self, image_path: Path) -> str:
+    def __init__(self, config: Optional[Config] = None):
         """
-        Encode image to base64.
+        Initialize image processor.
         
         Args:
-            image_path: Path to image file
-            
-        Returns:
-            Base64 encoded image string
+            config: Bot configuration (global config if omitted)
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    
-    def reduce_image_size(
-        self,
-        input_path: Path,
-        output_path: Path
-    ) -> None:
+        self.config = config or get_config()
+    
+    def encode_bytes(self, data: bytes) -> str:
         """
-        Reduce image size and resolution.
+        Encode image bytes to base64.
         
         Args:
-            input_path: Input image path
-            output_path: Output image path
-        """
-        img = Image.open(input_path)
-        img_size = input_path.stat().st_size
-        
-        if img_size > self.config.max_image_size:
-            # Reduce resolution
-            img.thumbnail(self.config.max_image_resolution)
-            img.save(output_path, format='JPEG', quality=80, optimize=True)
+            data: Encoded image
             
-            final_size = output_path.stat().st_size
-            logger.info(
-                f"Image compressed from {img_size} to {final_size} bytes "
-                f"with resolution {img.size}"
-            )
-        else:
-            # Just convert to JPEG
-            img.save(output_path, format='JPEG')
\ No newline at end of file
+        Returns:
+            Base64 encoded image string
+        """
+        return base64.b64encode(data).decode('ascii')
+    
+    @property
+    def max_bytes(self) -> int:
+        """Largest image whose base64 form fits into ``max_base64_size``."""
+        return self.config.max_base64_size // 4 * 3
@@ -0,0 +1,244 @@
+"""Queue-based logging with rotation, JSON output and sampling."""
+import copy
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.tracing import CorrelationFilter
+
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Render record as JSON."""
+        data = {
+            "ts": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "cid": getattr(record, "correlation_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps the traceback apart from the message."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge args into the message and render the traceback as text."""
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a share of INFO and lower records of chatty loggers.
+
+    Rates are matched by logger name prefix (the longest prefix wins) and
+    applied deterministically: a rate of 0.1 keeps every tenth record.
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        """
+        Initialize filter.
+
+        Args:
+            rates: Share of records to keep per logger name prefix
+        """
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+        self._credit: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        """Get sampling rate of a logger."""
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            matched = -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > matched:
+                    rate, matched = value, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Decide whether to keep a record."""
+        if record.levelno > logging.INFO:
+            return True
+
+        rate = self._rate(record.name)
+        if rate >= 1:
+            return True
+
+        credit = self._credit.get(record.name, 0.0) + rate
+        if credit >= 1:
+            self._credit[record.name] = credit - 1
+            return True
+        self._credit[record.name] = credit
+        return False
+
+
+class _Listener(logging.handlers.QueueListener):
+    """
+    Queue listener that also drains records of worker processes.
+
+    Process pool workers inherit the root queue handler but not the
+    listener thread, so their records would stay in their copy of the
+    in-process queue. ``worker_queue`` creates a multiprocessing queue,
+    drained by a second thread into the same handlers, on first use.
+    """
+
+    def __init__(self, records: Any, *handlers: logging.Handler, sampling: Optional[Dict[str, float]] = None):
+        super().__init__(records, *handlers, respect_handler_level=True)
+        self.sampling = sampling
+        self._worker_records: Optional[multiprocessing.Queue] = None
+        self._worker_listener: Optional[logging.handlers.QueueListener] = None
+
+    def worker_queue(self) -> "multiprocessing.Queue":
+        """Get the queue worker processes log to, starting its drain thread."""
+        if self._worker_records is None:
+            self._worker_records = multiprocessing.Queue()
+            self._worker_listener = logging.handlers.QueueListener(
+                self._worker_records, *self.handlers, respect_handler_level=True
+            )
+            self._worker_listener.start()
+        return self._worker_records
+
+    def stop(self) -> None:
+        """Flush and stop both threads."""
+        super().stop()
+        if self._worker_listener is not None:
+            self._worker_listener.stop()
+            self._worker_listener = None
+
+
+_listener: Optional[_Listener] = None
+
+
+def init_worker_logging(
+    records: "multiprocessing.Queue",
+    level: int,
+    sampling: Optional[Dict[str, float]] = None
+) -> None:
+    """
+    Send the logging of a worker process to the parent's listener.
+
+    Used as a process pool initializer; replaces handlers inherited from
+    the parent.
+
+    Args:
+        records: Queue from ``worker_logging``
+        level: Root logger level
+        sampling: Share of INFO records to keep per logger name prefix
+    """
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(CorrelationFilter())
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+
+def worker_logging() -> Tuple[Optional[Callable[..., None]], Tuple[Any, ...]]:
+    """
+    Get a process pool initializer routing worker logging to the listener.
+
+    Returns:
+        Initializer and its arguments, or (None, ()) if ``setup_logging``
+        was not called and workers keep the default logging
+    """
+    if _listener is None:
+        return None, ()
+    return init_worker_logging, (
+        _listener.worker_queue(),
+        logging.getLogger().level,
+        _listener.sampling,
+    )
+
+
+def setup_logging(
+    log_file: Optional[Path] = Path("bot.log"),
+    level: int = logging.INFO,
+    json_format: bool = False,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: Optional[str] = None,
+    sampling: Optional[Dict[str, float]] = None
+) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue drained by a background thread.
+
+    Callers on the event loop only enqueue records; formatting and file
+    I/O happen on the listener thread. Process pools get their workers'
+    records to the same handlers through ``worker_logging``. The file is
+    rotated by size, or by time when ``rotate_when`` is set
+    (``midnight``, ``h`` and so on).
+
+    Args:
+        log_file: Log file (None logs to stdout only)
+        level: Root logger level
+        json_format: Write JSON lines instead of text
+        max_bytes: Size at which the file is rotated
+        backup_count: Number of rotated files kept
+        rotate_when: Time-based rotation interval instead of size
+        sampling: Share of INFO records to keep per logger name prefix
+
+    Returns:
+        Started listener (stop it on shutdown to flush pending records)
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file is not None:
+        if rotate_when:
+            handlers.append(logging.handlers.TimedRotatingFileHandler(
+                log_file, when=rotate_when, backupCount=backup_count, encoding="utf-8"
+            ))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    # Context (correlation ID) must be captured on the calling thread
+    queue_handler.addFilter(CorrelationFilter())
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    global _listener
+    _listener = _Listener(records, *handlers, sampling=sampling)
+    _listener.start()
+    return _listener
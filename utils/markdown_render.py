@@ -0,0 +1,139 @@
+"""Render model Markdown as Telegram HTML."""
+import html
+import re
+from typing import List
+
+
+_FENCE = re.compile(r"^\s*```\s*([\w+#.-]*)")
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$")
+_BULLET = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+_QUOTE = re.compile(r"^\s{0,3}>\s?(.*)$")
+_RULE = re.compile(r"^\s{0,3}([-*_])(?:\s*\1){2,}\s*$")
+_TABLE = re.compile(r"^\s*\|.*\|\s*$")
+_THINK = re.compile(r"<think>(.*?)(?:</think>|\Z)", re.DOTALL)
+
+_INLINE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\[(?P<label>[^\[\]\n]+)\]\((?P<url>(?:https?|tg|mailto):[^\s()<>\"]+)\)"
+    r"|\*\*(?=\S)(?P<bold>.+?)(?<=\S)\*\*"
+    r"|(?<!\w)__(?=\S)(?P<bold2>.+?)(?<=\S)__(?!\w)"
+    r"|~~(?=\S)(?P<strike>.+?)(?<=\S)~~"
+    r"|(?<![\w*])\*(?=[^\s*])(?P<italic>[^*\n]+?)(?<=\S)\*(?![\w*])"
+    r"|(?<![\w_])_(?=[^\s_])(?P<italic2>[^_\n]+?)(?<=\S)_(?![\w_])"
+)
+
+_TAGS = {"bold": "b", "bold2": "b", "strike": "s", "italic": "i", "italic2": "i"}
+
+
+def render_inline(text: str) -> str:
+    """
+    Render inline Markdown of one line.
+
+    Markers without a closing pair are kept as literal text.
+
+    Args:
+        text: Markdown text
+
+    Returns:
+        Escaped text with Telegram HTML tags
+    """
+    parts: List[str] = []
+    pos = 0
+    for match in _INLINE.finditer(text):
+        parts.append(html.escape(text[pos:match.start()], quote=False))
+        kind = match.lastgroup
+        if kind == "code":
+            parts.append(f"<code>{html.escape(match.group('code'), quote=False)}</code>")
+        elif kind in ("label", "url"):
+            url = html.escape(match.group("url"))
+            parts.append(f'<a href="{url}">{render_inline(match.group("label"))}</a>')
+        else:
+            tag = _TAGS[kind]
+            parts.append(f"<{tag}>{render_inline(match.group(kind))}</{tag}>")
+        pos = match.end()
+    parts.append(html.escape(text[pos:], quote=False))
+    return "".join(parts)
+
+
+def _render_blocks(text: str) -> List[str]:
+    """Render Markdown block by block into HTML lines."""
+    lines = text.split("\n")
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        fence = _FENCE.match(line)
+        if fence:
+            # An unterminated fence (still streaming) runs to the end
+            end = i + 1
+            while end < len(lines) and not lines[end].strip().startswith("```"):
+                end += 1
+            code = html.escape("\n".join(lines[i + 1:end]), quote=False)
+            language = fence.group(1)
+            if code.strip() and language:
+                out.append(f'<pre><code class="language-{language}">{code}</code></pre>')
+            elif code.strip():
+                out.append(f"<pre>{code}</pre>")
+            i = end + 1
+            continue
+
+        if _TABLE.match(line):
+            end = i
+            while end < len(lines) and _TABLE.match(lines[end]):
+                end += 1
+            table = html.escape("\n".join(lines[i:end]), quote=False)
+            out.append(f"<pre>{table}</pre>")
+            i = end
+            continue
+
+        if _QUOTE.match(line):
+            quoted = []
+            while i < len(lines) and _QUOTE.match(lines[i]):
+                quoted.append(render_inline(_QUOTE.match(lines[i]).group(1)))
+                i += 1
+            if any(quoted):
+                out.append("<blockquote>" + "\n".join(quoted) + "</blockquote>")
+            continue
+
+        heading = _HEADING.match(line)
+        bullet = _BULLET.match(line)
+        if heading:
+            out.append(f"<b>{render_inline(heading.group(1))}</b>")
+        elif _RULE.match(line):
+            out.append("——————")
+        elif bullet:
+            out.append(f"{bullet.group(1)}• {render_inline(bullet.group(2))}")
+        else:
+            out.append(render_inline(line))
+        i += 1
+    return out
+
+
+def render_markdown(text: str) -> str:
+    """
+    Convert model Markdown into HTML that Telegram always accepts.
+
+    All text is escaped and only balanced tags from the Telegram HTML
+    subset are produced, so a message never has to be resent as plain
+    text. Thinking blocks become expandable quotes. Partial output is
+    fine: an unterminated code fence or thinking block is closed.
+
+    Args:
+        text: Model response
+
+    Returns:
+        Telegram HTML
+    """
+    parts: List[str] = []
+    pos = 0
+    for match in _THINK.finditer(text):
+        parts.extend(_render_blocks(text[pos:match.start()]))
+        thinking = match.group(1).strip()
+        if thinking:
+            parts.append(
+                f"<blockquote expandable>{html.escape(thinking, quote=False)}</blockquote>"
+            )
+        pos = match.end()
+    parts.extend(_render_blocks(text[pos:]))
+    return "\n".join(parts).strip()
@@ -1,68 +1,390 @@
 """Message splitting utilities for Telegram."""
-from typing import List
+import re
+from bisect import bisect_left
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+
+# Break ranks, lower is better; breaks inside an open entity rank lower
+_FENCE, _PARAGRAPH, _LINE, _SENTENCE, _SPACE = range(5)
+_NESTED_PENALTY = 5
+
+# Only entities are tokens. Line, sentence and word breaks are looked up
+# with ``str.rfind`` when a chunk is full, close to where it gets cut.
+# The leading lookahead lets the scanner skip plain text quickly.
+_MARKDOWN_TOKENS = re.compile(
+    r"(?=[`\[*_])(?:(?P<fence>```)|(?P<code>`)|(?P<link>\[)|(?P<mark>[*_]))"
+)
+_MARKDOWN_PRE_TOKENS = re.compile(r"(?P<fence>```)")
+_MARKDOWN_CODE_TOKENS = re.compile(r"(?P<code>`)")
+_MARKDOWN_FENCE_OPEN = re.compile(r"```([^\n`]*)\n")
+_MARKDOWN_LINK = re.compile(r"\[[^\[\]\n]{0,1024}(\]\([^()\s]{1,2048}\))")
+
+_HTML_TOKENS = re.compile(
+    r"(?=[<&])(?:(?P<tag></?[a-zA-Z][\w-]*(?:\s[^<>]*)?>)|(?P<ent>&#?\w+;))"
+)
+_HTML_TAG_NAME = re.compile(r"</?([a-zA-Z][\w-]*)")
+
+
+class _Entity(NamedTuple):
+    """Open formatting entity."""
+
+    kind: str
+    opener: str
+    closer: str
+    # End of link text, where the ``](url)`` token starts
+    until: int = -1
+
+
+class _Break(NamedTuple):
+    """Place where a chunk may end."""
+
+    end: int
+    resume: int
+    stack: Tuple[_Entity, ...]
+    rank: int
 
 
 class MessageSplitter:
-    """Utility for splitting long messages."""
-    
+    """
+    Utility for splitting long messages.
+
+    Splitting is a single pass over the text. Markdown or HTML entities
+    that are open at a chunk boundary are closed at the end of the chunk
+    and reopened at the start of the next one, so every chunk parses on
+    its own. Breaks after code fences and between paragraphs are preferred
+    over line, sentence and word breaks; a chunk is cut mid-word only when
+    there is no break in the second half of it.
+    """
+
     # Telegram message limit
     MAX_MESSAGE_LENGTH = 4096
-    
+
     @staticmethod
-    def split_message(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    def split_message(
+        text: str,
+        max_length: int = MAX_MESSAGE_LENGTH,
+        parse_mode: Optional[str] = "Markdown"
+    ) -> List[str]:
         """
         Split long message into chunks.
-        
+
         Args:
             text: Text to split
             max_length: Maximum length per message
-            
+            parse_mode: ``Markdown``, ``HTML`` or None for plain text
+
         Returns:
             List of message chunks
         """
         if len(text) <= max_length:
             return [text]
-        
-        chunks = []
-        current_chunk = ""
-        
-        # Split by paragraphs first
-        paragraphs = text.split('\n\n')
-        
-        for paragraph in paragraphs:
-            # If single paragraph is too long, split by sentences
-            if len(paragraph) > max_length:
-                sentences = paragraph.split('. ')
-                
-                for sentence in sentences:
-                    # If single sentence is too long, split by words
-                    if len(sentence) > max_length:
-                        words = sentence.split(' ')
-                        
-                        for word in words:
-                            if len(current_chunk) + len(word) + 1 <= max_length:
-                                current_chunk += word + ' '
-                            else:
-                                if current_chunk:
-                                    chunks.append(current_chunk.strip())
-                                current_chunk = word + ' '
-                    else:
-                        if len(current_chunk) + len(sentence) + 2 <= max_length:
-                            current_chunk += sentence + '. '
-                        else:
-                            if current_chunk:
-                                chunks.append(current_chunk.strip())
-                            current_chunk = sentence + '. '
+
+        mode = (parse_mode or "").lower()
+        if mode not in ("markdown", "html"):
+            mode = "plain"
+        chunks = _Splitter(text, max_length, mode).run()
+        return chunks if chunks else [text[:max_length]]
+
+
+class _Splitter:
+    """State of one ``split_message`` call."""
+
+    def __init__(self, text: str, max_length: int, mode: str):
+        self.text = text
+        self.max_length = max_length
+        self.mode = mode
+
+        self.chunks: List[str] = []
+        self.stack: Tuple[_Entity, ...] = ()
+        self.closers_length = 0
+
+        # Tokens of the current chunk: their starts, and their ends with
+        # the entities open after them and the length of their closers
+        self.token_starts: List[int] = []
+        self.tokens: List[Tuple[int, Tuple[_Entity, ...], int]] = []
+        # Breaks around code fences, found while scanning
+        self.fences: List[_Break] = []
+
+        self.start = 0
+        self.prefix = ""
+        # Where the chunk would end without closers
+        self.end = max_length
+        self.start_state: Tuple[Tuple[_Entity, ...], int] = ((), 0)
+
+    def _pattern(self) -> Optional["re.Pattern"]:
+        """Get token pattern for the innermost open entity."""
+        if self.mode == "markdown":
+            kind = self.stack[-1].kind if self.stack else None
+            if kind == "pre":
+                return _MARKDOWN_PRE_TOKENS
+            if kind == "code":
+                return _MARKDOWN_CODE_TOKENS
+            return _MARKDOWN_TOKENS
+        if self.mode == "html":
+            return _HTML_TOKENS
+        return None
+
+    def _limit(self) -> int:
+        """Get the position the current chunk may extend to."""
+        return max(self.end - self.closers_length, self.start + 1)
+
+    def _push(self, entity: _Entity) -> None:
+        self.stack += (entity,)
+        self.closers_length += len(entity.closer)
+
+    def _pop_to(self, index: int) -> None:
+        for entity in self.stack[index:]:
+            self.closers_length -= len(entity.closer)
+        self.stack = self.stack[:index]
+
+    def _mark(self, start: int, end: int) -> None:
+        """Record a scanned token of the current chunk."""
+        self.token_starts.append(start)
+        self.tokens.append((end, self.stack, self.closers_length))
+
+    def _add_fence_break(self, end: int, resume: int) -> None:
+        rank = _FENCE + _NESTED_PENALTY if self.stack else _FENCE
+        self.fences.append(_Break(end, resume, self.stack, rank))
+
+    def _state_at(self, pos: int) -> Optional[Tuple[Tuple[_Entity, ...], int]]:
+        """Get open entities and their closers length at ``pos``, None inside a token."""
+        index = bisect_left(self.token_starts, pos) - 1
+        if index < 0:
+            return self.start_state
+        end, stack, closers_length = self.tokens[index]
+        if pos < end:
+            return None
+        return stack, closers_length
+
+    def _outside_end(self) -> int:
+        """Get the end of the last stretch of the chunk outside of entities."""
+        for index in range(len(self.tokens) - 1, -1, -1):
+            if not self.tokens[index][1]:
+                if index + 1 < len(self.tokens):
+                    return self.token_starts[index + 1]
+                return len(self.text)
+        if self.start_state[0]:
+            return self.start
+        return self.token_starts[0] if self.tokens else len(self.text)
+
+    def _line_breaks(self, lo: int, hi: int) -> Iterator[Tuple[int, int, int]]:
+        """Yield line and paragraph breaks between ``lo`` and ``hi``, latest first."""
+        text = self.text
+        pos = text.rfind("\n", lo, hi)
+        while pos >= 0:
+            first = pos
+            while True:
+                previous = text.rfind("\n", lo, first)
+                if previous < 0 or text[previous + 1:first].strip(" \t"):
+                    break
+                first = previous
+            yield first, pos + 1, _PARAGRAPH if first < pos else _LINE
+            pos = text.rfind("\n", lo, first)
+
+    def _sentence_breaks(self, lo: int, hi: int) -> Iterator[Tuple[int, int, int]]:
+        """Yield sentence breaks between ``lo`` and ``hi``, latest first."""
+        text = self.text
+        while True:
+            pos = max(text.rfind(". ", lo, hi), text.rfind("! ", lo, hi), text.rfind("? ", lo, hi))
+            if pos < 0:
+                return
+            yield pos + 1, pos + 2, _SENTENCE
+            hi = pos + 1
+
+    def _space_breaks(self, lo: int, hi: int) -> Iterator[Tuple[int, int, int]]:
+        """Yield word breaks between ``lo`` and ``hi``, latest first."""
+        text = self.text
+        pos = text.rfind(" ", lo, hi)
+        while pos >= 0:
+            yield pos, pos + 1, _SPACE
+            pos = text.rfind(" ", lo, pos)
+
+    def _fitting(
+        self,
+        breaks: Iterator[Tuple[int, int, int]],
+        budget: int
+    ) -> Iterator[_Break]:
+        """Keep breaks outside of tokens that leave room for the closers."""
+        for end, resume, rank in breaks:
+            state = self._state_at(end)
+            if state is None or end - self.start + state[1] > budget:
+                continue
+            stack = state[0]
+            yield _Break(end, resume, stack, rank + _NESTED_PENALTY if stack else rank)
+
+    def _best_break(self, hi: int) -> Optional[_Break]:
+        """Pick the best break before ``hi`` that keeps the chunk within the limit."""
+        budget = self.max_length - len(self.prefix)
+        half = max(self.start + budget // 2, self.start + 1)
+        searches = (
+            (_PARAGRAPH, self._line_breaks),
+            (_SENTENCE, self._sentence_breaks),
+            (_SPACE, self._space_breaks),
+        )
+
+        fences = [
+            b for b in self.fences
+            if self.start < b.end <= hi
+            and b.end - self.start + sum(len(e.closer) for e in b.stack) <= budget
+        ]
+        late = [b for b in fences if b.end >= half]
+        best = min(late, key=lambda b: (b.rank, -b.end)) if late else None
+        outside = min(self._outside_end(), hi)
+        for first_rank, search in searches:
+            # Breaks come latest first, so nothing later beats a break
+            # that already ranks as well as this kind can. Breaks after
+            # the last stretch outside of entities are all nested.
+            for lo, up, enough in (
+                (max(half, outside), hi, first_rank + _NESTED_PENALTY),
+                (half, outside, first_rank),
+            ):
+                if best is not None and best.rank <= enough:
+                    continue
+                for b in self._fitting(search(lo, up), budget):
+                    if best is None or (b.rank, -b.end) < (best.rank, -best.end):
+                        best = b
+                    if best.rank <= enough:
+                        break
+        if best is not None:
+            return best
+
+        # No break in the second half of the chunk: take the latest one
+        early = [b for b in fences if b.end < half]
+        for _, search in searches:
+            b = next(self._fitting(search(self.start + 1, half), budget), None)
+            if b is not None:
+                early.append(b)
+        return max(early, key=lambda b: b.end) if early else None
+
+    def _cut(self, end: int, resume: int, stack: Tuple[_Entity, ...]) -> int:
+        """
+        Emit a chunk and start the next one.
+
+        Returns:
+            Position to continue scanning from
+        """
+        body = self.text[self.start:end].rstrip()
+        if body.strip():
+            closers = "".join(entity.closer for entity in reversed(stack))
+            self.chunks.append(self.prefix + body + closers)
+
+        self.stack = stack
+        self.closers_length = sum(len(entity.closer) for entity in stack)
+        self.prefix = "".join(entity.opener for entity in stack)
+        self.token_starts.clear()
+        self.tokens.clear()
+        self.fences.clear()
+        self.start_state = (stack, self.closers_length)
+
+        if not stack:
+            # Leading whitespace is not significant outside of entities
+            while resume < len(self.text) and self.text[resume] in " \t\n":
+                resume += 1
+        self.start = resume
+        self.end = resume + self.max_length - len(self.prefix)
+        return resume
+
+    def _overflow(self, pos: int) -> int:
+        """Cut at the best break before ``pos``, or at ``pos`` if there is none."""
+        best = self._best_break(pos)
+        if best is not None:
+            return self._cut(best.end, best.resume, best.stack)
+        return self._cut(pos, pos, self.stack)
+
+    def _apply(self, match: "re.Match") -> int:
+        """
+        Update entity state for a token.
+
+        Returns:
+            End of the token
+        """
+        kind = match.lastgroup
+        pos, end = match.start(), match.end()
+
+        if kind == "fence":
+            if self.stack and self.stack[-1].kind == "pre":
+                self._pop_to(len(self.stack) - 1)
+                self._add_fence_break(end, end)
             else:
-                if len(current_chunk) + len(paragraph) + 2 <= max_length:
-                    current_chunk += paragraph + '\n\n'
+                self._add_fence_break(pos, pos)
+                fence = _MARKDOWN_FENCE_OPEN.match(self.text, pos)
+                if fence:
+                    end = fence.end()
+                    self._push(_Entity("pre", fence.group(0), "\n```"))
                 else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = paragraph + '\n\n'
-        
-        # Add remaining chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks if chunks else [text[:max_length]]
\ No newline at end of file
+                    self._push(_Entity("pre", "```", "```"))
+        elif kind == "code":
+            if self.stack and self.stack[-1].kind == "code":
+                self._pop_to(len(self.stack) - 1)
+            else:
+                self._push(_Entity("code", "`", "`"))
+        elif kind == "mark":
+            mark = match.group()
+            for index, entity in enumerate(self.stack):
+                if entity.opener == mark:
+                    self._pop_to(index)
+                    break
+            else:
+                self._push(_Entity("mark", mark, mark))
+        elif kind == "link":
+            link = _MARKDOWN_LINK.match(self.text, pos)
+            if link:
+                self._push(_Entity("link", "[", link.group(1), link.start(1)))
+        elif kind == "tag":
+            tag = match.group()
+            name = _HTML_TAG_NAME.match(tag).group(1).lower()
+            if tag.startswith("</"):
+                for index in range(len(self.stack) - 1, -1, -1):
+                    if self.stack[index].kind == name:
+                        self._pop_to(index)
+                        break
+            else:
+                self._push(_Entity(name, tag, f"</{name}>"))
+        return end
+
+    def run(self) -> List[str]:
+        """Split the text."""
+        text = self.text
+        length = len(text)
+        pos = 0
+
+        while pos < length:
+            link = self.stack[-1] if self.stack and self.stack[-1].kind == "link" else None
+            if link is not None:
+                # Link text is plain up to the ``](url)`` token
+                match = None
+                token_start = link.until
+            else:
+                pattern = self._pattern()
+                match = pattern.search(text, pos) if pattern else None
+                token_start = match.start() if match else length
+
+            limit = self._limit()
+            if token_start > limit:
+                pos = self._overflow(limit)
+                continue
+
+            if match is None:
+                if link is None:
+                    break
+                # Close the link with its URL
+                self._pop_to(len(self.stack) - 1)
+                pos = link.until + len(link.closer)
+                self._mark(link.until, pos)
+                continue
+
+            stack, closers_length = self.stack, self.closers_length
+            token_end = self._apply(match)
+            if token_end > self._limit() and token_start > self.start:
+                # Token does not fit: roll back and cut before it
+                self.stack, self.closers_length = stack, closers_length
+                self.fences = [b for b in self.fences if b.end <= token_start]
+                pos = self._overflow(token_start)
+                continue
+            self._mark(token_start, token_end)
+            pos = token_end
+
+        if self.start < length:
+            # Entities left open by the text itself stay as they are
+            self._cut(length, length, ())
+        return self.chunks
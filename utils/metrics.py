@@ -0,0 +1,321 @@
+"""Optional Prometheus metrics."""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from aiohttp import web
+
+from utils.tracing import span
+
+try:
+    import prometheus_client
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow vision request
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+PASS_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 12)
+PAYLOAD_BUCKETS = tuple(2 ** power * 1024 for power in range(5, 13))  # 32KB..4MB
+
+
+class _StageTimer:
+    """Time a stage, count it as in flight and count its errors."""
+
+    __slots__ = ("_metrics", "_stage", "_started", "_span")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self._metrics = metrics
+        self._stage = stage
+        self._started = 0.0
+        self._span = span(stage)
+
+    def __enter__(self) -> "_StageTimer":
+        self._span.__enter__()
+        self._metrics.in_flight.labels(self._stage).inc()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        self._metrics.stage_seconds.labels(self._stage).observe(
+            time.perf_counter() - self._started
+        )
+        self._metrics.in_flight.labels(self._stage).dec()
+        if exc_type is not None and exc_type is not asyncio.CancelledError:
+            self._metrics.errors.labels(self._stage, exc_type.__name__).inc()
+        self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+class _StatsCollector:
+    """Read cache statistics and gauges when metrics are scraped."""
+
+    def __init__(self, metrics: "Metrics"):
+        self._metrics = metrics
+
+    def describe(self):
+        """Skip describing, values are only known at collection."""
+        return []
+
+    def collect(self):
+        """Yield cache statistics, registered gauges and counters."""
+        hits = CounterMetricFamily("bot_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("bot_cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("bot_cache_hit_ratio", "Share of cache lookups served", labels=["cache"])
+
+        for name, source in self._metrics.caches.items():
+            stats = source()
+            lookups = stats["hits"] + stats["misses"]
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hits"] / lookups if lookups else 0.0)
+        yield hits
+        yield misses
+        yield ratio
+
+        for name, (documentation, labels, source) in self._metrics.gauges.items():
+            gauge = GaugeMetricFamily(name, documentation, labels=list(labels))
+            values = source()
+            if labels:
+                for key, value in values.items():
+                    gauge.add_metric([str(part) for part in key], value)
+            else:
+                gauge.add_metric([], values)
+            yield gauge
+
+        for name, (documentation, labels, source) in self._metrics.counters.items():
+            counter = CounterMetricFamily(name, documentation, labels=list(labels))
+            values = source()
+            if labels:
+                for key, value in values.items():
+                    counter.add_metric([str(part) for part in key], value)
+            else:
+                counter.add_metric([], values)
+            yield counter
+
+
+class Metrics:
+    """
+    Process-wide bot metrics.
+
+    Disabled by default: ``track`` then only records a trace span (a
+    shared no-op outside of traced updates) and the ``record_*`` methods
+    return immediately, so instrumented code pays one attribute check.
+    ``enable`` creates the Prometheus metrics (it fails softly when
+    ``prometheus_client`` is not installed). Cache hit rates and gauges
+    are read from registered callables at scrape time instead of being
+    updated on every lookup; so are counters that services already keep.
+    """
+
+    def __init__(self):
+        """Initialize disabled metrics."""
+        self.enabled = False
+        self.registry = None
+        self.caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+        self.gauges: Dict[str, tuple] = {}
+        self.counters: Dict[str, tuple] = {}
+
+    def enable(self) -> bool:
+        """
+        Create Prometheus metrics.
+
+        Returns:
+            Whether metrics are enabled
+        """
+        if self.enabled:
+            return True
+        if prometheus_client is None:
+            logger.warning("prometheus_client is not installed, metrics are disabled")
+            return False
+
+        self.registry = prometheus_client.CollectorRegistry()
+        self.stage_seconds = prometheus_client.Histogram(
+            "bot_stage_seconds",
+            "Latency of processing stages",
+            ["stage"],
+            buckets=STAGE_BUCKETS,
+            registry=self.registry,
+        )
+        self.in_flight = prometheus_client.Gauge(
+            "bot_in_flight",
+            "Stages currently in progress",
+            ["stage"],
+            registry=self.registry,
+        )
+        self.errors = prometheus_client.Counter(
+            "bot_errors",
+            "Errors by stage and exception type",
+            ["stage", "type"],
+            registry=self.registry,
+        )
+        self.tokens = prometheus_client.Counter(
+            "groq_tokens",
+            "Tokens reported in Groq response usage",
+            ["model", "kind"],
+            registry=self.registry,
+        )
+        self.image_passes = prometheus_client.Histogram(
+            "bot_image_compression_passes",
+            "JPEG encodes needed to fit a photo into the payload budget",
+            buckets=PASS_BUCKETS,
+            registry=self.registry,
+        )
+        self.image_bytes = prometheus_client.Histogram(
+            "bot_image_payload_bytes",
+            "Size of compressed photos sent to the vision model",
+            buckets=PAYLOAD_BUCKETS,
+            registry=self.registry,
+        )
+        self.registry.register(_StatsCollector(self))
+        self.enabled = True
+        return True
+
+    def track(self, stage: str):
+        """
+        Measure a stage and record it as a span of the current trace.
+
+        Usage: ``with metrics.track("search"): ...``
+
+        Args:
+            stage: Stage name
+
+        Returns:
+            Context manager observing latency, in-flight count and errors
+        """
+        if not self.enabled:
+            return span(stage)
+        return _StageTimer(self, stage)
+
+    def record_error(self, stage: str, error: BaseException) -> None:
+        """
+        Count an error that was handled without leaving a tracked stage.
+
+        Args:
+            stage: Stage name
+            error: Handled exception
+        """
+        if self.enabled:
+            self.errors.labels(stage, type(error).__name__).inc()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record the latency of a stage measured by the caller.
+
+        Args:
+            stage: Stage name
+            seconds: Latency in seconds
+        """
+        if self.enabled:
+            self.stage_seconds.labels(stage).observe(seconds)
+
+    def record_tokens(self, model: str, usage: Any) -> None:
+        """
+        Count tokens of a Groq response.
+
+        Args:
+            model: Model that served the request
+            usage: ``usage`` object of the response (may be None)
+        """
+        if not self.enabled or usage is None:
+            return
+        self.tokens.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+        self.tokens.labels(model, "completion").inc(usage.completion_tokens or 0)
+
+    def record_compression(self, passes: int, size: int) -> None:
+        """
+        Record how a photo was compressed.
+
+        Args:
+            passes: JPEG encodes performed (0 if passed through)
+            size: Size of the compressed image in bytes
+        """
+        if self.enabled:
+            self.image_passes.observe(passes)
+            self.image_bytes.observe(size)
+
+    def register_cache(self, name: str, stats: Callable[[], Dict[str, int]]) -> None:
+        """
+        Export hit rate of a cache.
+
+        Args:
+            name: Cache label
+            stats: Callable returning a dict with ``hits`` and ``misses``
+        """
+        self.caches[name] = stats
+
+    def register_gauge(
+        self,
+        name: str,
+        documentation: str,
+        value: Callable[[], Any],
+        labels: Sequence[str] = ()
+    ) -> None:
+        """
+        Export a value read at scrape time.
+
+        Args:
+            name: Metric name
+            documentation: Metric help text
+            value: Callable returning the current value, or a mapping of
+                label value tuples to values when ``labels`` are given
+            labels: Label names
+        """
+        self.gauges[name] = (documentation, tuple(labels), value)
+
+    def register_counter(
+        self,
+        name: str,
+        documentation: str,
+        value: Callable[[], Any],
+        labels: Sequence[str] = ()
+    ) -> None:
+        """
+        Export a monotonic count read at scrape time.
+
+        Args:
+            name: Metric name (``_total`` is appended on export)
+            documentation: Metric help text
+            value: Callable returning the count, or a mapping of label
+                value tuples to counts when ``labels`` are given
+            labels: Label names
+        """
+        self.counters[name] = (documentation, tuple(labels), value)
+
+    def render(self) -> bytes:
+        """Render metrics in the Prometheus text format."""
+        return prometheus_client.generate_latest(self.registry)
+
+    async def start_server(self, host: str, port: int) -> Optional[web.AppRunner]:
+        """
+        Serve ``/metrics`` on a separate aiohttp server.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind
+
+        Returns:
+            Runner to clean up on shutdown, or None if metrics are disabled
+        """
+        if not self.enabled:
+            return None
+
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(
+                body=self.render(),
+                headers={"Content-Type": prometheus_client.CONTENT_TYPE_LATEST},
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host=host, port=port).start()
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+        return runner
+
+
+metrics = Metrics()
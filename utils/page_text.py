@@ -0,0 +1,144 @@
+"""Main text extraction from HTML pages."""
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+
+# Elements whose content is never main text
+_SKIP = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "header", "footer", "aside", "form", "button", "select", "menu",
+}
+
+# Elements that end a text block
+_BLOCK = {
+    "p", "div", "li", "ul", "ol", "br", "tr", "td", "th", "dd", "dt",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "figcaption",
+    "article", "main", "section", "table",
+}
+
+# Content containers preferred over the rest of the page when present
+_MAIN = {"article", "main"}
+
+# Blocks shorter than this are usually menus, buttons and bylines
+MIN_BLOCK_CHARS = 40
+
+# Main containers with less text than this are ignored
+MIN_MAIN_CHARS = 200
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+
+class _TextExtractor(HTMLParser):
+    """Collect text blocks, remembering whether they are inside a main container."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[Tuple[str, bool]] = []
+        self._parts: List[str] = []
+        self._skip = 0
+        self._main = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in _SKIP:
+            self._skip += 1
+        elif tag in _BLOCK:
+            self._flush()
+            if tag in _MAIN:
+                self._main += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK:
+            self._flush()
+            if tag in _MAIN:
+                self._main = max(0, self._main - 1)
+
+    def handle_data(self, data: str) -> None:
+        if not self._skip:
+            self._parts.append(data)
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+    def _flush(self) -> None:
+        text = " ".join("".join(self._parts).split())
+        self._parts = []
+        if text:
+            self.blocks.append((text, self._main > 0))
+
+
+def decode_html(data: bytes, charset: Optional[str] = None) -> str:
+    """
+    Decode an HTML document.
+
+    Args:
+        data: Raw document
+        charset: Charset from the Content-Type header, if any
+
+    Returns:
+        Document text (undecodable bytes are replaced)
+    """
+    if not charset:
+        match = _META_CHARSET.search(data[:4096])
+        charset = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def extract_main_text(data: bytes, charset: Optional[str] = None, max_chars: int = 1500) -> str:
+    """
+    Extract the readable main text of an HTML page.
+
+    Navigation, scripts, forms and other page furniture are skipped. Text
+    inside ``<article>``/``<main>`` is preferred when there is enough of
+    it, and paragraph-sized blocks are kept over short fragments. Runs in
+    a worker process, so it only takes and returns plain values.
+
+    Args:
+        data: Raw HTML (possibly cut at a byte limit)
+        charset: Charset from the Content-Type header, if any
+        max_chars: Maximum length of the result
+
+    Returns:
+        Text blocks separated by newlines, cut at a word boundary
+    """
+    parser = _TextExtractor()
+    try:
+        parser.feed(decode_html(data, charset))
+        parser.close()
+    except AssertionError:
+        # HTMLParser gives up on some malformed markup; keep what it read
+        pass
+
+    blocks = parser.blocks
+    main = [block for block in blocks if block[1]]
+    if sum(len(text) for text, _ in main) >= MIN_MAIN_CHARS:
+        blocks = main
+
+    texts = [text for text, _ in blocks if len(text) >= MIN_BLOCK_CHARS]
+    if not texts:
+        texts = [text for text, _ in blocks]
+
+    kept: List[str] = []
+    seen = set()
+    length = 0
+    for text in texts:
+        if text in seen:
+            continue
+        seen.add(text)
+        kept.append(text)
+        length += len(text) + 1
+        if length >= max_chars:
+            break
+
+    result = "\n".join(kept)
+    if len(result) > max_chars:
+        cut = result[:max_chars]
+        space = cut.rfind(" ")
+        result = (cut[:space] if space > max_chars // 2 else cut).rstrip(" ,.;:") + "…"
+    return result
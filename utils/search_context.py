@@ -0,0 +1,262 @@
+"""Compaction of search results into a ranked, deduplicated, token-capped context."""
+import logging
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List
+
+from utils.tokens import estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+# Words shorter than this carry little meaning for ranking
+MIN_TERM_LENGTH = 2
+
+# Terms are cut to this prefix, a crude stemmer that merges Russian inflections
+STEM_LENGTH = 6
+
+# A snippet is only truncated to fit if at least this many tokens are left
+MIN_SNIPPET_TOKENS = 32
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """
+    Format a search result the way it appears in the prompt.
+
+    Args:
+        result: Search result with number, title and body
+
+    Returns:
+        Prompt text of the result
+    """
+    return f"Источник {result['number']}: {result['title']}\n{result['body']}"
+
+
+def terms(text: str) -> List[str]:
+    """
+    Split text into normalized terms for ranking.
+
+    Args:
+        text: Text
+
+    Returns:
+        Lowercased word prefixes
+    """
+    return [
+        word[:STEM_LENGTH]
+        for word in _WORD.findall(text.lower())
+        if len(word) >= MIN_TERM_LENGTH
+    ]
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[tuple]:
+    """
+    Get word shingles of a text.
+
+    Args:
+        text: Text
+        size: Words per shingle
+
+    Returns:
+        Set of word tuples (the whole text if it is shorter than a shingle)
+    """
+    words = terms(text)
+    if len(words) <= size:
+        return frozenset([tuple(words)]) if words else frozenset()
+    return frozenset(tuple(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: FrozenSet, b: FrozenSet) -> float:
+    """Get Jaccard similarity of two sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def bm25_scores(query: List[str], documents: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """
+    Score documents against a query with Okapi BM25.
+
+    The documents themselves are the corpus, which is enough to tell apart
+    terms every result repeats from the rare ones that matter.
+
+    Args:
+        query: Query terms
+        documents: Terms of each document
+        k1: Term frequency saturation
+        b: Length normalization
+
+    Returns:
+        Score of each document
+    """
+    count = len(documents)
+    if not count:
+        return []
+    average_length = sum(map(len, documents)) / count or 1.0
+    frequencies = Counter(term for document in documents for term in set(document))
+    unique_query = set(query)
+
+    scores = []
+    for document in documents:
+        counts = Counter(document)
+        norm = k1 * (1 - b + b * len(document) / average_length)
+        score = 0.0
+        for term in unique_query:
+            tf = counts.get(term)
+            if not tf:
+                continue
+            df = frequencies[term]
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text at a word boundary to fit a token estimate.
+
+    Args:
+        text: Text
+        max_tokens: Token budget
+
+    Returns:
+        Text, shortened and ending with an ellipsis if it did not fit
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # The estimate counts UTF-8 bytes, so cut by bytes and back off to a space
+    cut = text.encode("utf-8")[:max(0, max_tokens * 4 - 4)].decode("utf-8", errors="ignore")
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+class SearchContextCompactor:
+    """
+    Turn raw search results into the smallest useful prompt context.
+
+    Results are ranked against the query with BM25 (title terms count
+    twice), results whose word shingles overlap a better one by at least
+    ``dedup_threshold`` (Jaccard) or that repeat its link are dropped, and
+    the rest are added best first while they fit ``max_tokens``. The last
+    one may be shortened to fill the budget. Kept results are renumbered
+    in rank order.
+    """
+
+    def __init__(self, max_tokens: int = 1200, dedup_threshold: float = 0.6):
+        """
+        Initialize compactor.
+
+        Args:
+            max_tokens: Token budget of the formatted results (0 is unlimited)
+            dedup_threshold: Shingle similarity from which results are duplicates
+        """
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+
+    def rank(self, query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Order results by relevance to the query.
+
+        Args:
+            query: User query
+            results: Search results with title and body
+
+        Returns:
+            Results best first (ties keep the search engine order)
+        """
+        documents = [
+            terms(result["title"]) * 2 + terms(result["body"])
+            for result in results
+        ]
+        scores = bm25_scores(terms(query), documents)
+        order = sorted(range(len(results)), key=lambda i: -scores[i])
+        return [results[i] for i in order]
+
+    def deduplicate(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Drop results repeating an earlier one.
+
+        Args:
+            results: Results best first
+
+        Returns:
+            Results without near-duplicates and empty snippets
+        """
+        kept: List[Dict[str, Any]] = []
+        seen_links = set()
+        seen_shingles: List[FrozenSet] = []
+        for result in results:
+            text = f"{result['title']} {result['body']}"
+            signature = shingles(text)
+            if not signature:
+                continue
+
+            link = result.get("link")
+            if link and link in seen_links:
+                continue
+            if any(jaccard(signature, other) >= self.dedup_threshold for other in seen_shingles):
+                continue
+
+            kept.append(result)
+            seen_shingles.append(signature)
+            if link:
+                seen_links.add(link)
+        return kept
+
+    def cap(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keep the best results that fit the token budget.
+
+        Args:
+            results: Results best first
+
+        Returns:
+            Renumbered results whose formatted text fits ``max_tokens``
+        """
+        kept: List[Dict[str, Any]] = []
+        used = 0
+        for result in results:
+            result = dict(result, number=len(kept) + 1)
+            # Results are joined with a blank line
+            cost = estimate_tokens(format_result(result)) + 1
+            if not self.max_tokens or used + cost <= self.max_tokens:
+                kept.append(result)
+                used += cost
+                continue
+
+            left = self.max_tokens - used - estimate_tokens(format_result(dict(result, body=""))) - 1
+            if left >= MIN_SNIPPET_TOKENS or not kept:
+                result["body"] = truncate_to_tokens(result["body"], max(left, 0))
+                kept.append(result)
+            break
+        return kept
+
+    def compact(self, query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Rank, deduplicate and cap search results.
+
+        Args:
+            query: User query
+            results: Search results with number, title, link and body
+
+        Returns:
+            Compacted results, numbered from 1 in rank order
+        """
+        if not results:
+            return []
+
+        compacted = self.cap(self.deduplicate(self.rank(query, results)))
+        before = sum(estimate_tokens(format_result(r)) for r in results)
+        after = sum(estimate_tokens(format_result(r)) for r in compacted)
+        logger.info(
+            f"Search context: {len(results)} -> {len(compacted)} results, "
+            f"~{before} -> ~{after} tokens"
+        )
+        return compacted
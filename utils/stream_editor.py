@@ -0,0 +1,228 @@
+"""Progressive delivery of streamed model output via message edits."""
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from utils.markdown_render import render_markdown
+from utils.message_splitter import MessageSplitter
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingReply:
+    """
+    Render a growing text into one or more Telegram messages.
+
+    The first visible text is shown immediately. Later edits are throttled
+    with an interval that grows with every edit (Telegram tolerates roughly
+    one edit per second per chat) and backs off on flood-control errors.
+    Every edit and the final messages use the same rendered HTML, so no
+    send has to be retried in another parse mode. Text longer than one
+    message rolls over into a new message.
+
+    Intermediate edits run in the background, one at a time, so the
+    caller keeps consuming the stream while an edit waits for its turn.
+    """
+
+    # Final edits tried before falling back to new messages
+    FINAL_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        status_message: Message,
+        min_interval: float = 1.0,
+        max_interval: float = 3.0,
+        max_length: int = MessageSplitter.MAX_MESSAGE_LENGTH,
+        render: Callable[[str], str] = render_markdown
+    ):
+        """
+        Initialize streaming reply.
+
+        Args:
+            status_message: Message that will be edited with the text
+            min_interval: Initial delay between edits in seconds
+            max_interval: Upper bound for the delay between edits
+            max_length: Maximum length per message
+            render: Converts model text to Telegram HTML
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_length = max_length
+        self.render = render
+
+        self._messages: List[Message] = [status_message]
+        self._shown: List[str] = [status_message.text or ""]
+        self._edits = 0
+        self._next_edit_at = 0.0
+        self._editing: Optional[asyncio.Task] = None
+
+    def _interval(self) -> float:
+        """Get current delay between edits."""
+        return min(self.max_interval, self.min_interval + 0.25 * self._edits)
+
+    @property
+    def due(self) -> bool:
+        """Whether no edit is in flight and the throttle allows one now."""
+        return self._editing is None and time.monotonic() >= self._next_edit_at
+
+    async def _edit(self, idx: int, text: str) -> bool:
+        """
+        Edit one of the reply messages.
+
+        Args:
+            idx: Index of the message to edit
+            text: New message HTML
+
+        Returns:
+            True if the message shows the text after the call
+        """
+        if self._shown[idx] == text:
+            return True
+
+        try:
+            await self._messages[idx].edit_text(text, parse_mode=ParseMode.HTML)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Edit throttled by Telegram for {e.retry_after}s")
+            self._next_edit_at = time.monotonic() + e.retry_after
+            return False
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning(f"Could not edit streamed message: {e}")
+                return False
+
+        self._shown[idx] = text
+        return True
+
+    async def _show(self, chunks: List[str]) -> bool:
+        """
+        Bring the reply messages up to date with rendered chunks.
+
+        Args:
+            chunks: Rendered message texts
+
+        Returns:
+            True if every message shows its chunk
+        """
+        shown = True
+        for idx, chunk in enumerate(chunks):
+            if idx < len(self._messages):
+                shown = await self._edit(idx, chunk) and shown
+                continue
+
+            new_message = await self._messages[-1].answer(chunk, parse_mode=ParseMode.HTML)
+            self._messages.append(new_message)
+            self._shown.append(chunk)
+        return shown
+
+    def _render(self, text: str) -> List[str]:
+        """Render text once and split it into messages."""
+        rendered = self.render(text)
+        if not rendered.strip():
+            return []
+        return MessageSplitter.split_message(rendered, self.max_length, ParseMode.HTML)
+
+    async def update(self, text: str) -> None:
+        """
+        Show the text rendered so far, respecting the edit throttle.
+
+        Rendering is skipped while the throttle holds edits back or an
+        edit is still in flight. The edit itself runs in the background
+        and the interval counts from its end, so tokens that arrive
+        meanwhile are shown together by the next edit.
+
+        Args:
+            text: Full text generated so far
+        """
+        if not self.due or not text.strip():
+            return
+        self._editing = asyncio.get_running_loop().create_task(self._progress(text))
+
+    async def _progress(self, text: str) -> None:
+        """Render and show an intermediate text."""
+        try:
+            chunks = self._render(text)
+            if not chunks:
+                return
+            if await self._show(chunks):
+                self._edits += 1
+            # A flood-control wait set by the edit may be longer than the interval
+            self._next_edit_at = max(self._next_edit_at, time.monotonic() + self._interval())
+        except Exception as e:
+            # Intermediate edits are best effort; finish() shows the full text
+            logger.warning(f"Could not show streamed text: {e}")
+        finally:
+            self._editing = None
+
+    async def _resend(self, chunks: List[str]) -> None:
+        """
+        Send chunks that could not be edited in as new messages.
+
+        Messages from the first stale one on are replaced, so the reply
+        keeps its order.
+
+        Args:
+            chunks: Rendered message texts
+        """
+        first = next(
+            idx for idx, chunk in enumerate(chunks)
+            if idx >= len(self._shown) or self._shown[idx] != chunk
+        )
+        logger.warning(f"Sending streamed text from part {first + 1} as new messages")
+
+        stale = self._messages[first:]
+        del self._messages[first:]
+        del self._shown[first:]
+        for chunk in chunks[first:]:
+            new_message = await stale[0].answer(chunk, parse_mode=ParseMode.HTML)
+            self._messages.append(new_message)
+            self._shown.append(chunk)
+
+        for message in stale:
+            try:
+                await message.delete()
+            except TelegramBadRequest as e:
+                logger.warning(f"Could not delete message: {e}")
+
+    async def finish(self, text: str) -> None:
+        """
+        Write the final text.
+
+        The final edits are retried after a flood-control wait. Chunks
+        that still cannot be edited in are sent as new messages.
+
+        Args:
+            text: Final text
+        """
+        if self._editing is not None:
+            await self._editing
+        chunks = self._render(text)
+
+        # Respect a pending flood-control wait before the final edits
+        delay = self._next_edit_at - time.monotonic()
+        if delay > 0 and self._edits:
+            await asyncio.sleep(delay)
+
+        for attempt in range(self.FINAL_ATTEMPTS):
+            if await self._show(chunks):
+                break
+            # Only a flood-control wait is worth retrying
+            delay = self._next_edit_at - time.monotonic()
+            if delay <= 0 or attempt == self.FINAL_ATTEMPTS - 1:
+                await self._resend(chunks)
+                break
+            await asyncio.sleep(delay)
+
+        # Drop messages left over from a longer intermediate render
+        for extra in self._messages[len(chunks):]:
+            try:
+                await extra.delete()
+            except TelegramBadRequest as e:
+                logger.warning(f"Could not delete message: {e}")
+        del self._messages[len(chunks):]
+        del self._shown[len(chunks):]
@@ -0,0 +1,49 @@
+"""Token count estimation for chat messages."""
+from typing import Dict, List
+
+
+# Tokens added by the chat template around every message
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate number of tokens in text.
+    
+    BPE tokenizers produce roughly one token per four bytes of UTF-8 for
+    Latin text and a little more per byte for Cyrillic, so the byte count
+    gives a conservative estimate without loading a tokenizer.
+    
+    Args:
+        text: Text to measure
+        
+    Returns:
+        Estimated token count
+    """
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+def estimate_message_tokens(content: str) -> int:
+    """
+    Estimate number of tokens a chat message occupies in the prompt.
+    
+    Args:
+        content: Message text
+        
+    Returns:
+        Estimated token count including template overhead
+    """
+    return estimate_tokens(content) + MESSAGE_TOKEN_OVERHEAD
+
+
+def count_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    Estimate number of tokens in a list of chat messages.
+    
+    Args:
+        messages: Chat messages
+        
+    Returns:
+        Estimated token count
+    """
+    return sum(estimate_message_tokens(m["content"]) for m in messages)
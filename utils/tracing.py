@@ -0,0 +1,326 @@
+"""Per-update trace spans, correlation IDs and slow update profiling."""
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Correlation ID of the update being handled, added to every log record
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class CorrelationFilter(logging.Filter):
+    """Add ``correlation_id`` of the current update to log records."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Annotate record (never drops it)."""
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class Span:
+    """Timed operation with nested child operations."""
+
+    __slots__ = ("name", "attributes", "started", "ended", "error", "children")
+
+    def __init__(self, name: str, **attributes: Any):
+        """
+        Start span.
+
+        Args:
+            name: Operation name
+            **attributes: Extra details shown in dumps
+        """
+        self.name = name
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.ended: Optional[float] = None
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds (so far, if the span is still open)."""
+        return (self.ended or time.perf_counter()) - self.started
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """
+        End span.
+
+        Args:
+            error: Exception that ended the operation, if any
+        """
+        self.ended = time.perf_counter()
+        if error is not None:
+            self.error = type(error).__name__
+
+    def as_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Convert span tree to plain data.
+
+        Args:
+            origin: Start of the root span (defaults to this span)
+
+        Returns:
+            Span with offsets and durations in milliseconds
+        """
+        origin = self.started if origin is None else origin
+        return {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1),
+            "error": self.error,
+            "attributes": self.attributes,
+            "children": [child.as_dict(origin) for child in self.children],
+        }
+
+    def format(self, depth: int = 0) -> str:
+        """Render span tree as indented lines."""
+        line = f"{'  ' * depth}{self.name} {self.duration * 1000:.0f} ms"
+        if self.error:
+            line += f" ({self.error})"
+        return "\n".join([line] + [child.format(depth + 1) for child in self.children])
+
+
+class _SpanScope:
+    """Context manager running a child span of the current span."""
+
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, parent: Span, name: str, attributes: Dict[str, Any]):
+        self._span = Span(name, **attributes)
+        parent.children.append(self._span)
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        self._span.finish(exc)
+        _current_span.reset(self._token)
+        return False
+
+
+class _NoopScope:
+    """Context manager returned outside of a trace."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+def span(name: str, **attributes: Any):
+    """
+    Record an operation as a child of the current span.
+
+    Outside of a traced update this returns a shared no-op context manager.
+
+    Args:
+        name: Operation name
+        **attributes: Extra details shown in dumps
+
+    Returns:
+        Context manager yielding the span (or None)
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(parent, name, attributes)
+
+
+def start_trace(cid: str, name: str, **attributes: Any) -> tuple:
+    """
+    Make a new root span and correlation ID current.
+
+    Args:
+        cid: Correlation ID
+        name: Root operation name
+        **attributes: Extra details shown in dumps
+
+    Returns:
+        Root span and a token for ``end_trace``
+    """
+    root = Span(name, **attributes)
+    return root, (correlation_id.set(cid), _current_span.set(root))
+
+
+def end_trace(tokens: tuple) -> None:
+    """
+    Restore the context from before ``start_trace``.
+
+    Args:
+        tokens: Token returned by ``start_trace``
+    """
+    cid_token, span_token = tokens
+    _current_span.reset(span_token)
+    correlation_id.reset(cid_token)
+
+
+def task_stack(task: asyncio.Task) -> str:
+    """
+    Describe where a task is suspended.
+
+    Follows the chain of awaited coroutines from the task's entry point.
+
+    Args:
+        task: Running task
+
+    Returns:
+        Frames from outermost to innermost joined with ``;``
+    """
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (
+            getattr(awaitable, "cr_frame", None)
+            or getattr(awaitable, "ag_frame", None)
+            or getattr(awaitable, "gi_frame", None)
+        )
+        if frame is None:
+            frames.append(type(awaitable).__name__)
+            break
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "ag_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+        )
+    return ";".join(frames)
+
+
+class _Watch:
+    """Sampling state of one update."""
+
+    __slots__ = ("task", "samples", "handle", "due", "max_lag")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.samples: Counter = Counter()
+        self.handle: Optional[asyncio.TimerHandle] = None
+        self.due = 0.0
+        self.max_lag = 0.0
+
+
+class SlowUpdateProfiler:
+    """
+    Sample await stacks of updates that run longer than a threshold.
+
+    Nothing is sampled while an update is fast: a timer fires once the
+    threshold is reached and only then records where the update's task is
+    suspended every ``interval`` seconds. How late each sample fires is
+    kept as well, so a blocked event loop shows up in the dump. Dumps are
+    JSON files with the span tree and folded stacks (``frame;frame count``)
+    that flame graph tools accept.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        dump_dir: Path,
+        interval: float = 0.05,
+        max_samples: int = 5000
+    ):
+        """
+        Initialize profiler.
+
+        Args:
+            threshold: Update duration in seconds after which sampling starts
+            dump_dir: Directory for profile dumps
+            interval: Delay between samples in seconds
+            max_samples: Maximum samples per update
+        """
+        self.threshold = threshold
+        self.dump_dir = dump_dir
+        self.interval = interval
+        self.max_samples = max_samples
+
+    def watch(self, task: asyncio.Task) -> _Watch:
+        """
+        Start watching an update's task.
+
+        Args:
+            task: Task handling the update
+
+        Returns:
+            Handle for ``stop``
+        """
+        loop = asyncio.get_running_loop()
+        watch = _Watch(task)
+        watch.due = loop.time() + self.threshold
+        watch.handle = loop.call_at(watch.due, self._sample, watch)
+        return watch
+
+    def stop(self, watch: _Watch) -> Counter:
+        """
+        Stop sampling.
+
+        Args:
+            watch: Handle returned by ``watch``
+
+        Returns:
+            Number of samples per folded stack (empty for fast updates)
+        """
+        if watch.handle is not None:
+            watch.handle.cancel()
+            watch.handle = None
+        return watch.samples
+
+    def dump(self, cid: str, trace: Span, watch: _Watch) -> Path:
+        """
+        Write profile of a slow update (blocking, run in a thread).
+
+        Args:
+            cid: Correlation ID
+            trace: Root span of the update
+            watch: Stopped watch handle
+
+        Returns:
+            Path of the dump
+        """
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        path = self.dump_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{cid}.json"
+        data = {
+            "correlation_id": cid,
+            "duration_ms": round(trace.duration * 1000, 1),
+            "interval_ms": self.interval * 1000,
+            "max_loop_lag_ms": round(watch.max_lag * 1000, 1),
+            "trace": trace.as_dict(),
+            "stacks": [
+                f"{stack} {count}" for stack, count in watch.samples.most_common()
+            ],
+        }
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def _sample(self, watch: _Watch) -> None:
+        """Record the task's await stack and schedule the next sample."""
+        if watch.task.done():
+            watch.handle = None
+            return
+
+        loop = asyncio.get_running_loop()
+        watch.max_lag = max(watch.max_lag, loop.time() - watch.due)
+        watch.samples[task_stack(watch.task)] += 1
+
+        if sum(watch.samples.values()) >= self.max_samples:
+            watch.handle = None
+            return
+        watch.due = loop.time() + self.interval
+        watch.handle = loop.call_at(watch.due, self._sample, watch)
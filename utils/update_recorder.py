@@ -0,0 +1,211 @@
+"""Anonymized recording of incoming message streams for load replay."""
+import asyncio
+import gzip
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from aiogram.types import Message
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def describe_message(message: Message, verbatim: Set[str] = frozenset()) -> Dict[str, Any]:
+    """
+    Describe the shape of a message without its content.
+
+    Text is reduced to its length and kind: a command (kept by name), a
+    search query (ends with "?") or plain text. Photos keep the size of the
+    largest version and the caption length.
+
+    Args:
+        message: Incoming message
+        verbatim: Texts that are safe to keep as is (keyboard buttons)
+
+    Returns:
+        Record with short keys: ``k`` kind, ``n`` text length, ``cmd``
+        command, ``w``/``h``/``s`` photo resolution and bytes, ``c``
+        caption length
+    """
+    if message.photo:
+        photo = message.photo[-1]
+        return {
+            "k": "photo",
+            "w": photo.width,
+            "h": photo.height,
+            "s": photo.file_size or 0,
+            "c": len(message.caption or ""),
+        }
+
+    text = message.text
+    if text is None:
+        return {"k": "other"}
+    if text.startswith("/"):
+        return {"k": "command", "cmd": text.split()[0].split("@")[0][:32]}
+    if text in verbatim:
+        return {"k": "command", "cmd": text}
+    if text.strip().endswith("?"):
+        return {"k": "search", "n": len(text)}
+    return {"k": "text", "n": len(text)}
+
+
+class UpdateRecorder:
+    """
+    Write anonymized message records to a gzipped JSON lines file.
+
+    The first line is a header with the wall clock start time; every record
+    has ``t``, its offset from the start in seconds, and ``u``, the sender
+    numbered in order of first appearance. No IDs or message content are
+    stored. Records are buffered and written by a worker thread once
+    ``batch_size`` of them are waiting or every ``flush_interval`` seconds.
+
+    Only the ``max_users`` most recently seen senders keep their number; a
+    sender seen again after being forgotten gets a new one.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        verbatim: Iterable[str] = (),
+        batch_size: int = 256,
+        flush_interval: float = 5.0,
+        max_users: int = 100_000
+    ):
+        """
+        Initialize recorder.
+
+        Args:
+            path: Output file (overwritten)
+            verbatim: Texts that are safe to keep as is (keyboard buttons)
+            batch_size: Records buffered before a write
+            flush_interval: Maximum time records stay buffered in seconds
+            max_users: Senders whose numbers are remembered
+        """
+        self.path = path
+        self.verbatim = set(verbatim)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        self.recorded = 0
+
+        self._started = time.monotonic()
+        self._users: "OrderedDict[int, int]" = OrderedDict()
+        self._next_user = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        self._flushing: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._file.write(json.dumps({"v": FORMAT_VERSION, "started": time.time()}) + "\n")
+
+    def record(self, message: Message) -> None:
+        """
+        Record a message received now.
+
+        Args:
+            message: Incoming message
+        """
+        user_id = message.from_user.id if message.from_user else message.chat.id
+        user = self._user_number(user_id)
+
+        item = describe_message(message, self.verbatim)
+        item["t"] = round(time.monotonic() - self._started, 3)
+        item["u"] = user
+        self._buffer.append(item)
+        self.recorded += 1
+
+        loop = asyncio.get_running_loop()
+        if self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_loop())
+        if len(self._buffer) >= self.batch_size and (
+            self._flushing is None or self._flushing.done()
+        ):
+            self._flushing = loop.create_task(self.flush())
+
+    def _user_number(self, user_id: int) -> int:
+        """Get the number of a sender, forgetting the least recently seen."""
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+            return user
+
+        user = self._users[user_id] = self._next_user
+        self._next_user += 1
+        if len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return user
+
+    async def _flush_loop(self) -> None:
+        """Periodically write buffered records."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # A write in progress holds the lock until it is done, even on close
+            await asyncio.shield(self.flush())
+
+    async def flush(self) -> None:
+        """Write buffered records."""
+        async with self._lock:
+            batch, self._buffer = self._buffer, []
+            if batch:
+                await asyncio.to_thread(self._write, batch)
+
+    async def close(self) -> None:
+        """Write remaining records and close the file."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        await self.flush()
+        await asyncio.to_thread(self._file.close)
+        logger.info(f"Recorded {self.recorded} messages to {self.path}")
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Append records to the file."""
+        self._file.write("".join(json.dumps(item, separators=(",", ":")) + "\n" for item in batch))
+        self._file.flush()
+
+
+def load_recordings(paths: Iterable[Path]) -> List[Dict[str, Any]]:
+    """
+    Load and merge recordings, for example one per worker process.
+
+    Args:
+        paths: Recording files
+
+    Returns:
+        Records ordered by time, with ``t`` relative to the earliest start
+        and ``u`` renumbered so senders of different files stay distinct
+    """
+    files = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("v") != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported recording version {header.get('v')}")
+            files.append((header["started"], [json.loads(line) for line in f if line.strip()]))
+
+    if not files:
+        return []
+
+    origin = min(started for started, _ in files)
+    merged = []
+    users: Dict[tuple, int] = {}
+    for index, (started, items) in enumerate(files):
+        for item in items:
+            item["t"] += started - origin
+            item["u"] = users.setdefault((index, item["u"]), len(users))
+            merged.append(item)
+    merged.sort(key=lambda item: item["t"])
+    return merged
@@ -0,0 +1,117 @@
+"""Worker pool for CPU-bound work such as image processing and HTML extraction."""
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from utils.logging_setup import worker_logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerQueueFull(Exception):
+    """Raised when a worker pool cannot accept more work."""
+
+
+class WorkerPool:
+    """
+    Run CPU-bound functions off the event loop.
+    
+    ``kind`` selects a process pool (default, sidesteps the GIL), a thread
+    pool, or inline execution on the event loop. At most
+    ``max_workers + max_queue`` jobs are admitted; callers wait up to
+    ``queue_timeout`` seconds for a slot and get ``WorkerQueueFull`` after.
+    """
+    
+    KINDS = ("process", "thread", "inline")
+    
+    def __init__(
+        self,
+        kind: str = "process",
+        max_workers: int = 2,
+        max_queue: int = 16,
+        queue_timeout: float = 10.0,
+        name: str = "worker"
+    ):
+        """
+        Initialize worker pool.
+        
+        Args:
+            kind: Pool kind (process, thread or inline)
+            max_workers: Number of workers
+            max_queue: Number of jobs allowed to wait for a worker
+            queue_timeout: Maximum time to wait for a free slot in seconds
+            name: Name of the work, used for threads and errors
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown {name} pool kind: {kind}")
+        
+        self.kind = kind
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        
+        self._executor: Optional[Executor] = None
+        if kind == "process":
+            # Workers log through the parent's listener, not the inherited queue
+            initializer, initargs = worker_logging()
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=initializer,
+                initargs=initargs
+            )
+        elif kind == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix=name
+            )
+        
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._pending = 0
+        self.stats = {"submitted": 0, "rejected": 0}
+    
+    @property
+    def pending(self) -> int:
+        """Number of jobs queued or running."""
+        return self._pending
+    
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a function in the pool.
+        
+        Args:
+            fn: Picklable module-level function
+            *args: Picklable function arguments
+            
+        Returns:
+            Function result
+            
+        Raises:
+            WorkerQueueFull: If no slot became free in time
+        """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise WorkerQueueFull(
+                f"{self.name.capitalize()} queue is full ({self._pending} pending)"
+            ) from None
+        
+        self._pending += 1
+        self.stats["submitted"] += 1
+        try:
+            if self._executor is None:
+                return fn(*args)
+            
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+            self._slots.release()
+    
+    def close(self) -> None:
+        """Stop workers."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)